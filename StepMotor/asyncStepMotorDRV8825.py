@@ -0,0 +1,111 @@
+""" asyncio interface of the DRV8825 step motor driver
+
+Description:
+    This module implements a class to control a stepMotorDriver8825 from an asyncio
+    event loop. The coroutines resolve when the motion is really completed, many
+    motors can be supervised from one loop without a thread per motor waiting
+    for the movements:
+
+        motor = asyncStepMotorDriver8825(stepMotorDriver8825(useWaves = True))
+        await motor.find_reference()
+        await motor.move_to(180)
+        async for position in motor.positions():
+            ...
+
+    The ramps run in the control thread of the driver, the loop is never blocked
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import asyncio
+
+
+class asyncStepMotorDriver8825:
+    """ asyncio front end of a stepMotorDriver8825 """
+
+    #
+    # default seconds between position updates of positions()
+    DEFAULT_POSITION_PERIOD = 0.05
+
+    def __init__(self, motorControl, loop = None):
+        self.motorControl = motorControl
+        self.loop = loop
+        #
+        # futures of the coroutines waiting for the motor to stop
+        self.waiters = []
+        self.motorControl.movementEndCallbacks.append(self.movementEnd)
+
+    def getLoop(self):
+        if (self.loop == None):
+            self.loop = asyncio.get_running_loop()
+        return self.loop
+
+    def movementEnd(self, motorControl):
+        """ called by the driver thread when the motor stops """
+        try:
+            self.getLoop().call_soon_threadsafe(self.wakeWaiters)
+        except RuntimeError:
+            #
+            # the loop is closed, nobody waits
+            pass
+
+    def wakeWaiters(self):
+        """ resolves the waiters if the motor is stopped """
+        if (self.motorControl.idleEvent.is_set()):
+            waiters = self.waiters
+            self.waiters = []
+            for waiter in waiters:
+                if (not waiter.done()):
+                    waiter.set_result(self.motorControl.getCurrPlatePosition())
+
+    async def wait_movement_end(self):
+        """ waits until the motor stops, returns the position """
+        waiter = self.getLoop().create_future()
+        self.waiters.append(waiter)
+        #
+        # the motor could be already stopped
+        self.wakeWaiters()
+        return await waiter
+
+    async def move_to(self, position):
+        """ moves to position, returns the position reached or None if the movement is not possible """
+        accepted = await asyncio.wrap_future(self.motorControl.moveTo(position), loop = self.getLoop())
+        if (not accepted):
+            return None
+        return await self.wait_movement_end()
+
+    async def find_reference(self):
+        """ moves until the reference is found, returns False if the motor is in movement """
+        if (not await asyncio.wrap_future(self.motorControl.lookForReference(), loop = self.getLoop())):
+            return False
+        await self.wait_movement_end()
+        return True
+
+    async def start(self):
+        """ starts moving the motor, resolves when the ramp up is completed """
+        await asyncio.wrap_future(self.motorControl.startMovement(), loop = self.getLoop())
+
+    async def stop(self):
+        """ stops the motor, resolves when it is stopped """
+        await asyncio.wrap_future(self.motorControl.stopMovement(), loop = self.getLoop())
+        return await self.wait_movement_end()
+
+    async def set_speed(self, rpm):
+        """ changes the speed, resolves when the motor runs at the new one """
+        await asyncio.wrap_future(self.motorControl.changeSpeed(rpm), loop = self.getLoop())
+
+    async def positions(self, period = DEFAULT_POSITION_PERIOD):
+        """ async iterator of the position of the motor, a value is produced each time it changes """
+        lastPosition = None
+        while True:
+            position = self.motorControl.getCurrPlatePosition()
+            if (position != lastPosition):
+                lastPosition = position
+                yield position
+            await asyncio.sleep(period)
+
+    def close(self):
+        """ stops receiving the movement end of the driver """
+        if (self.movementEnd in self.motorControl.movementEndCallbacks):
+            self.motorControl.movementEndCallbacks.remove(self.movementEnd)
@@ -0,0 +1,23 @@
+""" Benchmarks of the step motor control classes
+
+Description:
+    The benchmarks run on a plain Linux box, the fake pigpio module of the
+    fakes folder is used instead of the real one.
+    Run them from the StepMotor folder, i.e: python -m benchmarks.benchRunLoop
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import os
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKES_DIR = os.path.join(BENCHMARKS_DIR, "fakes")
+STEP_MOTOR_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+#
+# fakes go first so they hide any real pigpio installation
+for path in (STEP_MOTOR_DIR, FAKES_DIR):
+    if (path not in sys.path):
+        sys.path.insert(0, path)
@@ -0,0 +1,104 @@
+""" Benchmark of the 28BYJ-48 driver on the simulated PI
+
+Description:
+    Moves a stepMotorDriver28BYJ48 on the simulated hardware (a unipolar motor
+    that follows the phase of its coils) and measures for each step mode and speed:
+       * the seconds of a revolution forward and back and the cruise step rate
+       * the difference between the position counted by the driver and the one
+         of the motor, and the steps lost by the motor (phases skipped)
+
+    It also measures the previous script loop (a write per coil and
+    time.sleep(WaitTime)) in real time, its step rate and period jitter depend
+    on the scheduler of the OS
+
+    usage: python -m benchmarks.bench28BYJ48
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import io
+import os
+import time
+
+#
+# the simulator is selected before the control modules are imported
+os.environ["STEP_MOTOR_BACKEND"] = "simulator"
+
+import benchmarks  # puts the StepMotor folder on the path
+from hardwareBackend import pigpio, clock, hardware
+from stepMotor28BYJ48 import stepMotorDriver28BYJ48, HALF_STEP_SEQUENCE
+
+#
+# speeds measured in RPM
+SPEEDS = [5, 10, 15, 20]
+
+#
+# revolutions forward and back of each measurement
+REVOLUTIONS = 2
+
+#
+# wait time of the previous loop and seconds it is measured
+LOOP_WAIT = 0.001
+LOOP_SECONDS = 1.0
+
+
+def revolutions(driver, motor, microstepCfg, rpm):
+    """ seconds of each revolution, counted minus motor position and lost steps """
+    driver.setMicrostepCfg(microstepCfg)
+    clock.result(driver.changeSpeed(rpm))
+    offset = motor.positionHalfSteps - driver.positionMicrosteps
+    lost = motor.lostSteps
+    start = clock.time()
+    for revolution in range(REVOLUTIONS):
+        for target in (driver.currPlatePosition + 360, driver.currPlatePosition):
+            clock.result(driver.moveTo(target))
+            driver.waitMovementEnd()
+    seconds = (clock.time() - start) / (2 * REVOLUTIONS)
+    return seconds, motor.positionHalfSteps - offset - driver.positionMicrosteps, motor.lostSteps - lost
+
+
+def previousLoop():
+    """ steps/s and p99 of the period error in ms of the loop of the previous script """
+    gpioControl = pigpio.pi()
+    coilPins = stepMotorDriver28BYJ48.COIL_PINS
+    fullStep = HALF_STEP_SEQUENCE[0::2]
+    periods = []
+    step = 0
+    last = time.perf_counter()
+    end = last + LOOP_SECONDS
+    while (last < end):
+        for pin, level in zip(coilPins, fullStep[step % len(fullStep)]):
+            gpioControl.write(pin, level)
+        step = step + 1
+        time.sleep(LOOP_WAIT)
+        now = time.perf_counter()
+        periods.append(now - last)
+        last = now
+    errors = sorted([abs(period - LOOP_WAIT) * 1000 for period in periods])
+    return len(periods) / LOOP_SECONDS, errors[int(0.99 * (len(errors) - 1))]
+
+
+def main():
+    with contextlib.redirect_stdout(io.StringIO()):
+        with clock.participant():
+            motor = hardware.addUnipolarMotor()
+            driver = stepMotorDriver28BYJ48()
+            results = []
+            for microstepCfg, name in ((driver.MICROSTEP_RELATION_1, "full step"), (driver.MICROSTEP_RELATION_2, "half step")):
+                for rpm in SPEEDS:
+                    measured = revolutions(driver, motor, microstepCfg, rpm)
+                    results.append((name, rpm, driver.stepMotorFreq) + measured)
+            driver.terminate()
+            driver.join()
+    for name, rpm, freq, seconds, error, lost in results:
+        print("%s %4d RPM  %6.0f steps/s   revolution: %6.3f s   counted - motor: %d half steps   lost: %d" %
+              (name, rpm, freq, seconds, error, lost))
+
+    rate, jitter = previousLoop()
+    print("previous loop  write per coil + sleep(%g): %6.0f steps/s   period error p99: %.3f ms" % (LOOP_WAIT, rate, jitter))
+
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,92 @@
+""" Benchmark of the asyncio interface with many stations
+
+Description:
+    Drives several motors (each one with its own simulated pigpio) from one asyncio
+    event loop: each station looks for the reference and does a sweep of movements.
+    Shows the total time, the positions reached and the maximum delay of the event
+    loop, it must stay low while the motors ramp
+
+    usage: python -m benchmarks.benchAsyncStations [stations]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import asyncio
+import contextlib
+import io
+import sys
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+from stepMotorDRV8825 import stepMotorDriver8825
+from asyncStepMotorDRV8825 import asyncStepMotorDriver8825
+
+#
+# positions of the sweep of each station
+SWEEP = [45, 135, 0, 180, 90]
+
+
+async def station(motor):
+    """ looks for the reference and does the sweep, returns the positions reached """
+    driver = motor.motorControl
+    search = asyncio.ensure_future(motor.find_reference())
+    #
+    # the reference is found 50 ms after the search starts
+    while (not driver.lookingForReference):
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+    driver.gpioControl.fireEdge(driver.referencePIN)
+    await search
+    reached = []
+    for position in SWEEP:
+        reached.append(await motor.move_to(position))
+    return reached
+
+
+async def loopLag(stopEvent, period = 0.005):
+    """ maximum delay of the loop waking up a task, in ms """
+    maximum = 0
+    while (not stopEvent.is_set()):
+        start = time.perf_counter()
+        await asyncio.sleep(period)
+        maximum = max(maximum, time.perf_counter() - start - period)
+    return maximum * 1000
+
+
+async def run(stations):
+    motors = []
+    for index in range(stations):
+        driver = stepMotorDriver8825(useWaves = True, gpioControl = pigpio.pi())
+        driver.stepMotorFreq = 6400
+        motors.append(asyncStepMotorDriver8825(driver))
+
+    stopEvent = asyncio.Event()
+    lagTask = asyncio.ensure_future(loopLag(stopEvent))
+    start = time.perf_counter()
+    results = await asyncio.gather(*[station(motor) for motor in motors])
+    elapsed = time.perf_counter() - start
+    stopEvent.set()
+    lag = await lagTask
+
+    for motor in motors:
+        motor.close()
+        motor.motorControl.terminate()
+    return elapsed, lag, results
+
+
+def main():
+    stations = 8
+    if (len(sys.argv) > 1):
+        stations = int(sys.argv[1])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        elapsed, lag, results = asyncio.run(run(stations))
+
+    exact = all([reached == SWEEP for reached in results])
+    print("stations: %d   total: %6.3f s   max loop lag: %6.2f ms   positions exact: %s" % (stations, elapsed, lag, exact))
+
+
+if (__name__ == "__main__"):
+    main()
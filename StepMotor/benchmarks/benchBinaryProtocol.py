@@ -0,0 +1,138 @@
+""" Benchmark of the binary protocol against the telnet menu
+
+Description:
+    Queries the status of the plate server (motorControlTerminalServer, motor on
+    the fake pigpio) with the telnet menu ("?" answered with the menu and its status
+    line) and with the STATUS operation of the binary protocol, and measures:
+       * bytes sent and received per query
+       * queries per second (waiting for each answer)
+       * us for the client to parse the answer (the status line of the menu with a
+         regular expression, the binary values with struct)
+
+    It also checks the out of order answers (the STATUS sent after a MOVE_TO is
+    answered before the MOVE_TO completes) and the error codes (SET_MICROSTEP sent
+    after a MOVE_TO is BUSY)
+
+    usage: python -m benchmarks.benchBinaryProtocol [queries]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import io
+import re
+import socket
+import struct
+import sys
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+from stepMotorDRV8825 import stepMotorDriver8825, motorControlTerminalServer
+from binaryTerminal import binaryClient, STATUS_FORMAT, KIND_REPLY, KIND_COMPLETE, CODE_UNKNOWN_OPERATION, CODE_BAD_ARGUMENT
+from binaryTerminal import CODE_BUSY, OP_STATUS, OP_MOVE_TO, OP_SET_MICROSTEP
+
+PROMPT = b"[Enter]:"
+STATUS_LINE = re.compile(r"Pos: *([-\d.]+) --- Microstep : *(\d+) +--- Speed \(RPM\): *([-\d.]+)")
+
+
+def telnetQueries(port, queries):
+    """ bytes sent and received per query, queries/s and us to parse the status line """
+    client = socket.create_connection(("127.0.0.1", port))
+    received = b""
+    while (PROMPT not in received):
+        received = received + client.recv(65536)
+    answers = []
+    begin = time.perf_counter()
+    for query in range(queries):
+        client.sendall(b"?\r\n")
+        received = b""
+        while (PROMPT not in received):
+            received = received + client.recv(65536)
+        answers.append(received)
+    elapsed = time.perf_counter() - begin
+    client.close()
+    parseBegin = time.perf_counter()
+    for answer in answers:
+        STATUS_LINE.search(answer.decode()).groups()
+    parse = (time.perf_counter() - parseBegin) / queries * 1000000
+    return 3, len(answers[-1]), queries / elapsed, parse
+
+
+def binaryQueries(port, queries):
+    """ bytes sent and received per query, queries/s and us to parse the values """
+    client = binaryClient("127.0.0.1", port)
+    answers = []
+    begin = time.perf_counter()
+    for query in range(queries):
+        requestId = client.request(OP_STATUS)
+        answers.append(client.readAnswer())
+    elapsed = time.perf_counter() - begin
+    client.close()
+    parseBegin = time.perf_counter()
+    for kind, requestId, code, values in answers:
+        struct.unpack(STATUS_FORMAT, values)
+    parse = (time.perf_counter() - parseBegin) / queries * 1000000
+    return 5, 6 + struct.calcsize(STATUS_FORMAT), queries / elapsed, parse
+
+
+def outOfOrder(port):
+    """ answers of a MOVE_TO followed by a STATUS, in the order they arrive """
+    client = binaryClient("127.0.0.1", port)
+    moveId = client.request(OP_MOVE_TO, "!f", 180)
+    statusId = client.request(OP_STATUS)
+    answers = []
+    while (len(answers) < 3):
+        kind, requestId, code, values = client.readAnswer()
+        name = {moveId: "MOVE_TO", statusId: "STATUS"}[requestId]
+        answers.append("%s %s" % (name, {KIND_REPLY: "reply", KIND_COMPLETE: "complete"}[kind]))
+    client.request(OP_MOVE_TO, "!f", 400)
+    client.request(0x7F)
+    codes = [client.readAnswer()[2], client.readAnswer()[2]]
+    #
+    # the microstep is not changed by the movement sent just before it
+    client.request(OP_MOVE_TO, "!f", 90)
+    microstepId = client.request(OP_SET_MICROSTEP, "!B", 0)
+    answer = client.readAnswer()
+    while (answer[0] != KIND_COMPLETE or answer[1] != microstepId):
+        answer = client.readAnswer()
+    codes.append(answer[2])
+    client.close()
+    return answers, codes == [CODE_BAD_ARGUMENT, CODE_UNKNOWN_OPERATION, CODE_BUSY]
+
+
+def main():
+    queries = 2000
+    if (len(sys.argv) > 1):
+        queries = int(sys.argv[1])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        driver = stepMotorDriver8825(useWaves = True, gpioControl = pigpio.pi())
+        driver.stepMotorFreq = 3200
+        #
+        # any free ports
+        motorControlTerminalServer.TCP_PORT = 0
+        motorControlTerminalServer.BINARY_PORT = 0
+        server = motorControlTerminalServer(driver)
+        telnetPort = server.s.getsockname()[1]
+        binaryPort = server.binary.getsockname()[1]
+
+        results = [("telnet menu", ) + telnetQueries(telnetPort, queries),
+                   ("binary STATUS", ) + binaryQueries(binaryPort, queries)]
+        answers, codes = outOfOrder(binaryPort)
+
+        server.terminate()
+        driver.terminate()
+        driver.join()
+
+    for name, sent, received, rate, parse in results:
+        print("%-14s sent %4d bytes   received %5d bytes   %7.0f queries/s   parse %6.2f us" % (name, sent, received, rate, parse))
+    print("answers of MOVE_TO + STATUS: " + ", ".join(answers))
+    print("error codes: " + ("OK" if codes else "WRONG"))
+    if (not codes or answers.index("STATUS reply") > answers.index("MOVE_TO complete")):
+        sys.exit(1)
+
+
+if (__name__ == "__main__"):
+    main()
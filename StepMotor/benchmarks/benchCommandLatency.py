@@ -0,0 +1,58 @@
+""" Benchmark of the latency of the motor commands
+
+Description:
+    Measures, with the ramp of availableFreq, the time the caller (TCP connection or
+    GUI thread) is blocked by startMovement, changeSpeed, switchDirection and
+    stopMovement, and the time until the Future of the command is done
+
+    usage: python -m benchmarks.benchCommandLatency [repetitions]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import io
+import sys
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+from stepMotorDRV8825 import stepMotorDriver8825
+
+
+def measure(command):
+    """ ms the caller is blocked and ms until the command is done """
+    start = time.perf_counter()
+    future = command()
+    returned = time.perf_counter()
+    future.result()
+    done = time.perf_counter()
+    return (returned - start) * 1000, (done - start) * 1000
+
+
+def main():
+    repetitions = 10
+    if (len(sys.argv) > 1):
+        repetitions = int(sys.argv[1])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        driver = stepMotorDriver8825(gpioControl = pigpio.pi())
+        driver.changeSpeed(30).result()
+        results = {"startMovement": [], "changeSpeed": [], "switchDirection": [], "stopMovement": []}
+        for repetition in range(repetitions):
+            results["startMovement"].append(measure(driver.startMovement))
+            results["changeSpeed"].append(measure(lambda: driver.changeSpeed(30 + repetition % 2)))
+            results["switchDirection"].append(measure(driver.switchDirection))
+            results["stopMovement"].append(measure(driver.stopMovement))
+        driver.terminate()
+        driver.join()
+
+    for name, times in results.items():
+        blocked = sorted([t[0] for t in times])
+        done = sorted([t[1] for t in times])
+        print("%-16s caller blocked (ms) median: %8.3f  max: %8.3f   done (ms) median: %8.1f" % (name, blocked[len(blocked) // 2], blocked[-1], done[len(done) // 2]))
+
+
+if (__name__ == "__main__"):
+    main()
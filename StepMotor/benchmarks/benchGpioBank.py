@@ -0,0 +1,109 @@
+""" Benchmark of the writes of groups of pins, one by one and as a gpioBank
+
+Description:
+    Counts the calls to pigpiod and the intermediate combinations of levels the
+    DRV8825 or the 28BYJ-48 coils see while a group of pins changes:
+       * the microstep pins, every change between the configurations of the driver
+       * the coils of the 28BYJ-48, the full step and half step sequences
+    The previous way writes each pin with gpioControl.write, gpioBank writes the
+    pins that change with clear_bank_1 / set_bank_1 (two calls, the intermediate
+    combinations are fewer but not removed)
+
+    usage: python -m benchmarks.benchGpioBank
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+from gpioBank import gpioBank
+from stepMotorDRV8825 import stepMotorDriver8825
+
+MICROSTEP_PINS = [14, 15, 18]
+COIL_PINS = [17, 22, 23, 24]
+
+FULL_STEP = [[1,1,0,0],[0,1,1,0],[0,0,1,1],[1,0,0,1]]
+HALF_STEP = [[1,0,0,1],[1,0,0,0],[1,1,0,0],[0,1,0,0],[0,1,1,0],[0,0,1,0],[0,0,1,1],[0,0,0,1]]
+
+#
+# turns of the coil sequences
+TURNS = 100
+
+
+class pinWriter:
+    """ the previous way, a gpioControl.write for each pin """
+
+    def __init__(self, gpioControl, pins):
+        self.gpioControl = gpioControl
+        self.pins = pins
+
+    def write(self, levels):
+        for pin, level in zip(self.pins, levels):
+            self.gpioControl.write(pin, level)
+
+
+class bankWriter:
+    """ gpioBank with the masks of each combination computed once """
+
+    def __init__(self, gpioControl, pins):
+        self.bank = gpioBank(gpioControl, pins)
+
+    def write(self, levels):
+        self.bank.apply(self.bank.masksOf(levels))
+
+
+def replay(calls, pins, levels):
+    """ applies the recorded writes to levels, returns the combinations of the pins after each one """
+    levels = dict(levels)
+    states = []
+    for call in calls:
+        name, args = call[1], call[2]
+        if (name == "write"):
+            levels[args[0]] = args[1]
+        elif (name == "set_bank_1" or name == "clear_bank_1"):
+            for pin in pins:
+                if (args[0] & (1 << pin)):
+                    levels[pin] = int(name == "set_bank_1")
+        else:
+            continue
+        states.append(tuple([levels[pin] for pin in pins]))
+    return states
+
+
+def measure(writerClass, pins, transitions):
+    """ calls to pigpiod and intermediate combinations per change of levels """
+    pi = pigpio.pi()
+    writer = writerClass(pi, pins)
+    writer.write(transitions[0][0])
+    calls = 0
+    intermediates = 0
+    for before, after in transitions:
+        writer.write(before)
+        pi.clearCalls()
+        writer.write(after)
+        states = replay(pi.calls, pins, dict(zip(pins, before)))
+        calls = calls + len(states)
+        intermediates = intermediates + len([state for state in states[:-1] if state != tuple(before) and state != tuple(after)])
+    return calls / float(len(transitions)), intermediates / float(len(transitions))
+
+
+def sequenceTransitions(sequence, turns):
+    steps = sequence * turns
+    return [(steps[i], steps[i + 1]) for i in range(len(steps) - 1)]
+
+
+def main():
+    configurations = [setup[0:3] for setup in stepMotorDriver8825.MICROSTEP_PINS_SETUP]
+    microsteps = [(a, b) for a in configurations for b in configurations if a != b]
+    for name, pins, transitions in (("microstep change", MICROSTEP_PINS, microsteps),
+                                    ("28BYJ full step ", COIL_PINS, sequenceTransitions(FULL_STEP, TURNS)),
+                                    ("28BYJ half step ", COIL_PINS, sequenceTransitions(HALF_STEP, TURNS))):
+        pinCalls, pinIntermediates = measure(pinWriter, pins, transitions)
+        bankCalls, bankIntermediates = measure(bankWriter, pins, transitions)
+        print("%s  calls per change: pin by pin %.2f  bank %.2f (%.1f x)   intermediate combinations: pin by pin %.2f  bank %.2f" %
+              (name, pinCalls, bankCalls, pinCalls / bankCalls, pinIntermediates, bankIntermediates))
+
+
+if (__name__ == "__main__"):
+    main()
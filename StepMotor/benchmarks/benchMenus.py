@@ -0,0 +1,126 @@
+""" Benchmark of the menus sent by the plate and helicopter terminals
+
+Description:
+    Sends a command without action ("?", answered with the menu) to the plate
+    (motorControlTerminalServer) and helicopter servers with the motor on the fake
+    pigpio, with the menu and in terse mode ("T", only the line of the current
+    parameters), and measures per command:
+       * bytes received by the client
+       * calls to send of the connection and send syscalls of the server
+       * us to render the answer (showMenu)
+       * commands per second (waiting for each answer)
+
+    usage: python -m benchmarks.benchMenus [commands]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import io
+import socket
+import sys
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+import terminalServer
+from stepMotorDRV8825 import stepMotorDriver8825, motorControlTerminalServer, motorControlTerminalConnection
+from helicopterWithDRV8825 import helicopterTerminalServer, helicopterTerminalConnection
+
+#
+# the line of the parameters is in the menu and in the terse answer
+PARAMS = b"Pos: "
+
+#
+# calls to send of the connections
+sendCalls = [0]
+
+
+def countingSend(send):
+    def countedSend(self, data):
+        sendCalls[0] = sendCalls[0] + 1
+        send(self, data)
+    return countedSend
+
+
+def countingFlush(server, syscalls):
+    """ counts the flushes of the server with data to send (one send syscall each) """
+    flush = server.flush
+    def countedFlush(connection):
+        if (len(connection.output) > 0):
+            syscalls[0] = syscalls[0] + 1
+        flush(connection)
+    server.flush = countedFlush
+
+
+def readAnswers(client, answers):
+    received = b""
+    while (received.count(PARAMS) < answers):
+        received = received + client.recv(65536)
+    return len(received)
+
+
+def renderTime(connectionClass, driver, terse, renders = 2000):
+    """ us of showMenu, on a connection without socket """
+    connection = connectionClass(None, None, driver)
+    connection.terse = terse
+    begin = time.perf_counter()
+    for render in range(renders):
+        connection.showMenu()
+        del connection.output[:]
+    return (time.perf_counter() - begin) / renders * 1000000
+
+
+def measure(server, client, commands, syscalls):
+    """ bytes, connection sends, syscalls and commands/s of each command """
+    sendCalls[0] = 0
+    syscalls[0] = 0
+    received = 0
+    begin = time.perf_counter()
+    for command in range(commands):
+        client.sendall(b"?\r\n")
+        received = received + readAnswers(client, 1)
+    rate = commands / (time.perf_counter() - begin)
+    return received / commands, sendCalls[0] / commands, syscalls[0] / commands, rate
+
+
+def main():
+    commands = 1000
+    if (len(sys.argv) > 1):
+        commands = int(sys.argv[1])
+
+    terminalServer.terminalConnection.send = countingSend(terminalServer.terminalConnection.send)
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        driver = stepMotorDriver8825(gpioControl = pigpio.pi())
+        for name, serverClass, connectionClass in [("plate", motorControlTerminalServer, motorControlTerminalConnection),
+                                                   ("helicopter", helicopterTerminalServer, helicopterTerminalConnection)]:
+            #
+            # any free ports
+            serverClass.TCP_PORT = 0
+            serverClass.BINARY_PORT = 0
+            server = serverClass(driver)
+            syscalls = [0]
+            countingFlush(server, syscalls)
+            client = socket.create_connection(("127.0.0.1", server.s.getsockname()[1]))
+            client.settimeout(5)
+            readAnswers(client, 1)
+
+            results.append((name, "menu") + measure(server, client, commands, syscalls) + (renderTime(connectionClass, driver, False), ))
+            client.sendall(b"T\r\n")
+            readAnswers(client, 1)
+            results.append((name, "terse") + measure(server, client, commands, syscalls) + (renderTime(connectionClass, driver, True), ))
+
+            client.close()
+            server.terminate()
+        driver.terminate()
+        driver.join()
+
+    for name, mode, received, sends, syscalls, rate, render in results:
+        print("%-10s %-5s  %6.0f bytes   sends %5.1f   syscalls %4.1f   render %6.2f us   %7.0f commands/s" %
+              (name, mode, received, sends, syscalls, render, rate))
+
+
+if (__name__ == "__main__"):
+    main()
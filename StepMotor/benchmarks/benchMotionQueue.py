@@ -0,0 +1,56 @@
+""" Benchmark of the movement queue of the driver
+
+Description:
+    Runs a sweep of positions with the waveform engine: one after the other with
+    a stop at each position (what a client polling moveTo does) and queued with
+    blending. The cycle time and the estimated completion time are shown
+
+    usage: python -m benchmarks.benchMotionQueue [frequency]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import io
+import sys
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+from stepMotorDRV8825 import stepMotorDriver8825
+
+#
+# positions of the sweep, back to the start at the end
+SWEEP = [100, 110, 120, 130, 140, 150, 160, 170, 180, 90]
+
+
+def sweepTime(driver, dwell):
+    """ returns the seconds of the sweep and the estimation made when it was queued """
+    start = time.perf_counter()
+    for position in SWEEP:
+        driver.queueMoveTo(position, dwell)
+    estimation = driver.getQueueEstimatedCompletion()
+    driver.planner.waitQueueEnd()
+    return time.perf_counter() - start, estimation
+
+
+def main():
+    freq = 4000
+    if (len(sys.argv) > 1):
+        freq = float(sys.argv[1])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        driver = stepMotorDriver8825(useWaves = True, gpioControl = pigpio.pi())
+        driver.stepMotorFreq = freq
+        #
+        # a minimum dwell stops the motor at each position
+        results = [("stop at each", sweepTime(driver, 0.0001)), ("blended", sweepTime(driver, 0))]
+        driver.terminate()
+
+    for name, (seconds, estimation) in results:
+        print("%-13s sweep: %7.3f s   estimated: %7.3f s" % (name, seconds, estimation))
+
+
+if (__name__ == "__main__"):
+    main()
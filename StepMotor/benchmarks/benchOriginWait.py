@@ -0,0 +1,124 @@
+""" Benchmark of the part sorting station waiting for the origin
+
+Description:
+    Sends accept commands ("A") to a partSortingTerminalServer with the motor on the
+    fake pigpio and simulates the origin sensor (the plate leaves it and comes back),
+    and measures:
+       * CPU of the process while the plate is waiting for the origin
+       * ms from the origin edge until the station stops the motor
+       * ms from the "E" command until the station stops the motor
+
+    usage: python -m benchmarks.benchOriginWait [cycles]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import io
+import socket
+import sys
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+from stepMotorDRV8825 import stepMotorDriver8825
+from partSorting import partSortingTerminalServer
+
+ANSWER = b"OK\r\n"
+
+#
+# seconds the CPU is measured while the plate waits for the origin
+WAIT_SECONDS = 1.0
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+def waitStop(stops, count):
+    while (len(stops) < count):
+        time.sleep(0.0001)
+    return stops[-1]
+
+
+def readAnswer(client):
+    received = b""
+    while (ANSWER not in received):
+        received = received + client.recv(4096)
+
+
+def main():
+    cycles = 50
+    if (len(sys.argv) > 1):
+        cycles = int(sys.argv[1])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        gpio = pigpio.pi()
+        driver = stepMotorDriver8825(gpioControl = gpio)
+        reference = driver.referencePIN
+        #
+        # time of each stop demanded to the motor
+        stops = []
+        stopMovement = driver.stopMovement
+        def timedStop():
+            stops.append(time.perf_counter())
+            return stopMovement()
+        driver.stopMovement = timedStop
+        #
+        # any free ports
+        partSortingTerminalServer.TCP_PORT = 0
+        partSortingTerminalServer.BINARY_PORT = 0
+        server = partSortingTerminalServer(driver, 1)
+        client = socket.create_connection(("127.0.0.1", server.s.getsockname()[1]))
+        client.settimeout(5)
+
+        #
+        # the plate stopped on the origin sensor
+        gpio.levels[reference] = 1
+        client.sendall(b"A\r\n")
+        time.sleep(0.05)
+        gpio.fireEdge(reference, 0)
+        cpuStart = time.process_time()
+        time.sleep(WAIT_SECONDS)
+        cpu = (time.process_time() - cpuStart) / WAIT_SECONDS * 100
+        gpio.fireEdge(reference, 1)
+        readAnswer(client)
+
+        origins = []
+        for cycle in range(cycles):
+            client.sendall(b"A\r\n")
+            time.sleep(0.01)
+            gpio.fireEdge(reference, 0)
+            time.sleep(0.01)
+            count = len(stops)
+            edge = time.perf_counter()
+            gpio.fireEdge(reference, 1)
+            origins.append((waitStop(stops, count + 1) - edge) * 1000)
+            readAnswer(client)
+
+        aborts = []
+        for cycle in range(cycles):
+            client.sendall(b"A\r\n")
+            time.sleep(0.01)
+            gpio.fireEdge(reference, 0)
+            count = len(stops)
+            begin = time.perf_counter()
+            client.sendall(b"E\r\n")
+            aborts.append((waitStop(stops, count + 1) - begin) * 1000)
+            readAnswer(client)
+            gpio.levels[reference] = 1
+
+        client.close()
+        server.terminate()
+        driver.terminate()
+        driver.join()
+
+    print("CPU waiting the origin %5.2f %%" % cpu)
+    print("origin edge -> stop   p50 %6.3f ms   p99 %6.3f ms" % (percentile(origins, 50), percentile(origins, 99)))
+    print("E command   -> stop   p50 %6.3f ms   p99 %6.3f ms" % (percentile(aborts, 50), percentile(aborts, 99)))
+
+
+if (__name__ == "__main__"):
+    main()
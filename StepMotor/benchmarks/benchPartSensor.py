@@ -0,0 +1,112 @@
+""" Benchmark of the part present sensor of the part sorting station
+
+Description:
+    Queries "?" to a partSortingTerminalServer with the motor on the fake pigpio
+    and a part on the sensor, and measures:
+       * ms of the round trip of "?" (the filtered state, without waiting the filter)
+       * ms from the last edge of a bouncing sensor until the pushed "Y" ("P")
+    and checks that the bounces and the glitches shorter than the filter are not
+    pushed, and that the state is unknown ("?") before the first filter window
+
+    usage: python -m benchmarks.benchPartSensor [queries]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import io
+import socket
+import sys
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+from stepMotorDRV8825 import stepMotorDriver8825
+from partSorting import partSortingTerminalServer
+
+PART_PIN = 12
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+def readLine(client):
+    received = b""
+    while (not received.endswith(b"\r\n")):
+        received = received + client.recv(4096)
+    return received
+
+
+def main():
+    queries = 1000
+    if (len(sys.argv) > 1):
+        queries = int(sys.argv[1])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        gpio = pigpio.pi()
+        driver = stepMotorDriver8825(gpioControl = gpio)
+        #
+        # any free ports
+        partSortingTerminalServer.TCP_PORT = 0
+        partSortingTerminalServer.BINARY_PORT = 0
+        server = partSortingTerminalServer(driver, 1)
+        partFilter = server.station.partFilter
+        client = socket.create_connection(("127.0.0.1", server.s.getsockname()[1]))
+        client.settimeout(5)
+        #
+        # the state is unknown until the first filter window has passed
+        client.sendall(b"?\r\n")
+        initial = readLine(client)
+        client.sendall(b"P\r\n")
+        readLine(client)
+
+        #
+        # the part arrives, the sensor bounces
+        for bounce in range(5):
+            gpio.fireEdge(PART_PIN, 1)
+            time.sleep(0.001)
+            gpio.fireEdge(PART_PIN, 0)
+            time.sleep(0.001)
+        lastEdge = time.perf_counter()
+        gpio.fireEdge(PART_PIN, 1)
+        pushed = readLine(client)
+        push = (time.perf_counter() - lastEdge) * 1000
+
+        roundTrips = []
+        answers = set()
+        for query in range(queries):
+            begin = time.perf_counter()
+            client.sendall(b"?\r\n")
+            answers.add(readLine(client))
+            roundTrips.append((time.perf_counter() - begin) * 1000)
+
+        #
+        # a glitch shorter than the filter, nothing is pushed
+        gpio.fireEdge(PART_PIN, 0)
+        time.sleep(partFilter / 4)
+        gpio.fireEdge(PART_PIN, 1)
+        client.settimeout(partFilter * 2)
+        try:
+            glitch = client.recv(4096)
+        except socket.timeout:
+            glitch = b""
+
+        client.close()
+        server.terminate()
+        driver.terminate()
+        driver.join()
+
+    print("? round trip   p50 %6.3f ms   p99 %6.3f ms   answers %s" %
+          (percentile(roundTrips, 50), percentile(roundTrips, 99), ", ".join([repr(answer) for answer in answers])))
+    print("? before the filter   %r" % (initial, ))
+    print("push after the bounces %6.1f ms (filter %.0f ms)   pushed %r" % (push, partFilter * 1000, pushed))
+    print("glitch pushed: %r" % glitch)
+    if (pushed != b"Y\r\n" or answers != set([b"Y\r\n"]) or glitch != b""):
+        sys.exit(1)
+
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,106 @@
+""" Benchmark of the commands sent at once to the part sorting server
+
+Description:
+    Sends the "D" command (answered with "OK<cr><lf>") to a partSortingTerminalServer
+    with the motor on the fake pigpio, and measures the commands per second:
+       * one by one, waiting for each answer (a round trip per command)
+       * pipelined, batches of commands in one send
+    and checks that every command is answered, also when the commands are cut
+    at any byte between the sends (the server keeps the partial line)
+
+    usage: python -m benchmarks.benchPipelining [commands]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import io
+import socket
+import sys
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+from stepMotorDRV8825 import stepMotorDriver8825
+from partSorting import partSortingTerminalServer
+
+COMMAND = b"D\r\n"
+ANSWER = b"OK\r\n"
+
+#
+# commands of each send of the pipelined measurements
+BATCHES = [10, 100]
+
+
+def readAnswers(client, answers):
+    """ reads until answers are received, returns the answers received """
+    received = b""
+    while (received.count(ANSWER) < answers):
+        data = client.recv(65536)
+        if (len(data) == 0):
+            break
+        received = received + data
+    return received.count(ANSWER)
+
+
+def oneByOne(client, commands):
+    answered = 0
+    begin = time.perf_counter()
+    for command in range(commands):
+        client.sendall(COMMAND)
+        answered = answered + readAnswers(client, 1)
+    return commands / (time.perf_counter() - begin), answered
+
+
+def pipelined(client, commands, batch):
+    answered = 0
+    begin = time.perf_counter()
+    for sent in range(0, commands, batch):
+        client.sendall(COMMAND * batch)
+        answered = answered + readAnswers(client, batch)
+    return commands / (time.perf_counter() - begin), answered
+
+
+def fragmented(client, commands):
+    """ sends the commands cut at every byte, returns the answers """
+    stream = COMMAND * commands
+    for index in range(len(stream)):
+        client.sendall(stream[index:index + 1])
+    return readAnswers(client, commands)
+
+
+def main():
+    commands = 1000
+    if (len(sys.argv) > 1):
+        commands = int(sys.argv[1])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        driver = stepMotorDriver8825(gpioControl = pigpio.pi())
+        #
+        # any free port
+        partSortingTerminalServer.TCP_PORT = 0
+        partSortingTerminalServer.BINARY_PORT = 0
+        server = partSortingTerminalServer(driver, 1)
+        client = socket.create_connection(("127.0.0.1", server.s.getsockname()[1]))
+        client.settimeout(5)
+
+        results = [("one by one", ) + oneByOne(client, commands)]
+        for batch in BATCHES:
+            results.append(("batches of %d" % batch, ) + pipelined(client, commands, batch))
+        cut = fragmented(client, 100)
+
+        client.close()
+        server.terminate()
+        driver.terminate()
+        driver.join()
+
+    for name, rate, answered in results:
+        print("%-15s %8.0f commands/s   answered %d of %d" % (name, rate, answered, commands))
+    print("cut at every byte   answered %d of %d" % (cut, 100))
+    if (cut != 100 or any([answered != commands for name, rate, answered in results])):
+        sys.exit(1)
+
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,102 @@
+""" Benchmark of the position counting of the step callback
+
+Description:
+    Compares the edge counter of stepDetection, the position is derived from it in
+    integer microsteps, against the previous accumulation of stepResolution degrees
+    in a float:
+       * cost of the callback per step edge
+       * drift after 10 million steps back and forth at 1/32 microstep, the
+         integer counter must return exactly to the start position
+
+    The program exits with an error if the integer counter drifts
+
+    usage: python -m benchmarks.benchPositionCounter [steps]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import io
+import sys
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+from stepMotorDRV8825 import stepMotorDriver8825
+
+#
+# steps in each direction before going back
+STROKE = 1000000
+
+
+class floatPositionDriver8825(stepMotorDriver8825):
+    """ driver with the previous position accumulated in degrees and the motion state in plain attributes """
+
+    platePosition = 0.0
+    pendingMovements = 0
+    moveToDemanded = False
+    updatePosition = False
+    moveDirection = stepMotorDriver8825.MOVE_FORWARD
+
+    def stepDetection(self,g,b,t):
+        self.pendingMovements = self.pendingMovements - 1
+        if (self.pendingMovements <= 0 and self.moveToDemanded):
+            self.motionEvent.set()
+        if (self.updatePosition):
+            if (self.moveDirection == self.MOVE_BACKWARD):
+                self.platePosition = self.platePosition - self.stepResolution
+            else:
+                self.platePosition = self.platePosition + self.stepResolution
+
+    def getPosition(self):
+        return self.platePosition
+
+
+class integerPositionDriver8825(stepMotorDriver8825):
+
+    def getPosition(self):
+        return self.currPlatePosition
+
+
+def backAndForth(driverClass, steps):
+    """ returns the ns per edge and the drift in degrees after steps back and forth """
+    with contextlib.redirect_stdout(io.StringIO()):
+        driver = driverClass(gpioControl = pigpio.pi())
+    driver.updatePosition = True
+    start = driver.getPosition()
+    stepDetection = driver.stepDetection
+    elapsed = 0
+    done = 0
+    while (done < steps):
+        stroke = min(STROKE, (steps - done) // 2)
+        for direction in (driver.MOVE_FORWARD, driver.MOVE_BACKWARD):
+            driver.moveDirection = direction
+            begin = time.perf_counter()
+            for step in range(stroke):
+                stepDetection(4, 1, 0)
+            elapsed = elapsed + time.perf_counter() - begin
+        done = done + 2 * stroke
+    drift = driver.getPosition() - start
+    driver.terminate()
+    driver.join()
+    return elapsed / done * 1000000000, drift
+
+
+def main():
+    steps = 10000000
+    if (len(sys.argv) > 1):
+        steps = int(sys.argv[1])
+
+    results = {}
+    for name, driverClass in (("float degrees", floatPositionDriver8825), ("integer microsteps", integerPositionDriver8825)):
+        results[name] = backAndForth(driverClass, steps)
+        print("%-19s per edge: %7.1f ns   drift after %d steps: %.3e degrees" % (name, results[name][0], steps, results[name][1]))
+
+    if (results["integer microsteps"][1] != 0):
+        print("the integer counter does not return to the start position")
+        sys.exit(1)
+
+
+if (__name__ == "__main__"):
+    main()
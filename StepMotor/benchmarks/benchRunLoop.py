@@ -0,0 +1,115 @@
+""" Benchmark of the stepMotorDriver8825 control thread
+
+Description:
+    Compares the event driven control loop against the previous loop that polled
+    the motor state every 100 us:
+       * CPU time used by the process while the motor is idle
+       * stop latency, time from the last step edge of a moveTo to the
+         step pulses being stopped
+
+    usage: python -m benchmarks.benchRunLoop [idle seconds] [stop repetitions]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import io
+import sys
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+from stepMotorDRV8825 import stepMotorDriver8825
+
+
+class pollingDriver8825(stepMotorDriver8825):
+    """ driver using the previous control loop, polling the state every 100 us """
+
+    def run(self):
+        while self.loop_active:
+            time.sleep(0.0001)
+            #
+            # the movements are started by the control thread
+            self.executeCommands()
+            if (self.inMovement):
+                if (self.lookingForReference):
+                    if (self.gpioControl.read(self.referencePIN) == 1):
+                        self.doStopMovement()
+                        self.currPlatePosition = self.DEFAULT_PLATE_POSITION
+                        self.lookingForReference = False
+                else:
+                    if (self.moveToDemanded):
+                        if (self.pendingMovements <= 0):
+                            self.doStopMovement()
+                            self.updatePosition = False
+                            self.moveToDemanded = False
+
+
+def createDriver(driverClass):
+    """ creates a driver with its own fake pigpio connection """
+    driverClass.gpioControl = pigpio.pi()
+    with contextlib.redirect_stdout(io.StringIO()):
+        driver = driverClass()
+    driver.rampUp = False
+    return driver
+
+
+def idleCpu(driverClass, seconds):
+    """ process CPU seconds used per wall second with an idle motor """
+    driver = createDriver(driverClass)
+    time.sleep(0.1)
+    cpuStart = time.process_time()
+    time.sleep(seconds)
+    cpuUsed = time.process_time() - cpuStart
+    driver.terminate()
+    driver.join()
+    return cpuUsed / seconds
+
+
+def stopLatency(driverClass, repetitions, steps = 50):
+    """ latencies in us from the last step edge to the step pulses stop """
+    driver = createDriver(driverClass)
+    pi = driver.gpioControl
+    latencies = []
+    stops = []
+    backendStop = driver.frequencyBackend.stop
+
+    def timedStop():
+        stops.append(time.perf_counter())
+        backendStop()
+    driver.frequencyBackend.stop = timedStop
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for repetition in range(repetitions):
+            target = driver.currPlatePosition + steps * driver.stepResolution
+            driver.moveTo(target).result(5)
+            for step in range(steps):
+                pi.fireEdge(driver.stepCountPin)
+            lastEdge = time.perf_counter()
+            while (driver.inMovement):
+                time.sleep(0.00001)
+            latencies.append((stops[-1] - lastEdge) * 1000000)
+    driver.terminate()
+    driver.join()
+    latencies.sort()
+    return latencies
+
+
+def main():
+    idleSeconds = 2.0
+    repetitions = 200
+    if (len(sys.argv) > 1):
+        idleSeconds = float(sys.argv[1])
+    if (len(sys.argv) > 2):
+        repetitions = int(sys.argv[2])
+
+    for name, driverClass in (("polling loop", pollingDriver8825), ("event loop", stepMotorDriver8825)):
+        cpu = idleCpu(driverClass, idleSeconds)
+        latencies = stopLatency(driverClass, repetitions)
+        print("%-14s idle CPU: %6.2f %%   stop latency (us) median: %8.1f  p99: %8.1f  max: %8.1f" % (
+            name, cpu * 100, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1], latencies[-1]))
+
+
+if (__name__ == "__main__"):
+    main()
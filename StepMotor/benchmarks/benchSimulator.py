@@ -0,0 +1,201 @@
+""" Soak benchmark of a part sorting station on the simulated PI
+
+Description:
+    Runs hours of operation of a part sorting station on the simulated hardware
+    (hardwareBackend with STEP_MOTOR_BACKEND=simulator): the motor with the origin
+    sensor at ORIGIN_ANGLE, the step pin wired to the step count pin and a part
+    present sensor. Each cycle does what partSorting does for the control PC:
+       * a part arrives (the sensor bounces), its presence is the state of the pin
+         filtered in the background (stable 0.2 s)
+       * the part is accepted or rejected, the plate turns until the origin
+       * the station waits the next part
+
+    Shows the virtual time simulated, the wall time it took, the steps, the step
+    losses flagged and the error of the stop positions. The same scenario is run
+    in a child process, the trace of both runs has to be the same
+
+    usage: python -m benchmarks.benchSimulator [--hours hours] [--waves]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import subprocess
+import sys
+import time
+
+#
+# the simulator is selected before the control modules are imported
+os.environ["STEP_MOTOR_BACKEND"] = "simulator"
+
+import benchmarks  # puts the StepMotor folder on the path
+from hardwareBackend import pigpio, clock, hardware
+from stepMotorDRV8825 import stepMotorDriver8825
+from partSorting import debounceTimer
+
+#
+# seconds of a sorting cycle
+CYCLE_TIME = 120
+
+#
+# angle of the origin sensor, its width in degrees
+ORIGIN_ANGLE = 90
+ORIGIN_WIDTH = 2.0
+
+#
+# pin of the part present sensor, the part arrives PART_DELAY seconds after the cycle starts
+PART_PIN = 12
+PART_DELAY = 5
+PART_TIME = 60
+PART_BOUNCES = 3
+PART_FILTER = 0.2
+
+#
+# speed of the plate (partSorting.cfg), 1/32 microsteps
+SPEED_RPM = 30
+
+#
+# seconds to find the origin, a turn takes 2 s
+ORIGIN_TIMEOUT = 10
+
+
+class sortingStation:
+    """ the station and the control PC of partSorting on the simulated hardware """
+
+    def __init__(self, useWaves):
+        self.motor = hardware.addStation(referenceAngles = [ORIGIN_ANGLE], referenceWidth = ORIGIN_WIDTH)
+        self.driver = stepMotorDriver8825(useWaves = useWaves, gpioControl = pigpio.pi(), detectStepLoss = True)
+        clock.result(self.driver.changeSpeed(SPEED_RPM))
+        self.losses = 0
+        self.driver.stepLossCallbacks.append(self.stepLoss)
+        self.origin = clock.Event()
+        self.waitingOrigin = False
+        self.overshootDirection = None
+        self.driver.gpioControl.callback(self.driver.referencePIN, pigpio.EITHER_EDGE, self.originEdge)
+        self.partPresent = None
+        self.partTimer = debounceTimer(PART_FILTER, self.partSettled)
+        self.partTimer.restart()
+        self.driver.gpioControl.callback(PART_PIN, pigpio.EITHER_EDGE, self.partEdge)
+        self.trace = hashlib.sha256()
+        self.maxStopError = 0
+        self.originsMissed = 0
+
+    def stepLoss(self, driver, reason, commanded, counted):
+        self.losses = self.losses + 1
+
+    def originEdge(self, gpio, level, tick):
+        #
+        # the origin is waited once the plate has left the sensor
+        if (level == 0):
+            self.waitingOrigin = True
+        elif (self.waitingOrigin):
+            self.origin.set()
+
+    def partEdge(self, gpio, level, tick):
+        """ the level of the part pin is taken once it is stable PART_FILTER seconds """
+        self.partTimer.restart()
+
+    def partSettled(self):
+        self.partPresent = (self.driver.gpioControl.read(PART_PIN) == 1)
+
+    def isPartPresent(self):
+        return self.partPresent
+
+    def turnToOrigin(self, direction):
+        """ turns the plate in direction until the origin sensor, as the A and R commands """
+        self.origin.clear()
+        #
+        # on the sensor, or just after it and turning back, the plate has to leave it first
+        onOrigin = (self.driver.gpioControl.read(self.driver.referencePIN) == 1)
+        self.waitingOrigin = not (onOrigin or self.overshootDirection not in (None, direction))
+        clock.result(self.driver.startMovementIn(direction))
+        self.overshootDirection = direction
+        if (not self.origin.wait(ORIGIN_TIMEOUT)):
+            self.originsMissed = self.originsMissed + 1
+            self.overshootDirection = None
+        clock.result(self.driver.stopMovement())
+        #
+        # the plate stops after the ramp down, the error is the distance to the origin
+        error = abs((self.motor.angle - ORIGIN_ANGLE + 180) % 360 - 180)
+        self.maxStopError = max(self.maxStopError, error)
+
+    def record(self, *values):
+        self.trace.update((repr(values) + "\n").encode())
+
+    def run(self, cycles):
+        clock.result(self.driver.lookForReference())
+        self.driver.waitMovementEnd()
+        self.record("reference", clock.time(), self.motor.positionMicrosteps, self.driver.edgeCount)
+        start = clock.time()
+        for cycle in range(cycles):
+            cycleStart = start + cycle * CYCLE_TIME
+            hardware.presentPart(PART_PIN, cycleStart + PART_DELAY, PART_TIME, PART_BOUNCES)
+            clock.sleep(max(0, cycleStart + PART_DELAY + 1 - clock.time()))
+            if (self.isPartPresent()):
+                #
+                # the even parts are accepted
+                if (cycle % 2 == 0):
+                    self.turnToOrigin(1)
+                else:
+                    self.turnToOrigin(0)
+            self.record(cycle, clock.time(), self.motor.positionMicrosteps, self.driver.edgeCount, self.losses)
+            clock.sleep(max(0, cycleStart + CYCLE_TIME - clock.time()))
+
+    def terminate(self):
+        self.partTimer.terminate()
+        self.driver.terminate()
+        self.driver.join()
+
+
+def simulate(hours, useWaves):
+    """ runs the station hours, returns its results """
+    cycles = int(hours * 3600 / CYCLE_TIME)
+    begin = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        with clock.participant():
+            station = sortingStation(useWaves)
+            station.run(cycles)
+            station.terminate()
+    return {"cycles": cycles, "virtual": clock.time(), "wall": time.perf_counter() - begin,
+            "steps": station.motor.steps, "counted": station.driver.edgeCount, "losses": station.losses,
+            "missed": station.originsMissed, "stopError": station.maxStopError, "events": clock.hardwareEvents,
+            "trace": station.trace.hexdigest()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "soak of a part sorting station on the simulator")
+    parser.add_argument("--hours", type = float, default = 1.0, help = "hours of operation")
+    parser.add_argument("--waves", action = "store_true", help = "move with waveforms")
+    parser.add_argument("--child", action = "store_true", help = "only print the trace")
+    args = parser.parse_args()
+
+    results = simulate(args.hours, args.waves)
+    if (args.child):
+        print(results["trace"])
+        return
+
+    command = [sys.executable, "-m", "benchmarks.benchSimulator", "--hours", str(args.hours), "--child"]
+    if (args.waves):
+        command.append("--waves")
+    childTrace = subprocess.run(command, cwd = benchmarks.STEP_MOTOR_DIR, stdout = subprocess.PIPE,
+                                check = True).stdout.decode().strip()
+    deterministic = childTrace == results["trace"]
+
+    print("simulated %.2f h (%d cycles) in %.2f s: %.0f x real time" %
+          (results["virtual"] / 3600, results["cycles"], results["wall"], results["virtual"] / results["wall"]))
+    print("steps %d   counted %d   hardware events %d   %.2f us per event" %
+          (results["steps"], results["counted"], results["events"], results["wall"] / max(1, results["events"]) * 1000000))
+    print("step losses %d   origins missed %d   max stop distance to the origin %.2f degrees" %
+          (results["losses"], results["missed"], results["stopError"]))
+    print("deterministic: %s" % deterministic)
+    if (not deterministic):
+        sys.exit(1)
+
+
+if (__name__ == "__main__"):
+    main()
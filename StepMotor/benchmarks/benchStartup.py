@@ -0,0 +1,139 @@
+""" Benchmark of the import and startup time of the control modules and entry scripts
+
+Description:
+    A station restarted by the watchdog imports the driver and starts its server,
+    this benchmark measures that time against a budget:
+       * ms to import each control module in a fresh interpreter (median of the
+         repetitions), the interpreter startup is not counted
+       * side effects of the import: GUI (tkinter) or numpy loaded, pigpio
+         connections opened, threads started or the server port bound. Importing
+         a module must not do any of them, they are done when the classes are created
+       * ms until each entry script ends or its server accepts connections
+
+    The program exits with an error if a measurement is over its budget or an
+    import has side effects
+
+    usage: python -m benchmarks.benchStartup [--import-budget ms] [--startup-budget ms]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+
+import benchmarks  # puts the fake pigpio module on the path
+from benchmarks.benchSuite import ENTRY_SCRIPTS, SERVER_PORT, STARTUP_REPETITIONS, childEnvironment, percentile, startScript, stopScript
+
+#
+# control modules imported by the stations
+MODULES = ["stepMotorDRV8825", "stepMotor28BYJ48", "multiAxisCoordinator", "asyncStepMotorDRV8825",
+           "helicopterWithDRV8825", "partSorting"]
+
+#
+# ms allowed to import a module and to start an entry script
+IMPORT_BUDGET = 100
+STARTUP_BUDGET = 1000
+
+#
+# runs in the fresh interpreter, imports the module and prints what it left behind
+PROBE = """
+import json, socket, sys, threading, time
+begin = time.perf_counter()
+import %s
+elapsed = time.perf_counter() - begin
+import pigpio
+probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+try:
+    probe.bind(("0.0.0.0", %d))
+    bound = False
+except OSError:
+    bound = True
+probe.close()
+print(json.dumps({"ms": elapsed * 1000, "tkinter": "tkinter" in sys.modules, "numpy": "numpy" in sys.modules,
+                  "connections": pigpio.connections, "threads": threading.active_count() - 1, "port bound": bound}))
+"""
+
+
+def portFree(port):
+    """ True if the port can be bound, the port check of the imports is only valid then """
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        probe.bind(("0.0.0.0", port))
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def importModule(module):
+    """ ms to import module in a fresh interpreter and its side effects """
+    output = subprocess.check_output([sys.executable, "-c", PROBE % (module, SERVER_PORT)],
+                                     cwd = benchmarks.STEP_MOTOR_DIR, env = childEnvironment(), stderr = subprocess.DEVNULL)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def sideEffects(probe, checkPort):
+    effects = []
+    for name in ("tkinter", "numpy"):
+        if (probe[name]):
+            effects.append(name + " loaded")
+    if (probe["connections"] > 0):
+        effects.append("%d pigpio connections" % probe["connections"])
+    if (probe["threads"] > 0):
+        effects.append("%d threads" % probe["threads"])
+    if (checkPort and probe["port bound"]):
+        effects.append("port %d bound" % SERVER_PORT)
+    return effects
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "import and startup time of the step motor control")
+    parser.add_argument("--import-budget", type = float, default = IMPORT_BUDGET, help = "ms to import a module")
+    parser.add_argument("--startup-budget", type = float, default = STARTUP_BUDGET, help = "ms to start an entry script")
+    args = parser.parse_args()
+
+    failures = 0
+    checkPort = portFree(SERVER_PORT)
+    if (not checkPort):
+        print("port %d is in use, the imports are not checked for binding it" % SERVER_PORT)
+
+    for module in MODULES:
+        probes = [importModule(module) for repetition in range(STARTUP_REPETITIONS)]
+        ms = percentile([probe["ms"] for probe in probes], 50)
+        effects = sideEffects(probes[-1], checkPort)
+        over = ms > args.import_budget
+        failures = failures + int(over) + int(len(effects) > 0)
+        print("import %-22s %7.1f ms  (budget %g ms)%s   side effects: %s" %
+              (module, ms, args.import_budget, "  OVER BUDGET" if over else "", ", ".join(effects) if effects else "none"))
+
+    for script, command, end in ENTRY_SCRIPTS:
+        startups = []
+        for repetition in range(STARTUP_REPETITIONS):
+            child, startup = startScript(script, command)
+            stopScript(child)
+            if (startup == None):
+                break
+            startups.append(startup)
+        if (len(startups) < STARTUP_REPETITIONS):
+            failures = failures + 1
+            print("start  %-22s the script did not start its server" % script)
+            continue
+        ms = percentile(startups, 50)
+        over = ms > args.startup_budget
+        failures = failures + int(over)
+        print("start  %-22s %7.1f ms  (budget %g ms)%s" % (script, ms, args.startup_budget, "  OVER BUDGET" if over else ""))
+
+    if (failures > 0):
+        sys.exit(1)
+
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,170 @@
+""" Load benchmark of the step counting modes
+
+Description:
+    For each frequency of availableFreq a producer thread writes pigpio notification
+    reports (a rising and a falling edge per step) into the notification pipe in
+    real time. The steps are counted:
+       * callback: a thread emulating the pigpio callback thread calls
+         stepDetection on each rising edge
+       * batched: the notifyStepCounter of the driver reads the pipe in blocks
+
+    The CPU used to count and the steps lost (dropped because the pipe was full
+    or not counted) are shown for each rate
+
+    usage: python -m benchmarks.benchStepCounting [seconds per rate]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import io
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+from notifyStepCounter import notifyStepCounter, REPORT_FORMAT, REPORT_SIZE
+from stepMotorDRV8825 import stepMotorDriver8825
+
+notifyStepCounter.PIPE_PATH = pigpio.NOTIFY_PATH
+
+
+class reportProducer(threading.Thread):
+    """ writes the notification reports of steps at freq during seconds """
+
+    def __init__(self, path, pin, freq, seconds):
+        threading.Thread.__init__(self)
+        self.fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        self.mask = 1 << pin
+        self.freq = freq
+        self.seconds = seconds
+        self.produced = 0
+        self.dropped = 0
+        self.cpu = 0
+
+    def run(self):
+        cpuStart = time.thread_time()
+        start = time.perf_counter()
+        seqno = 0
+        while True:
+            elapsed = time.perf_counter() - start
+            due = int(min(elapsed, self.seconds) * self.freq) - self.produced - self.dropped
+            if (due > 0):
+                data = b""
+                for step in range(due):
+                    tick = int((elapsed * 1000000)) & 0xFFFFFFFF
+                    data = data + struct.pack(REPORT_FORMAT, seqno & 0xFFFF, 0, tick, self.mask)
+                    data = data + struct.pack(REPORT_FORMAT, (seqno + 1) & 0xFFFF, 0, tick, 0)
+                    seqno = seqno + 2
+                try:
+                    written = os.write(self.fd, data)
+                except BlockingIOError:
+                    written = 0
+                #
+                # pigpio drops the reports that do not fit in the pipe
+                self.produced = self.produced + written // (2 * REPORT_SIZE)
+                self.dropped = self.dropped + due - written // (2 * REPORT_SIZE)
+            if (elapsed >= self.seconds):
+                break
+            time.sleep(0.001)
+        self.cpu = time.thread_time() - cpuStart
+        os.close(self.fd)
+
+
+class callbackThread(threading.Thread):
+    """ emulates the pigpio callback thread, calls func on each rising edge """
+
+    def __init__(self, path, pin, func):
+        threading.Thread.__init__(self)
+        self.fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        self.pin = pin
+        self.mask = 1 << pin
+        self.func = func
+        self.loop_active = True
+
+    def run(self):
+        lastLevel = 0
+        remainder = b""
+        while self.loop_active:
+            if (len(select.select([self.fd], [], [], 0.1)[0]) == 0):
+                continue
+            try:
+                data = remainder + os.read(self.fd, REPORT_SIZE * 1024)
+            except BlockingIOError:
+                continue
+            if (len(data) == len(remainder)):
+                #
+                # the producer closed the pipe
+                time.sleep(0.01)
+                continue
+            usable = len(data) - len(data) % REPORT_SIZE
+            for seqno, flags, tick, level in struct.iter_unpack(REPORT_FORMAT, data[:usable]):
+                level = level & self.mask
+                if (level and not lastLevel):
+                    self.func(self.pin, 1, tick)
+                lastLevel = level
+            remainder = data[usable:]
+        os.close(self.fd)
+
+
+def measure(driver, path, freq, seconds):
+    """ returns CPU seconds used to count and lost steps """
+    startPending = driver.pendingMovements
+    producer = reportProducer(path, driver.stepCountPin, freq, seconds)
+    cpuStart = time.process_time()
+    producer.start()
+    producer.join()
+    #
+    # let the counter drain the pipe
+    time.sleep(0.05)
+    cpu = time.process_time() - cpuStart - producer.cpu
+    counted = startPending - driver.pendingMovements
+    return cpu, producer.produced + producer.dropped - counted
+
+
+def createDriver(batchedCounting):
+    stepMotorDriver8825.gpioControl = pigpio.pi()
+    with contextlib.redirect_stdout(io.StringIO()):
+        driver = stepMotorDriver8825(batchedCounting = batchedCounting)
+    return driver
+
+
+def main():
+    seconds = 1.0
+    if (len(sys.argv) > 1):
+        seconds = float(sys.argv[1])
+
+    print("  freq | callback CPU %  lost | batched CPU %  lost")
+    for freq in stepMotorDriver8825.availableFreq:
+        results = []
+        #
+        # callback on each edge
+        driver = createDriver(False)
+        handle = driver.gpioControl.notify_open()
+        path = pigpio.NOTIFY_PATH % handle
+        consumer = callbackThread(path, driver.stepCountPin, driver.stepDetection)
+        consumer.start()
+        results.append(measure(driver, path, freq, seconds))
+        consumer.loop_active = False
+        consumer.join()
+        driver.gpioControl.notify_close(handle)
+        driver.terminate()
+        driver.join()
+        #
+        # batches read from the notification pipe
+        driver = createDriver(True)
+        path = notifyStepCounter.PIPE_PATH % driver.stepCounter.handle
+        results.append(measure(driver, path, freq, seconds))
+        driver.terminate()
+        driver.join()
+
+        print("%6d | %14.2f %5d | %13.2f %5d" % (freq, results[0][0] / seconds * 100, results[0][1], results[1][0] / seconds * 100, results[1][1]))
+
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,136 @@
+""" Benchmark of the step loss detector
+
+Description:
+    A thread simulates the step count pin firing the edges of the commanded
+    frequency of the motor, the motor runs with the step loss detector and then:
+       * jam: the edges stop, the detector has to flag a stall
+       * slip: only a part of the edges arrive, the detector has to flag the divergence
+    Shows the time to detect each loss, the false detections while the motor ramps
+    and runs normally, and the cost of a check of the detector.
+    The step callback does no extra work with the detector
+
+    usage: python -m benchmarks.benchStepLoss [frequency]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import io
+import sys
+import threading
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+from stepMotorDRV8825 import stepMotorDriver8825
+from stepLossDetector import stepLossDetector
+
+#
+# seconds of normal movement before the failure
+NORMAL_TIME = 1.0
+
+
+class edgeSimulator(threading.Thread):
+    """ fires on the step count pin the edges of the commanded frequency of the driver, ratio of them arrive """
+
+    def __init__(self, driver):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.driver = driver
+        self.ratio = 1.0
+        self.loop_active = True
+        self.start()
+
+    def run(self):
+        pending = 0.0
+        last = time.perf_counter()
+        while (self.loop_active):
+            time.sleep(0.001)
+            now = time.perf_counter()
+            pending = pending + self.driver.getCommandedFrequency() * (now - last) * self.ratio
+            last = now
+            while (pending >= 1):
+                pending = pending - 1
+                self.driver.gpioControl.fireEdge(self.driver.stepCountPin)
+
+
+def detectionTime(useWaves, frequency, ratio):
+    """ runs the motor, after NORMAL_TIME only ratio of the edges arrive.
+        returns the false detections, the seconds to detect the loss (None if not detected) and its reason """
+    with contextlib.redirect_stdout(io.StringIO()):
+        driver = stepMotorDriver8825(useWaves = useWaves, gpioControl = pigpio.pi(), detectStepLoss = True)
+        driver.stepMotorFreq = frequency
+        simulator = edgeSimulator(driver)
+        driver.startMovement().result()
+        time.sleep(NORMAL_TIME)
+        falseDetections = driver.stepLossDetector.losses
+        simulator.ratio = ratio
+        failure = time.perf_counter()
+        detected = driver.stepLossEvent.wait(2)
+        elapsed = time.perf_counter() - failure
+        stopped = driver.waitMovementEnd(2)
+        simulator.loop_active = False
+        driver.terminate()
+        driver.join()
+    if (not detected or not stopped):
+        return falseDetections, None, None
+    return falseDetections, elapsed, driver.lastStepLoss[0]
+
+
+class stubMotor:
+    """ what the detector reads from the driver """
+
+    def __init__(self):
+        self.idleEvent = threading.Event()
+        self.idleEvent.set()
+        self.edgeCount = 0
+
+    def getCommandedFrequency(self):
+        return 3200
+
+
+def checkCost(checks = 200000):
+    """ ns of a check of the detector on a motor running normally """
+    motor = stubMotor()
+    detector = stepLossDetector(motor, lambda reason, commanded, counted: None)
+    #
+    # the checks are called here, not from the thread of the detector
+    detector.terminate()
+    detector.join()
+    now = 0.0
+    begin = time.perf_counter()
+    for check in range(checks):
+        now = now + detector.period
+        motor.edgeCount = int(now * motor.getCommandedFrequency())
+        detector.check(now)
+    elapsed = time.perf_counter() - begin
+    return elapsed / checks * 1000000000, detector.losses
+
+
+def main():
+    frequency = 3200
+    if (len(sys.argv) > 1):
+        frequency = int(sys.argv[1])
+
+    failed = False
+    for name, useWaves in (("pwm", False), ("waves", True)):
+        for failure, ratio in (("jam", 0.0), ("slip", 0.5)):
+            falseDetections, elapsed, reason = detectionTime(useWaves, frequency, ratio)
+            if (elapsed == None):
+                failed = True
+                print("%-5s %-4s at %d Hz: not detected" % (name, failure, frequency))
+            else:
+                print("%-5s %-4s at %d Hz: detected in %6.2f ms (%s)   false detections: %d" %
+                      (name, failure, frequency, elapsed * 1000, reason, falseDetections))
+            failed = failed or falseDetections > 0
+
+    cost, losses = checkCost()
+    print("check cost: %6.0f ns   cpu each %d ms: %.3f %%   false detections: %d" %
+          (cost, stepLossDetector.DEFAULT_PERIOD * 1000, cost / (stepLossDetector.DEFAULT_PERIOD * 10000000), losses))
+    if (failed or losses > 0):
+        sys.exit(1)
+
+
+if (__name__ == "__main__"):
+    main()
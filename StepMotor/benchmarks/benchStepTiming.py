@@ -0,0 +1,85 @@
+""" Benchmark of the step timing ring buffer
+
+Description:
+    Measures the ring buffer of the ticks of the step edges:
+       * cost of the step callback per edge with the tick recorded
+       * time to analyze the last steps (intervals, jitter, achieved frequency)
+       * memory of the buffer after 1 million edges, it must not grow
+       * achieved frequency and jitter of simulated ticks with a known jitter
+
+    usage: python -m benchmarks.benchStepTiming [edges]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import io
+import random
+import sys
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+import stepTimingBuffer as timing
+from stepMotorDRV8825 import stepMotorDriver8825
+
+#
+# simulated step frequency and maximum jitter in us
+FREQUENCY = 3200
+JITTER = 5
+
+
+def callbackCost(edges):
+    """ returns the ns per edge of the step callback, the buffer memory before and after the edges """
+    with contextlib.redirect_stdout(io.StringIO()):
+        driver = stepMotorDriver8825(gpioControl = pigpio.pi())
+    buffer = driver.stepTiming
+    memoryBefore = buffer.ticks.buffer_info()[1] * buffer.ticks.itemsize
+    stepDetection = driver.stepDetection
+    period = 1000000 // FREQUENCY
+    begin = time.perf_counter()
+    for edge in range(edges):
+        stepDetection(4, 1, (edge * period) & 0xFFFFFFFF)
+    elapsed = time.perf_counter() - begin
+    memoryAfter = buffer.ticks.buffer_info()[1] * buffer.ticks.itemsize
+    driver.terminate()
+    driver.join()
+    return elapsed / edges * 1000000000, memoryBefore, memoryAfter
+
+
+def simulatedReport(steps):
+    """ fills a buffer with ticks at FREQUENCY with random jitter, wrapping the 32 bit tick """
+    buffer = timing.stepTimingBuffer(steps)
+    period = 1000000 // FREQUENCY
+    tick = 0xFFFFFFFF - steps * period // 2
+    for step in range(steps):
+        buffer.record((tick + random.randint(-JITTER, JITTER)) & 0xFFFFFFFF)
+        tick = tick + period
+    begin = time.perf_counter()
+    report = buffer.report(FREQUENCY)
+    return report, time.perf_counter() - begin
+
+
+def main():
+    edges = 1000000
+    if (len(sys.argv) > 1):
+        edges = int(sys.argv[1])
+
+    cost, memoryBefore, memoryAfter = callbackCost(edges)
+    print("callback per edge: %7.1f ns   buffer memory: %d bytes before, %d bytes after %d edges" %
+          (cost, memoryBefore, memoryAfter, edges))
+
+    report, elapsed = simulatedReport(timing.stepTimingBuffer.DEFAULT_SIZE)
+    path = "numpy" if timing.loadNumpy() != None else "pure python"
+    print("analysis of %d steps (%s): %7.2f ms" % (report["steps"], path, elapsed * 1000))
+    print("commanded: %d Hz   achieved: %.1f Hz   error: %.3f %%" % (report["commanded"], report["achieved"], report["error %"]))
+    print("jitter us: " + "   ".join(["p%s %.1f" % (p, value) for p, value in report["jitter us"].items()]))
+
+    if (memoryBefore != memoryAfter):
+        print("the buffer memory grows")
+        sys.exit(1)
+
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,327 @@
+""" Benchmark suite with machine readable results
+
+Description:
+    Runs the main measurements of the driver and the TCP-IP servers against the
+    fake pigpio module and writes them as JSON, to compare releases:
+       * cost of the stepDetection callback per edge
+       * CPU used by the process with the motor idle and moving
+       * ramp time of startMovement / stopMovement (availableFreq ramp and waveforms)
+       * command latency and throughput of the plate, helicopter and part sorting servers
+       * startup time of each entry script (until its server accepts connections)
+
+    The helicopter and part sorting servers are measured running their scripts in a
+    child process with the fakes on the path, they listen on their port 12345.
+
+    With --baseline the results are compared with a previous JSON file, the program
+    exits with an error if a measurement is worse than the baseline by more than
+    --threshold (25 % by default)
+
+    usage: python -m benchmarks.benchSuite [--output file] [--baseline file] [--threshold ratio]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+from stepMotorDRV8825 import stepMotorDriver8825, motorControlTerminalServer
+
+#
+# a measurement is a regression when it is worse than the baseline by more than this ratio
+DEFAULT_THRESHOLD = 0.25
+
+#
+# differences below these values are noise of the box, they are not regressions
+NOISE_FLOOR = {"ms": 0.5, "ns": 50, "%": 1.0}
+
+#
+# commands sent to measure the servers
+COMMANDS = 200
+
+#
+# entry scripts: script, command to measure the server (None if the script does not
+# start a server) and end of its answer
+ENTRY_SCRIPTS = [("stepMotorDRV8825.py", None, None),
+                 ("helicopterWithDRV8825.py", b"H\r\n", b"[Enter]:"),
+                 ("partSorting.py", b"?\r\n", b"\r\n")]
+
+#
+# port of the servers of the entry scripts
+SERVER_PORT = 12345
+
+#
+# seconds to wait for an entry script to accept connections
+STARTUP_TIMEOUT = 20
+
+#
+# times each entry script is started to measure its startup
+STARTUP_REPETITIONS = 5
+
+
+def result(value, unit, better = "lower"):
+    return {"value": value, "unit": unit, "better": better}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+def createDriver(**options):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return stepMotorDriver8825(gpioControl = pigpio.pi(), **options)
+
+
+def closeDriver(driver):
+    with contextlib.redirect_stdout(io.StringIO()):
+        driver.terminate()
+        driver.join()
+
+
+def stepDetectionCost(edges = 1000000):
+    """ ns of the step callback per edge """
+    driver = createDriver()
+    stepDetection = driver.stepDetection
+    begin = time.perf_counter()
+    for edge in range(edges):
+        stepDetection(4, 1, edge)
+    elapsed = time.perf_counter() - begin
+    closeDriver(driver)
+    return {"stepDetection per edge": result(elapsed / edges * 1000000000, "ns")}
+
+
+def processCpu(seconds):
+    """ CPU seconds of the process per wall second during seconds """
+    cpuStart = time.process_time()
+    time.sleep(seconds)
+    return (time.process_time() - cpuStart) / seconds
+
+
+def runLoopCpu(seconds = 1.0):
+    """ CPU of the process with the motor idle and running continuously with waveforms """
+    driver = createDriver(useWaves = True)
+    time.sleep(0.1)
+    idle = processCpu(seconds)
+    with contextlib.redirect_stdout(io.StringIO()):
+        driver.startMovement().result()
+    moving = processCpu(seconds)
+    with contextlib.redirect_stdout(io.StringIO()):
+        driver.stopMovement().result()
+    closeDriver(driver)
+    return {"cpu idle": result(idle * 100, "%"), "cpu moving": result(moving * 100, "%")}
+
+
+def rampTimes(frequency = 1600, repetitions = 3):
+    """ ms until the Futures of startMovement and stopMovement are done """
+    results = {}
+    for name, useWaves in (("pwm", False), ("waves", True)):
+        driver = createDriver(useWaves = useWaves)
+        driver.stepMotorFreq = frequency
+        starts = []
+        stops = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for repetition in range(repetitions):
+                begin = time.perf_counter()
+                driver.startMovement().result()
+                starts.append(time.perf_counter() - begin)
+                begin = time.perf_counter()
+                driver.stopMovement().result()
+                stops.append(time.perf_counter() - begin)
+        closeDriver(driver)
+        results["startMovement " + name] = result(percentile(starts, 50) * 1000, "ms")
+        results["stopMovement " + name] = result(percentile(stops, 50) * 1000, "ms")
+    return results
+
+
+def readAnswer(client, end):
+    """ reads until the answer ends with end """
+    data = b""
+    while (not data.endswith(end)):
+        received = client.recv(4096)
+        if (len(received) == 0):
+            raise ConnectionError("connection closed")
+        data = data + received
+    return data
+
+
+def commandRoundTrips(port, command, end, commands = COMMANDS):
+    """ sends commands waiting each answer, returns the latencies in s and the total time """
+    client = socket.create_connection(("127.0.0.1", port), timeout = 5)
+    try:
+        #
+        # the menu or the greeting of the connection
+        if (end == b"[Enter]:"):
+            readAnswer(client, end)
+        #
+        # the first command waits for the server to drop a previous connection
+        client.sendall(command)
+        readAnswer(client, end)
+        latencies = []
+        begin = time.perf_counter()
+        for index in range(commands):
+            start = time.perf_counter()
+            client.sendall(command)
+            readAnswer(client, end)
+            latencies.append(time.perf_counter() - start)
+        total = time.perf_counter() - begin
+    finally:
+        client.close()
+    return latencies, total
+
+
+def serverResults(name, latencies, total):
+    return {name + " command latency p50": result(percentile(latencies, 50) * 1000, "ms"),
+            name + " command latency p99": result(percentile(latencies, 99) * 1000, "ms"),
+            name + " throughput": result(len(latencies) / total, "commands/s", "higher")}
+
+
+def plateServer():
+    """ latency and throughput of the plate server of stepMotorDRV8825 """
+    driver = createDriver()
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    motorControlTerminalServer.TCP_PORT = port
+    motorControlTerminalServer.BINARY_PORT = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = motorControlTerminalServer(driver)
+        try:
+            latencies, total = commandRoundTrips(port, b"H\r\n", b"[Enter]:")
+        finally:
+            server.terminate()
+            server.join()
+    closeDriver(driver)
+    return serverResults("plate", latencies, total)
+
+
+def childEnvironment():
+    """ environment of the entry scripts, the fakes go first on the path """
+    environment = dict(os.environ)
+    paths = [benchmarks.FAKES_DIR, benchmarks.STEP_MOTOR_DIR]
+    if (environment.get("PYTHONPATH")):
+        paths.append(environment["PYTHONPATH"])
+    environment["PYTHONPATH"] = os.pathsep.join(paths)
+    return environment
+
+
+def waitConnection(child, timeout = STARTUP_TIMEOUT):
+    """ connects to the server of child, returns the socket or None if the child ends or times out """
+    limit = time.perf_counter() + timeout
+    while (time.perf_counter() < limit and child.poll() == None):
+        try:
+            return socket.create_connection(("127.0.0.1", SERVER_PORT), timeout = 5)
+        except OSError:
+            time.sleep(0.002)
+    return None
+
+
+def startScript(script, command):
+    """ starts the entry script, returns the child process, the ms until it ends or its server
+        accepts connections (None if it does not) """
+    begin = time.perf_counter()
+    child = subprocess.Popen([sys.executable, script], cwd = benchmarks.STEP_MOTOR_DIR, env = childEnvironment(),
+                             stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    if (command == None):
+        child.wait(STARTUP_TIMEOUT)
+        return child, (time.perf_counter() - begin) * 1000
+    connection = waitConnection(child)
+    if (connection == None):
+        return child, None
+    startup = (time.perf_counter() - begin) * 1000
+    connection.close()
+    return child, startup
+
+
+def stopScript(child):
+    if (child.poll() == None):
+        child.kill()
+    child.wait()
+
+
+def entryScripts(repetitions = STARTUP_REPETITIONS):
+    """ startup time of each entry script (median of repetitions), latency and throughput of their servers """
+    results = {}
+    for script, command, end in ENTRY_SCRIPTS:
+        name = os.path.splitext(script)[0]
+        startups = []
+        for repetition in range(repetitions):
+            child, startup = startScript(script, command)
+            try:
+                if (startup == None):
+                    break
+                startups.append(startup)
+                if (command != None and repetition == repetitions - 1):
+                    #
+                    # the server closes the probe connection and accepts the next one
+                    time.sleep(0.1)
+                    latencies, total = commandRoundTrips(SERVER_PORT, command, end)
+                    results.update(serverResults(name, latencies, total))
+            finally:
+                stopScript(child)
+        if (len(startups) < repetitions):
+            results[name + " startup"] = {"error": "the script did not start its server"}
+        else:
+            results[name + " startup"] = result(percentile(startups, 50), "ms")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """ returns the measurements worse than the baseline by more than threshold """
+    regressions = []
+    for name, measurement in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if (previous == None or "value" not in previous or "value" not in measurement):
+            continue
+        if (abs(measurement["value"] - previous["value"]) < NOISE_FLOOR.get(measurement["unit"], 0)):
+            continue
+        if (measurement["better"] == "lower"):
+            worse = measurement["value"] > previous["value"] * (1 + threshold)
+        else:
+            worse = measurement["value"] < previous["value"] * (1 - threshold)
+        if (worse):
+            regressions.append({"name": name, "baseline": previous["value"], "value": measurement["value"], "unit": measurement["unit"]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "benchmark suite of the step motor control")
+    parser.add_argument("--output", help = "JSON file for the results, stdout by default")
+    parser.add_argument("--baseline", help = "JSON results of a previous run to compare with")
+    parser.add_argument("--threshold", type = float, default = DEFAULT_THRESHOLD, help = "regression ratio")
+    args = parser.parse_args()
+
+    results = {}
+    for measurement in (stepDetectionCost, runLoopCpu, rampTimes, plateServer, entryScripts):
+        results.update(measurement())
+
+    report = {"suite": "StepMotor", "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": platform.python_version(), "machine": platform.machine(), "results": results}
+    if (args.baseline != None):
+        with open(args.baseline) as baselineFile:
+            report["regressions"] = compare(results, json.load(baselineFile), args.threshold)
+
+    text = json.dumps(report, indent = 2, sort_keys = True)
+    if (args.output != None):
+        with open(args.output, "w") as outputFile:
+            outputFile.write(text + "\n")
+    else:
+        print(text)
+
+    if (len(report.get("regressions", [])) > 0):
+        sys.exit(1)
+
+
+if (__name__ == "__main__"):
+    main()
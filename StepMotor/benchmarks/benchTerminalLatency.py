@@ -0,0 +1,114 @@
+""" Benchmark of the latency of the commands of the TCP terminal
+
+Description:
+    Sends commands to a motorControlTerminalServer through a local socket, the
+    motor moves with waveforms on the fake pigpio. Shows the latency histograms the
+    connection records for each command (dispatch, first step, answer with the menu,
+    completed: the motor stopped for the movements to a position, the Future of the
+    driver done for the rest) and the cost of recording a latency
+
+    usage: python -m benchmarks.benchTerminalLatency [repetitions]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import io
+import socket
+import sys
+import threading
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+from stepMotorDRV8825 import stepMotorDriver8825, motorControlTerminalServer
+from commandLatency import commandLatencyRecorder, latencyHistogram
+
+#
+# commands sent in each repetition, if the motor stop is waited and seconds to wait after the menu is received.
+# L is sent while the motor moves, it completes when it is processed
+SEQUENCE = [("2", True, 0), ("S", False, 0.2), ("+", False, 0.2), ("-", False, 0.2), ("L", False, 0), ("H", True, 0), ("A", True, 0), ("4", True, 0)]
+
+#
+# the menu ends with the prompt
+PROMPT = b"[Enter]:"
+
+
+class menuReader(threading.Thread):
+    """ reads the answers of the terminal, counts the menus received """
+
+    def __init__(self, sock):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.sock = sock
+        self.menus = 0
+        self.received = threading.Condition()
+        self.start()
+
+    def run(self):
+        pending = b""
+        while True:
+            try:
+                data = self.sock.recv(4096)
+            except OSError:
+                return
+            if (len(data) == 0):
+                return
+            pending = pending + data
+            with self.received:
+                self.menus = self.menus + pending.count(PROMPT)
+                pending = pending[pending.rfind(PROMPT) + len(PROMPT):] if PROMPT in pending else pending
+                self.received.notify_all()
+
+    def waitMenus(self, menus):
+        with self.received:
+            self.received.wait_for(lambda: self.menus >= menus, 5)
+
+
+def recordCost(values = 1000000):
+    """ ns to record a latency in a histogram """
+    histogram = latencyHistogram()
+    begin = time.perf_counter()
+    for value in range(values):
+        histogram.record(value)
+    return (time.perf_counter() - begin) / values * 1000000000
+
+
+def main():
+    repetitions = 5
+    if (len(sys.argv) > 1):
+        repetitions = int(sys.argv[1])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        driver = stepMotorDriver8825(useWaves = True, gpioControl = pigpio.pi())
+        driver.stepMotorFreq = 3200
+        #
+        # any free port
+        motorControlTerminalServer.TCP_PORT = 0
+        motorControlTerminalServer.BINARY_PORT = 0
+        server = motorControlTerminalServer(driver)
+        client = socket.create_connection(("127.0.0.1", server.s.getsockname()[1]))
+        reader = menuReader(client)
+        menus = 1
+        reader.waitMenus(menus)
+        for repetition in range(repetitions):
+            for command, waitStop, pause in SEQUENCE:
+                client.sendall((command + "\r\n").encode())
+                menus = menus + 1
+                reader.waitMenus(menus)
+                if (waitStop):
+                    driver.waitMovementEnd(5)
+                time.sleep(pause)
+        server.terminate()
+        client.close()
+        driver.terminate()
+        driver.join()
+
+    for line in commandLatencyRecorder.forMotor(driver).formatReport():
+        print(line)
+    print("record cost: %.0f ns" % recordCost())
+
+
+if (__name__ == "__main__"):
+    main()
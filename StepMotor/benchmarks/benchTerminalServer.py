@@ -0,0 +1,188 @@
+""" Benchmark of the terminal server with many clients at once
+
+Description:
+    Connects a growing number of clients to the plate server (motorControlTerminalServer,
+    one thread for all the clients) with the motor on the fake pigpio and measures:
+       * ms from the connection until the menu is received (accept latency)
+       * ms of the round trip of a command ("H", answered with the menu) while
+         all the clients send it at the same time
+       * CPU of the process with all the clients connected and idle
+       * threads of the process
+       * ms of the round trip of "?" while another client starts and stops the
+         motor ("M" and "H", the ramps of the PWM take ~160 ms in the control thread),
+         the commands must not wait for the motor
+       * a client that sends commands and does not read the answers is closed, the
+         answers kept for it stay below terminalServer.MAX_OUTPUT
+
+    usage: python -m benchmarks.benchTerminalServer [clients ...]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import io
+import selectors
+import socket
+import sys
+import threading
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+import terminalServer
+from stepMotorDRV8825 import stepMotorDriver8825, motorControlTerminalServer
+
+#
+# the menu ends with the prompt
+PROMPT = b"[Enter]:"
+
+#
+# commands sent by each client and seconds the idle CPU is measured
+ROUNDS = 20
+IDLE_SECONDS = 1.0
+
+#
+# longest round trip accepted while the other client moves the motor
+MAX_MOVING_ROUND_TRIP = 50
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+def waitPrompts(selector, pending, latencies, begin):
+    """ reads the answers of the clients until each one has received a prompt """
+    buffers = dict([(client, b"") for client in pending])
+    while (len(pending) > 0):
+        for key, events in selector.select(5):
+            client = key.fileobj
+            buffers[client] = buffers[client] + client.recv(65536)
+            if (client in pending and PROMPT in buffers[client]):
+                pending.remove(client)
+                latencies.append((time.perf_counter() - begin) * 1000)
+
+
+def measure(port, clients):
+    """ accept latency, round trip latencies, idle CPU and threads with clients connected """
+    selector = selectors.DefaultSelector()
+    sockets = []
+    accepts = []
+    for index in range(clients):
+        begin = time.perf_counter()
+        client = socket.create_connection(("127.0.0.1", port))
+        selector.register(client, selectors.EVENT_READ)
+        sockets.append(client)
+        waitPrompts(selector, [client], accepts, begin)
+
+    roundTrips = []
+    for round in range(ROUNDS):
+        begin = time.perf_counter()
+        for client in sockets:
+            client.sendall(b"H\r\n")
+        waitPrompts(selector, list(sockets), roundTrips, begin)
+
+    cpuStart = time.process_time()
+    time.sleep(IDLE_SECONDS)
+    cpu = (time.process_time() - cpuStart) / IDLE_SECONDS * 100
+    threads = threading.active_count()
+
+    for client in sockets:
+        selector.unregister(client)
+        client.close()
+    selector.close()
+    return accepts, roundTrips, cpu, threads
+
+
+def movingRoundTrips(port):
+    """ round trip latencies of a client while another one starts and stops the motor """
+    selector = selectors.DefaultSelector()
+    latencies = []
+    mover = socket.create_connection(("127.0.0.1", port))
+    mover.settimeout(5)
+    client = socket.create_connection(("127.0.0.1", port))
+    selector.register(client, selectors.EVENT_READ)
+    waitPrompts(selector, [client], [], time.perf_counter())
+    for round in range(ROUNDS):
+        mover.sendall(b"M%d\r\nH\r\n" % (round * 10))
+        begin = time.perf_counter()
+        client.sendall(b"?\r\n")
+        waitPrompts(selector, [client], latencies, begin)
+        #
+        # the answers of the mover are not measured
+        received = b""
+        while (received.count(PROMPT) < 2):
+            received = received + mover.recv(65536)
+    selector.unregister(client)
+    selector.close()
+    mover.close()
+    client.close()
+    return latencies
+
+
+def notReading(server, port, commands = 5000):
+    """ True if a client that does not read is closed, and the most bytes queued for it """
+    client = socket.create_connection(("127.0.0.1", port))
+    client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    client.settimeout(5)
+    queued = 0
+    try:
+        for command in range(commands):
+            client.sendall(b"?\r\n")
+            #
+            # the server answers before the next command
+            time.sleep(0.0002)
+            for connection in list(server.connections.values()):
+                queued = max(queued, len(connection.output))
+    except OSError:
+        #
+        # the server has closed the connection
+        pass
+    time.sleep(0.1)
+    closed = (len(server.connections) == 0)
+    client.close()
+    return closed, queued
+
+
+def main():
+    counts = [1, 10, 50]
+    if (len(sys.argv) > 1):
+        counts = [int(count) for count in sys.argv[1:]]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        driver = stepMotorDriver8825(gpioControl = pigpio.pi())
+        #
+        # any free port
+        motorControlTerminalServer.TCP_PORT = 0
+        motorControlTerminalServer.BINARY_PORT = 0
+        server = motorControlTerminalServer(driver)
+    port = server.s.getsockname()[1]
+
+    for clients in counts:
+        with contextlib.redirect_stdout(io.StringIO()):
+            accepts, roundTrips, cpu, threads = measure(port, clients)
+            #
+            # the server closes the connections of the clients
+            time.sleep(0.1)
+        print("clients %3d   accept p50 %6.2f ms   round trip p50 %6.2f ms  p99 %6.2f ms   idle CPU %5.2f %%   threads %d" %
+              (clients, percentile(accepts, 50), percentile(roundTrips, 50), percentile(roundTrips, 99), cpu, threads))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        moving = movingRoundTrips(port)
+        time.sleep(0.1)
+    print("motor starting and stopping   round trip p50 %6.2f ms  p99 %6.2f ms" % (percentile(moving, 50), percentile(moving, 99)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        closed, queued = notReading(server, port)
+    print("client not reading   closed: %s   most bytes queued %d (max %d)" % (closed, queued, terminalServer.MAX_OUTPUT))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        server.terminate()
+        driver.terminate()
+        driver.join()
+    if (percentile(moving, 99) > MAX_MOVING_ROUND_TRIP or not closed or queued > terminalServer.MAX_OUTPUT):
+        sys.exit(1)
+
+
+if (__name__ == "__main__"):
+    main()
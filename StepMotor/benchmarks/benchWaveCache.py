@@ -0,0 +1,67 @@
+""" Benchmark of the waveform cache of the motion engine
+
+Description:
+    Measures the time from a movement demand to the wave_chain that emits its first
+    step pulse, when its waveforms are in the cache (hit) and when they have to be
+    built (miss)
+
+    usage: python -m benchmarks.benchWaveCache [repetitions]
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import sys
+import time
+
+import benchmarks  # puts the fake pigpio module on the path
+import pigpio
+from waveMotionEngine import waveMotionEngine, waveCache
+
+STEP_PIN = 21
+
+#
+# (microstep cfg, frequency, steps) of the movements repeated by the stations
+MOVEMENTS = [(5, 3200, 1600), (5, 3200, 3200), (4, 1600, 800), (5, 6400, 6400)]
+
+
+def timeToFirstStep(engine, microstepCfg, freq, steps):
+    """ us from the movement demand to the wave_chain call """
+    pi = engine.gpioControl
+    pi.clearCalls()
+    start = time.perf_counter()
+    engine.move(steps, freq, True, microstepCfg)
+    firstStep = pi.callsTo("wave_chain")[0][0]
+    engine.release()
+    return (firstStep - start) * 1000000
+
+
+def main():
+    repetitions = 200
+    if (len(sys.argv) > 1):
+        repetitions = int(sys.argv[1])
+
+    pi = pigpio.pi()
+    cache = waveCache(pi)
+    engine = waveMotionEngine(pi, STEP_PIN, cache = cache)
+
+    misses = []
+    hits = []
+    for repetition in range(repetitions):
+        for microstepCfg, freq, steps in MOVEMENTS:
+            engine.flush()
+            misses.append(timeToFirstStep(engine, microstepCfg, freq, steps))
+    for microstepCfg, freq, steps in MOVEMENTS:
+        timeToFirstStep(engine, microstepCfg, freq, steps)
+    for repetition in range(repetitions):
+        for microstepCfg, freq, steps in MOVEMENTS:
+            hits.append(timeToFirstStep(engine, microstepCfg, freq, steps))
+
+    for name, times in (("miss", misses), ("hit", hits)):
+        times.sort()
+        print("%-5s time to first step (us) median: %9.1f  p99: %9.1f" % (name, times[len(times) // 2], times[int(len(times) * 0.99) - 1]))
+    print("cache:", cache.getStats())
+
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,335 @@
+""" Recording fake of the pigpio client library
+
+Description:
+    Drop-in replacement of the pigpio module used to run the step motor classes
+    on a box without pigpiod. Every call made on a pi instance is recorded in
+    pi.calls as (time, method name, arguments) and the callbacks registered with
+    pi.callback can be fired from the benchmarks with pi.fireEdge
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import os
+import tempfile
+import time
+
+#
+# the notification pipes are created in this folder instead of /dev
+NOTIFY_DIR = tempfile.mkdtemp(prefix = "fakepigpio")
+NOTIFY_PATH = os.path.join(NOTIFY_DIR, "pigpio%d")
+
+INPUT = 0
+OUTPUT = 1
+
+PUD_OFF = 0
+PUD_DOWN = 1
+PUD_UP = 2
+
+RISING_EDGE = 0
+FALLING_EDGE = 1
+EITHER_EDGE = 2
+
+WAVE_MODE_ONE_SHOT = 0
+WAVE_MODE_REPEAT = 1
+WAVE_MODE_ONE_SHOT_SYNC = 2
+WAVE_MODE_REPEAT_SYNC = 3
+
+#
+# values of wave_tx_at when no waveform or a chain is sent
+NO_TX_WAVE = 9999
+WAVE_NOT_FOUND = 9998
+
+#
+# PWM frequencies available with the default sample rate of 5 us
+PWM_FREQUENCIES = [10,20,40,50,80,100,160,200,250,320,400,500,800,1000,1600,2000,4000,8000]
+
+
+class error(Exception):
+    """ error returned by the daemon """
+    pass
+
+
+class pulse:
+    """ a pulse of a waveform """
+
+    def __init__(self, gpio_on, gpio_off, delay):
+        self.gpio_on = gpio_on
+        self.gpio_off = gpio_off
+        self.delay = delay
+
+
+class _callback:
+    """ handle returned by pi.callback """
+
+    def __init__(self, owner, gpio, edge, func):
+        self.owner = owner
+        self.gpio = gpio
+        self.edge = edge
+        self.func = func
+        self.count = 0
+
+    def tally(self):
+        return self.count
+
+    def reset_tally(self):
+        self.count = 0
+
+    def cancel(self):
+        if (self in self.owner.callbacks):
+            self.owner.callbacks.remove(self)
+
+
+#
+# connections opened by the process (pi instances created)
+connections = 0
+
+
+class pi:
+    """ fake connection to the pigpio daemon """
+
+    def __init__(self, host = "localhost", port = 8888):
+        global connections
+        connections = connections + 1
+        self.connected = True
+        self.calls = []
+        self.callbacks = []
+        self.levels = {}
+        self.record = True
+        #
+        # waveform in construction and created waveforms (id: list of pulses)
+        self.wavePulses = []
+        self.waves = {}
+        self.nextWaveId = 0
+        #
+        # time when the current transmission ends
+        self.txEnd = 0
+        #
+        # waveforms sent (start time, wave id), the queued one starts when the current ends
+        self.txQueue = []
+        #
+        # notification handles: bits monitored
+        self.notifications = {}
+
+    def _record(self, name, *args):
+        if (self.record):
+            self.calls.append((time.perf_counter(), name, args))
+
+    def callsTo(self, name):
+        """ return the recorded calls to the method name """
+        return [call for call in self.calls if call[1] == name]
+
+    def clearCalls(self):
+        self.calls = []
+
+    def fireEdge(self, gpio, level = 1, tick = None):
+        """ simulates an edge on gpio calling the registered callbacks """
+        self.levels[gpio] = level
+        if (tick == None):
+            tick = self.get_current_tick()
+        for cb in list(self.callbacks):
+            if (cb.gpio == gpio):
+                if (cb.edge == EITHER_EDGE or (cb.edge == RISING_EDGE and level == 1) or (cb.edge == FALLING_EDGE and level == 0)):
+                    cb.count = cb.count + 1
+                    if (cb.func != None):
+                        cb.func(gpio, level, tick)
+
+    def get_current_tick(self):
+        return int(time.perf_counter() * 1000000) & 0xFFFFFFFF
+
+    def set_mode(self, gpio, mode):
+        self._record("set_mode", gpio, mode)
+        return 0
+
+    def set_pull_up_down(self, gpio, pud):
+        self._record("set_pull_up_down", gpio, pud)
+        return 0
+
+    def read(self, gpio):
+        return self.levels.get(gpio, 0)
+
+    def write(self, gpio, level):
+        self._record("write", gpio, level)
+        self.levels[gpio] = level
+        return 0
+
+    def read_bank_1(self):
+        return sum([1 << gpio for gpio, level in self.levels.items() if gpio < 32 and level == 1])
+
+    def set_bank_1(self, bits):
+        self._record("set_bank_1", bits)
+        for gpio in range(32):
+            if (bits & (1 << gpio)):
+                self.levels[gpio] = 1
+        return 0
+
+    def clear_bank_1(self, bits):
+        self._record("clear_bank_1", bits)
+        for gpio in range(32):
+            if (bits & (1 << gpio)):
+                self.levels[gpio] = 0
+        return 0
+
+    def set_PWM_frequency(self, user_gpio, frequency):
+        self._record("set_PWM_frequency", user_gpio, frequency)
+        #
+        # the daemon selects the closest available frequency
+        return min(PWM_FREQUENCIES, key = lambda f: abs(f - frequency))
+
+    def set_PWM_dutycycle(self, user_gpio, dutycycle):
+        self._record("set_PWM_dutycycle", user_gpio, dutycycle)
+        return 0
+
+    def hardware_PWM(self, gpio, PWMfreq, PWMduty):
+        self._record("hardware_PWM", gpio, PWMfreq, PWMduty)
+        return 0
+
+    def callback(self, user_gpio, edge = RISING_EDGE, func = None):
+        self._record("callback", user_gpio, edge)
+        cb = _callback(self, user_gpio, edge, func)
+        self.callbacks.append(cb)
+        return cb
+
+    def waveDuration(self, wave_id):
+        """ duration in us of a created waveform """
+        return sum([p.delay for p in self.waves[wave_id]])
+
+    def chainDuration(self, data):
+        """ duration in us of a wave chain, None if it loops forever """
+        stack = [0]
+        pos = 0
+        while (pos < len(data)):
+            if (data[pos] == 255):
+                command = data[pos + 1]
+                if (command == 0):
+                    stack.append(0)
+                    pos = pos + 2
+                elif (command == 1):
+                    count = data[pos + 2] + 256 * data[pos + 3]
+                    loop = stack.pop() * count
+                    stack[-1] = stack[-1] + loop
+                    pos = pos + 4
+                elif (command == 2):
+                    stack[-1] = stack[-1] + data[pos + 2] + 256 * data[pos + 3]
+                    pos = pos + 4
+                elif (command == 3):
+                    return None
+                else:
+                    pos = pos + 2
+            else:
+                stack[-1] = stack[-1] + self.waveDuration(data[pos])
+                pos = pos + 1
+        return stack[0]
+
+    def _transmit(self, duration, sync = False, wave_id = WAVE_NOT_FOUND):
+        now = time.perf_counter()
+        start = now
+        #
+        # a repeating waveform ends at the end of its current cycle
+        if (sync and self.txEnd > now and self.txEnd != float("inf")):
+            start = self.txEnd
+        if (start == now):
+            self.txQueue = []
+        self.txQueue = [tx for tx in self.txQueue if tx[0] <= now][-1:] + [(start, wave_id)]
+        if (duration == None):
+            self.txEnd = float("inf")
+        else:
+            self.txEnd = start + duration / 1000000.0
+
+    def wave_clear(self):
+        self._record("wave_clear")
+        self.wavePulses = []
+        self.waves = {}
+        self.nextWaveId = 0
+        return 0
+
+    def wave_add_new(self):
+        self._record("wave_add_new")
+        self.wavePulses = []
+        return 0
+
+    def wave_add_generic(self, pulses):
+        self._record("wave_add_generic", len(pulses))
+        self.wavePulses.extend(pulses)
+        return len(self.wavePulses)
+
+    def wave_create(self):
+        self._record("wave_create")
+        wave_id = self.nextWaveId
+        self.nextWaveId = self.nextWaveId + 1
+        self.waves[wave_id] = self.wavePulses
+        self.wavePulses = []
+        return wave_id
+
+    def wave_delete(self, wave_id):
+        self._record("wave_delete", wave_id)
+        self.waves.pop(wave_id, None)
+        return 0
+
+    def wave_chain(self, data):
+        self._record("wave_chain", list(data))
+        self._transmit(self.chainDuration(data))
+        return 0
+
+    def wave_send_using_mode(self, wave_id, mode):
+        self._record("wave_send_using_mode", wave_id, mode)
+        duration = self.waveDuration(wave_id)
+        if (mode == WAVE_MODE_REPEAT or mode == WAVE_MODE_REPEAT_SYNC):
+            duration = None
+        self._transmit(duration, mode == WAVE_MODE_ONE_SHOT_SYNC or mode == WAVE_MODE_REPEAT_SYNC, wave_id)
+        return 0
+
+    def wave_tx_at(self):
+        """ id of the waveform being sent, NO_TX_WAVE if none """
+        now = time.perf_counter()
+        if (now >= self.txEnd):
+            return NO_TX_WAVE
+        current = [tx for tx in self.txQueue if tx[0] <= now]
+        if (len(current) == 0):
+            return NO_TX_WAVE
+        return current[-1][1]
+
+    def wave_tx_busy(self):
+        return int(time.perf_counter() < self.txEnd)
+
+    def wave_tx_stop(self):
+        self._record("wave_tx_stop")
+        self.txEnd = 0
+        self.txQueue = []
+        return 0
+
+    def wave_get_max_pulses(self):
+        return 12000
+
+    def wave_get_max_cbs(self):
+        return 25016
+
+    def notify_open(self):
+        self._record("notify_open")
+        handle = 0
+        while (os.path.exists(NOTIFY_PATH % handle)):
+            handle = handle + 1
+        os.mkfifo(NOTIFY_PATH % handle)
+        self.notifications[handle] = 0
+        return handle
+
+    def notify_begin(self, handle, bits):
+        self._record("notify_begin", handle, bits)
+        self.notifications[handle] = bits
+        return 0
+
+    def notify_pause(self, handle):
+        self._record("notify_pause", handle)
+        self.notifications[handle] = 0
+        return 0
+
+    def notify_close(self, handle):
+        self._record("notify_close", handle)
+        self.notifications.pop(handle, None)
+        if (os.path.exists(NOTIFY_PATH % handle)):
+            os.unlink(NOTIFY_PATH % handle)
+        return 0
+
+    def stop(self):
+        self._record("stop")
+        self.connected = False
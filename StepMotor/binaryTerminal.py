@@ -0,0 +1,342 @@
+""" Compact binary control protocol of the stations
+
+Description:
+    Next to the telnet menus of port 12345, the stations accept automated controllers
+    on port 12346 with a length prefixed binary protocol (big endian):
+
+        request:  length (uint16) | operation (uint8) | request id (uint16) | arguments
+        answer:   length (uint16) | kind (uint8) | request id (uint16) | code (uint8) | values
+
+    length counts the bytes after it. Each request is answered with a REPLY as soon
+    as it is processed (with an error code if it is not possible), the operations
+    that move the motor are also answered with a COMPLETE when their motion ends.
+    The answers of different requests can arrive in any order, they are matched by
+    the request id chosen by the controller.
+
+    Operations of the motor (arguments -> values of the REPLY / COMPLETE):
+       * STATUS: -> position (float), RPM (float), microstep (uint8), direction (uint8),
+         in movement (uint8)
+       * MOVE_TO: angle (float) -> COMPLETE position (float)
+       * START, STOP, SWITCH_DIRECTION, SET_REFERENCE -> COMPLETE
+       * SET_SPEED: RPM (float) -> COMPLETE
+       * SET_MICROSTEP: microstep (uint8, 0 full ... 5 1/32) -> COMPLETE, BUSY if the motor moves
+       * FIND_REFERENCE -> COMPLETE position (float)
+       * STEP_LOSS_EVENTS: enabled (uint8, 0 or 1), each step loss is sent as an EVENT of
+         the request: reason (uint8, 0 divergence, 1 stall), commanded steps (int32),
+         counted steps (int32)
+    Operations of the part sorting station:
+       * ACCEPT, REJECT: -> COMPLETE when the plate is stopped in the origin, FAILED if a
+         step loss has stopped it
+       * END_MOVEMENT: stops the accept / reject movement in progress (IDLE if none)
+       * PART_PRESENT: -> present (uint8), the filtered state of the sensor, BUSY until it is known
+       * ACCEPT_DIRECTION: direction (uint8, 0 or 1)
+       * PART_EVENTS: enabled (uint8, 0 or 1), each change of the part state is sent
+         as an EVENT of the request: present (uint8)
+
+        client = binaryClient("station", 12346)
+        requestId = client.request(OP_MOVE_TO, "!f", 90)
+        kind, requestId, code, values = client.readAnswer()
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import socket
+import struct
+
+from terminalServer import terminalConnection
+
+#
+# TCP port of the binary protocol
+BINARY_PORT = 12346
+
+#
+# kinds of answer
+KIND_REPLY = 1
+KIND_COMPLETE = 2
+KIND_EVENT = 3
+
+#
+# codes of the answers
+CODE_OK = 0
+CODE_UNKNOWN_OPERATION = 1
+CODE_BAD_LENGTH = 2
+CODE_BAD_ARGUMENT = 3
+CODE_BUSY = 4
+CODE_IDLE = 5
+CODE_FAILED = 6
+
+#
+# operations of the motor
+OP_STATUS = 0x01
+OP_MOVE_TO = 0x02
+OP_START = 0x03
+OP_STOP = 0x04
+OP_SET_SPEED = 0x05
+OP_SET_MICROSTEP = 0x06
+OP_SWITCH_DIRECTION = 0x07
+OP_SET_REFERENCE = 0x08
+OP_FIND_REFERENCE = 0x09
+OP_STEP_LOSS_EVENTS = 0x0A
+
+#
+# operations of the part sorting station
+OP_ACCEPT = 0x20
+OP_REJECT = 0x21
+OP_END_MOVEMENT = 0x22
+OP_PART_PRESENT = 0x23
+OP_ACCEPT_DIRECTION = 0x24
+OP_PART_EVENTS = 0x25
+
+#
+# length prefix and header of the requests and answers
+LENGTH = struct.Struct("!H")
+REQUEST_HEADER = struct.Struct("!BH")
+ANSWER_HEADER = struct.Struct("!BHB")
+
+#
+# longest request accepted, a longer length is a stream out of sync
+MAX_REQUEST = 64
+
+STATUS_FORMAT = "!ffBBB"
+
+#
+# values of the EVENTs of STEP_LOSS_EVENTS, code of each reason of stepLossDetector
+STEP_LOSS_FORMAT = "!Bii"
+STEP_LOSS_REASONS = {"divergence": 0, "stall": 1}
+
+
+class binaryConnection(terminalConnection):
+    """ connection of a controller with the binary protocol, the motor operations """
+
+    #
+    # operation: (method, format of the arguments)
+    OPERATIONS = {OP_STATUS: ("opStatus", "!"),
+                  OP_MOVE_TO: ("opMoveTo", "!f"),
+                  OP_START: ("opStart", "!"),
+                  OP_STOP: ("opStop", "!"),
+                  OP_SET_SPEED: ("opSetSpeed", "!f"),
+                  OP_SET_MICROSTEP: ("opSetMicrostep", "!B"),
+                  OP_SWITCH_DIRECTION: ("opSwitchDirection", "!"),
+                  OP_SET_REFERENCE: ("opSetReference", "!"),
+                  OP_FIND_REFERENCE: ("opFindReference", "!"),
+                  OP_STEP_LOSS_EVENTS: ("opStepLossEvents", "!B")}
+
+    #
+    # limits of the speed
+    MIN_RPM = 2
+    MAX_RPM = 44
+
+    def __init__(self, server, s, motorControl):
+        terminalConnection.__init__(self, server, s)
+        self.motorControl = motorControl
+        self.input = bytearray()
+        #
+        # requests completed when the motor stops
+        self.waitingStop = []
+        #
+        # request of STEP_LOSS_EVENTS, None if the step losses are not sent
+        self.stepLossRequest = None
+
+    def opened(self):
+        self.motorControl.movementEndCallbacks.append(self.movementEnd)
+
+    def closed(self):
+        if (self.movementEnd in self.motorControl.movementEndCallbacks):
+            self.motorControl.movementEndCallbacks.remove(self.movementEnd)
+        if (self.stepLost in self.motorControl.stepLossCallbacks):
+            self.motorControl.stepLossCallbacks.remove(self.stepLost)
+
+    def terminate(self):
+        #
+        # the controller sees the connection closed, no text in the binary stream
+        self.close()
+
+    def received(self, data):
+        """ runs the complete requests received, keeps the rest until it arrives """
+        self.input.extend(data)
+        while (len(self.input) >= LENGTH.size and self.active and not self.closing):
+            (length,) = LENGTH.unpack_from(self.input)
+            if (length < REQUEST_HEADER.size or length > MAX_REQUEST):
+                #
+                # the stream is out of sync, the requests can not be found any more
+                self.answer(KIND_REPLY, 0, CODE_BAD_LENGTH)
+                self.close()
+                return
+            if (len(self.input) < LENGTH.size + length):
+                return
+            request = bytes(self.input[LENGTH.size:LENGTH.size + length])
+            del self.input[:LENGTH.size + length]
+            self.requestReceived(request)
+
+    def requestReceived(self, request):
+        operation, requestId = REQUEST_HEADER.unpack_from(request)
+        entry = self.OPERATIONS.get(operation)
+        if (entry == None):
+            self.reply(requestId, CODE_UNKNOWN_OPERATION)
+            return
+        method, argumentsFormat = entry
+        if (len(request) - REQUEST_HEADER.size != struct.calcsize(argumentsFormat)):
+            self.reply(requestId, CODE_BAD_LENGTH)
+            return
+        arguments = struct.unpack_from(argumentsFormat, request, REQUEST_HEADER.size)
+        try:
+            getattr(self, method)(requestId, *arguments)
+        except:
+            print("Binary connection, error in operation ", operation)
+            self.reply(requestId, CODE_FAILED)
+
+    def answer(self, kind, requestId, code, valuesFormat = "!", *values):
+        values = struct.pack(valuesFormat, *values)
+        self.send(LENGTH.pack(ANSWER_HEADER.size + len(values)) + ANSWER_HEADER.pack(kind, requestId, code) + values)
+
+    def reply(self, requestId, code, valuesFormat = "!", *values):
+        self.answer(KIND_REPLY, requestId, code, valuesFormat, *values)
+
+    def complete(self, requestId, code, valuesFormat = "!", *values):
+        self.answer(KIND_COMPLETE, requestId, code, valuesFormat, *values)
+
+    def movementEnd(self, motorControl):
+        """ called by the driver thread when the motor stops """
+        self.server.callFromThread(self.wakeWaiters)
+
+    def wakeWaiters(self):
+        """ completes the requests waiting for the motor to stop if it is stopped """
+        if (self.motorControl.idleEvent.is_set() and len(self.waitingStop) > 0):
+            waiting = self.waitingStop
+            self.waitingStop = []
+            for requestId in waiting:
+                self.complete(requestId, CODE_OK, "!f", self.motorControl.getCurrPlatePosition())
+
+    def waitStop(self, requestId):
+        self.waitingStop.append(requestId)
+        #
+        # the motor could be already stopped
+        self.wakeWaiters()
+
+    def completeWith(self, requestId, future, waitStop = False):
+        """ the request is completed when the Future of the driver is done (and the motor stopped) """
+        self.reply(requestId, CODE_OK)
+        future.add_done_callback(lambda done: self.server.callFromThread(self.futureDone, requestId, done, waitStop))
+
+    def futureDone(self, requestId, future, waitStop):
+        if (future.cancelled() or future.exception() != None):
+            self.complete(requestId, CODE_FAILED)
+        elif (future.result() == False):
+            #
+            # the driver did not apply the change (the motor is moving)
+            self.complete(requestId, CODE_BUSY)
+        elif (waitStop):
+            self.waitStop(requestId)
+        else:
+            self.complete(requestId, CODE_OK)
+
+    def stepLost(self, motorControl, reason, commanded, counted):
+        """ step loss callback (detector thread) """
+        self.server.callFromThread(self.sendStepLoss, reason, commanded, counted)
+
+    def sendStepLoss(self, reason, commanded, counted):
+        if (self.stepLossRequest != None):
+            self.answer(KIND_EVENT, self.stepLossRequest, CODE_OK, STEP_LOSS_FORMAT, STEP_LOSS_REASONS.get(reason, 255), commanded, counted)
+
+    def opStepLossEvents(self, requestId, enabled):
+        """ the step losses are sent as EVENTs of requestId """
+        if (enabled > 1):
+            self.reply(requestId, CODE_BAD_ARGUMENT)
+            return
+        self.stepLossRequest = None
+        if (self.stepLost in self.motorControl.stepLossCallbacks):
+            self.motorControl.stepLossCallbacks.remove(self.stepLost)
+        if (enabled):
+            self.stepLossRequest = requestId
+            self.motorControl.stepLossCallbacks.append(self.stepLost)
+        self.reply(requestId, CODE_OK)
+
+    def opStatus(self, requestId):
+        self.reply(requestId, CODE_OK, STATUS_FORMAT, self.motorControl.getCurrPlatePosition(), self.motorControl.getCurrRPM(),
+                   self.motorControl.getCurrMicrostepCfg(), self.motorControl.moveDirection, int(self.motorControl.inMovement))
+
+    def startedWith(self, requestId, future):
+        """ the request is replied when the Future of the driver is done, BUSY if the movement
+            was not started, and completed when the motor stops """
+        future.add_done_callback(lambda done: self.server.callFromThread(self.movementStarted, requestId, done))
+
+    def movementStarted(self, requestId, future):
+        if (future.cancelled() or future.exception() != None):
+            self.reply(requestId, CODE_FAILED)
+        elif (not future.result()):
+            self.reply(requestId, CODE_BUSY)
+        else:
+            self.reply(requestId, CODE_OK)
+            self.waitStop(requestId)
+
+    def opMoveTo(self, requestId, angle):
+        if (not (angle >= 0 and angle <= 360)):
+            self.reply(requestId, CODE_BAD_ARGUMENT)
+        else:
+            self.startedWith(requestId, self.motorControl.moveTo(angle))
+
+    def opFindReference(self, requestId):
+        self.startedWith(requestId, self.motorControl.lookForReference())
+
+    def opStart(self, requestId):
+        self.completeWith(requestId, self.motorControl.startMovement())
+
+    def opStop(self, requestId):
+        self.completeWith(requestId, self.motorControl.stopMovement(), True)
+
+    def opSetSpeed(self, requestId, rpm):
+        if (not (rpm >= self.MIN_RPM and rpm <= self.MAX_RPM)):
+            self.reply(requestId, CODE_BAD_ARGUMENT)
+        else:
+            self.completeWith(requestId, self.motorControl.changeSpeed(rpm))
+
+    def opSetMicrostep(self, requestId, microstepCfg):
+        if (microstepCfg < self.motorControl.MICROSTEP_RELATION_1 or microstepCfg > self.motorControl.MICROSTEP_RELATION_32):
+            self.reply(requestId, CODE_BAD_ARGUMENT)
+        else:
+            #
+            # in order with the movements queued, the driver does not change the microstep while moving
+            self.completeWith(requestId, self.motorControl.submitCommand(self.motorControl.setMicrostepCfg, microstepCfg))
+
+    def opSwitchDirection(self, requestId):
+        self.completeWith(requestId, self.motorControl.switchDirection())
+
+    def opSetReference(self, requestId):
+        self.completeWith(requestId, self.motorControl.setReference())
+
+
+class binaryClient:
+    """ controller side of the binary protocol """
+
+    def __init__(self, host, port = BINARY_PORT, timeout = 5):
+        self.sock = socket.create_connection((host, port), timeout = timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.input = bytearray()
+        self.nextId = 1
+
+    def request(self, operation, argumentsFormat = "!", *arguments):
+        """ sends a request, returns its id """
+        requestId = self.nextId
+        self.nextId = (self.nextId % 0xFFFF) + 1
+        arguments = struct.pack(argumentsFormat, *arguments)
+        self.sock.sendall(LENGTH.pack(REQUEST_HEADER.size + len(arguments)) + REQUEST_HEADER.pack(operation, requestId) + arguments)
+        return requestId
+
+    def readAnswer(self):
+        """ returns the next answer: kind, request id, code and the bytes of its values """
+        while True:
+            if (len(self.input) >= LENGTH.size):
+                (length,) = LENGTH.unpack_from(self.input)
+                if (len(self.input) >= LENGTH.size + length):
+                    kind, requestId, code = ANSWER_HEADER.unpack_from(self.input, LENGTH.size)
+                    values = bytes(self.input[LENGTH.size + ANSWER_HEADER.size:LENGTH.size + length])
+                    del self.input[:LENGTH.size + length]
+                    return kind, requestId, code, values
+            data = self.sock.recv(65536)
+            if (len(data) == 0):
+                raise ConnectionError("connection closed by the station")
+            self.input.extend(data)
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,264 @@
+""" Latency of the commands of the TCP-IP terminals
+
+Description:
+    This module measures where the time of a command goes, from the moment sock.recv
+    returns it:
+       * dispatch: the command is processed (the call to the driver returns)
+       * first step: the driver starts the pulses on the step pin
+       * answer: the answer or the menu is sent back
+       * complete: the command is completed: the motor is stopped for the commands
+         that move it to a position, the Future of the rest is done (the ramp of a start /
+         speed change, the stop...), the commands without a Future when they are processed
+
+    The latencies are counted in log-linear histograms (like HdrHistogram): recording
+    a value is an index calculation and an increment of a fixed array, the percentiles
+    have a relative error below 1/SUB_BUCKETS. There is a recorder per motor:
+
+        latency = commandLatencyRecorder.forMotor(motorControl, "SH")
+        record = latency.received(data[0])
+        latency.handled(record, motorControl.moveTo(90), waitStop = True)
+        ... send the answer ...
+        latency.answered(record)
+
+    Only the command letters given by the stations have their own histograms, the
+    rest of the letters (mistyped commands) are counted together as OTHER_COMMANDS.
+    report() returns the percentiles of each command at runtime, dump() prints them
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import math
+import threading
+from array import array
+from concurrent.futures import Future
+
+from hardwareBackend import clock
+
+#
+# stages measured from the reception of a command
+STAGE_DISPATCH = "dispatch"
+STAGE_FIRST_STEP = "first step"
+STAGE_ANSWER = "answer"
+STAGE_COMPLETE = "complete"
+STAGES = (STAGE_DISPATCH, STAGE_FIRST_STEP, STAGE_ANSWER, STAGE_COMPLETE)
+
+#
+# histograms of the letters that are not commands of the stations
+OTHER_COMMANDS = "other"
+
+#
+# percentiles of the reports
+REPORT_PERCENTILES = (50, 90, 99)
+
+
+class latencyHistogram:
+    """ counts of latencies in us, in buckets that double their width each power of two """
+
+    #
+    # each power of two is divided in SUB_BUCKETS linear buckets
+    SUB_BUCKET_BITS = 6
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    #
+    # highest value counted is 2^MAX_BITS - 1 us (19 hours), higher values are counted there
+    MAX_BITS = 36
+
+    def __init__(self):
+        self.counts = array("I", bytes(4 * (self.MAX_BITS - self.SUB_BUCKET_BITS + 1) * self.SUB_BUCKETS))
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = 0
+
+    def bucketIndex(self, value):
+        """ bucket of value, the values below 2 * SUB_BUCKETS have their own bucket """
+        if (value < self.SUB_BUCKETS):
+            return value
+        shift = value.bit_length() - self.SUB_BUCKET_BITS - 1
+        return min(shift * self.SUB_BUCKETS + (value >> shift), len(self.counts) - 1)
+
+    def bucketHighest(self, index):
+        """ highest value counted in the bucket index """
+        if (index < 2 * self.SUB_BUCKETS):
+            return index
+        shift = index // self.SUB_BUCKETS - 1
+        mantissa = index - shift * self.SUB_BUCKETS
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value):
+        """ counts a latency of value us """
+        value = max(int(value), 0)
+        self.counts[self.bucketIndex(value)] += 1
+        self.count = self.count + 1
+        self.total = self.total + value
+        if (self.minimum == None or value < self.minimum):
+            self.minimum = value
+        if (value > self.maximum):
+            self.maximum = value
+
+    def percentile(self, p):
+        """ the value in us p percent of the latencies are below or equal to, None if nothing is counted """
+        if (self.count == 0):
+            return None
+        target = max(1, int(math.ceil(p / 100.0 * self.count)))
+        counted = 0
+        for index in range(len(self.counts)):
+            counted = counted + self.counts[index]
+            if (counted >= target):
+                return min(self.bucketHighest(index), self.maximum)
+        return self.maximum
+
+    def summary(self, percentiles = REPORT_PERCENTILES):
+        """ count, mean, percentiles and maximum in us """
+        summary = {"count": self.count, "mean": None, "max": self.maximum}
+        if (self.count > 0):
+            summary["mean"] = self.total // self.count
+        for p in percentiles:
+            summary["p" + str(p)] = self.percentile(p)
+        return summary
+
+
+class commandTiming:
+    """ a command being measured """
+
+    __slots__ = ("command", "received")
+
+    def __init__(self, command, received):
+        self.command = command
+        self.received = received
+
+
+class commandLatencyRecorder:
+    """ histograms of the latencies of the commands sent to a motor, per command and stage """
+
+    #
+    # recorder of each motor
+    motorRecorders = {}
+    motorRecordersLock = threading.Lock()
+
+    @classmethod
+    def forMotor(cls, motorControl, commands = ""):
+        """ returns the recorder shared by the terminals of motorControl, commands are
+            the letters of the commands of the terminal """
+        with cls.motorRecordersLock:
+            if (motorControl not in cls.motorRecorders):
+                cls.motorRecorders[motorControl] = cls(motorControl)
+            recorder = cls.motorRecorders[motorControl]
+            recorder.commands.update(commands.upper())
+            return recorder
+
+    def __init__(self, motorControl):
+        self.motorControl = motorControl
+        #
+        # (command, stage): latencyHistogram
+        self.histograms = {}
+        #
+        # letters with their own histograms
+        self.commands = set()
+        self.lock = threading.Lock()
+        #
+        # commands received that wait for the pulses to start or the motor to stop
+        self.waitingFirstStep = []
+        self.waitingMovementEnd = []
+        self.motorControl.movementStartCallbacks.append(self.movementStart)
+        self.motorControl.movementEndCallbacks.append(self.movementEnd)
+
+    def add(self, record, stage, now):
+        """ counts the latency of stage of the command of record """
+        with self.lock:
+            key = (record.command, stage)
+            if (key not in self.histograms):
+                self.histograms[key] = latencyHistogram()
+            self.histograms[key].record((now - record.received) * 1000000)
+
+    def received(self, command):
+        """ a command has been received, returns the record to pass to the rest of the calls """
+        command = command.upper()
+        if (command not in self.commands):
+            command = OTHER_COMMANDS
+        record = commandTiming(command, clock.time())
+        with self.lock:
+            self.waitingFirstStep.append(record)
+        return record
+
+    def handled(self, record, result = None, waitStop = False):
+        """ the command has been processed, result is what the driver returned:
+            the command completes when a Future is done, or now. If waitStop is True (a movement
+            to a position) and the Future is True (the movement started) it completes when the motor stops """
+        self.add(record, STAGE_DISPATCH, clock.time())
+        if (isinstance(result, Future)):
+            result.add_done_callback(lambda future: self.futureDone(record, future, waitStop))
+            return
+        self.completed(record)
+
+    def futureDone(self, record, future, waitStop):
+        """ the command executed by the control thread is done, True if it started a movement """
+        if (waitStop and not future.cancelled() and future.exception() == None and future.result() == True):
+            self.completedWhenStopped(record)
+        else:
+            self.completed(record)
+
+    def completedWhenStopped(self, record):
+        """ the command completes when the motor stops if it is moving, or now """
+        with self.lock:
+            moving = not self.motorControl.idleEvent.is_set()
+            if (moving):
+                self.waitingMovementEnd.append(record)
+        if (not moving):
+            self.completed(record)
+
+    def answered(self, record):
+        """ the answer of the command has been sent """
+        self.add(record, STAGE_ANSWER, clock.time())
+
+    def completed(self, record):
+        """ the motion of the command is completed, the pulses do not start for it any more """
+        now = clock.time()
+        with self.lock:
+            if (record in self.waitingFirstStep):
+                self.waitingFirstStep.remove(record)
+        self.add(record, STAGE_COMPLETE, now)
+
+    def movementStart(self, motorControl):
+        """ called by the driver when the pulses start """
+        now = clock.time()
+        with self.lock:
+            records = self.waitingFirstStep
+            self.waitingFirstStep = []
+        for record in records:
+            self.add(record, STAGE_FIRST_STEP, now)
+
+    def movementEnd(self, motorControl):
+        """ called by the driver when the motor stops """
+        with self.lock:
+            records = self.waitingMovementEnd
+            self.waitingMovementEnd = []
+        for record in records:
+            self.completed(record)
+
+    def report(self):
+        """ returns {command: {stage: summary}} with the latencies in us """
+        report = {}
+        with self.lock:
+            for (command, stage), histogram in self.histograms.items():
+                report.setdefault(command, {})[stage] = histogram.summary()
+        return report
+
+    def formatReport(self):
+        """ returns the report as lines of text, the latencies in ms """
+        lines = []
+        report = self.report()
+        for command in sorted(report.keys()):
+            for stage in STAGES:
+                if (stage in report[command]):
+                    summary = report[command][stage]
+                    values = "   ".join(["p" + str(p) + " " + "%.2f" % (summary["p" + str(p)] / 1000.0) for p in REPORT_PERCENTILES])
+                    lines.append("%-5s %-10s n %-6d %s   max %.2f ms" % (command, stage, summary["count"], values, summary["max"] / 1000.0))
+        return lines
+
+    def dump(self):
+        """ prints the report, i.e. at shutdown """
+        print("command latencies:")
+        for line in self.formatReport():
+            print(line)
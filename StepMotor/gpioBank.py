@@ -0,0 +1,82 @@
+""" Output pins of the bank 1 written with masks
+
+Description:
+    Writing a group of pins one by one with gpioControl.write needs a call to
+    pigpiod for each pin, and the pins pass through intermediate combinations
+    (i.e: other microstep modes of the DRV8825). A gpioBank writes the pins of
+    the group with clear_bank_1 / set_bank_1:
+       * the masks of each combination of levels are computed once (masksOf)
+       * only the pins that change are written, at most two calls per change
+       * the pins going low are cleared before the pins going high are set
+
+    The write is not atomic: pigpio has no call that sets and clears pins at once,
+    when some pins go low and others high the group has the pins common to both
+    levels between the two calls (i.e: microstep 1/16 (1,0,0) -> 1/8 (0,1,1) passes
+    through full step (0,0,0)). This is a known limitation, the DRV8825 microstep is
+    only changed with the motor stopped and a coil of the 28BYJ-48 is switched off
+    before the next one is switched on
+
+        coils = gpioBank(gpioControl, [17, 22, 23, 24])
+        phase = coils.masksOf([1, 1, 0, 0])
+        coils.apply(phase)
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+from hardwareBackend import pigpio
+
+
+def bankMask(pins):
+    """ returns the mask of the bank 1 with the bits of pins """
+    mask = 0
+    for pin in pins:
+        mask = mask | (1 << pin)
+    return mask
+
+
+class gpioBank:
+    """ group of output pins of the bank 1 (GPIO 0-31) written with a mask """
+
+    def __init__(self, gpioControl, pins):
+        self.gpioControl = gpioControl
+        self.pins = list(pins)
+        self.mask = bankMask(self.pins)
+        #
+        # (set mask, clear mask) of each combination of levels used
+        self.masks = {}
+        #
+        # pins of the group set high, None until the first write
+        self.high = None
+        for pin in self.pins:
+            self.gpioControl.set_mode(pin, pigpio.OUTPUT)
+
+    def masksOf(self, levels):
+        """ returns the (set mask, clear mask) that put the pins of the group to levels """
+        levels = tuple([int(bool(level)) for level in levels])
+        masks = self.masks.get(levels)
+        if (masks == None):
+            setMask = bankMask([pin for pin, level in zip(self.pins, levels) if level == 1])
+            masks = (setMask, self.mask & ~setMask)
+            self.masks[levels] = masks
+        return masks
+
+    def apply(self, masks):
+        """ writes the masks returned by masksOf, only the pins that change """
+        setMask, clearMask = masks
+        if (self.high != None):
+            clearMask = clearMask & self.high
+            setMask = setMask & ~self.high
+        if (clearMask != 0):
+            self.gpioControl.clear_bank_1(clearMask)
+        if (setMask != 0):
+            self.gpioControl.set_bank_1(setMask)
+        self.high = masks[0]
+
+    def forget(self):
+        """ the pins were changed by other means (i.e: a waveform), the next write writes all of them """
+        self.high = None
+
+    def write(self, levels):
+        """ puts the pins of the group to levels """
+        self.apply(self.masksOf(levels))
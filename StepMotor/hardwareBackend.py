@@ -0,0 +1,77 @@
+""" Hardware backend of the step motor control
+
+Description:
+    The control classes do not import pigpio or the time primitives directly,
+    they take them from this module:
+
+        from hardwareBackend import pigpio, clock
+
+    The backend is selected with the environment variable STEP_MOTOR_BACKEND
+    before the control modules are imported:
+       * "pi" (default): the pigpio module, the real time clock
+       * "simulator": the simulated PI of hardwareSimulator on a virtualClock,
+         the time advances as fast as the CPU allows
+
+    The clock offers time(), sleep(), Event(), Timer(), result(future) and
+    participant(), the context the threads of the control run in (only the
+    virtual clock uses it)
+
+        STEP_MOTOR_BACKEND=simulator python partSorting.py
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import os
+import threading
+import time
+
+#
+# environment variable and names of the backends
+BACKEND_VARIABLE = "STEP_MOTOR_BACKEND"
+PI_BACKEND = "pi"
+SIMULATOR_BACKEND = "simulator"
+
+
+class realClock:
+    """ the time and threading primitives of python """
+
+    def time(self):
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def Event(self):
+        return threading.Event()
+
+    def Timer(self, interval, function, args = None, kwargs = None):
+        return threading.Timer(interval, function, args, kwargs)
+
+    def result(self, future, timeout = None):
+        return future.result(timeout)
+
+    def participant(self):
+        return contextlib.nullcontext(self)
+
+    def isParticipant(self):
+        return False
+
+
+backend = os.environ.get(BACKEND_VARIABLE, PI_BACKEND)
+
+if (backend == SIMULATOR_BACKEND):
+    import simulatedPigpio as pigpio
+    from hardwareSimulator import clock, hardware
+elif (backend == PI_BACKEND):
+    import pigpio
+    clock = realClock()
+    hardware = None
+else:
+    raise ImportError("unknown " + BACKEND_VARIABLE + ": " + backend)
+
+
+def isSimulated():
+    """ True when the control runs on the simulated PI """
+    return hardware != None
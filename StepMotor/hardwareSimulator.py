@@ -0,0 +1,610 @@
+""" Simulated hardware of the step motor stations
+
+Description:
+    Model of the GPIO of the PI driven by a virtualClock, used by the simulated
+    pigpio module (simulatedPigpio):
+       * the level of each pin, the bank writes and the edge callbacks
+       * the PWM and hardware PWM of a pin, the frequency can change while running
+       * the DMA transmitter of the pigpio waveforms (modes, sync and chains)
+       * wires between pins, i.e. the step pin to the step count pin
+       * a DRV8825 step motor: each rising edge of its step pin moves it a step of
+         the microstep configuration of its pins, in the direction of its dir pin
+       * a unipolar 28BYJ-48 step motor that follows the phase of its coils
+       * sensors at configurable angles of a motor (the reference / origin sensor)
+       * an input changed at scheduled times (the part present sensor)
+
+    The hardware is a source of the clock: it tells the time of its next edge and
+    handles it when the clock gets there. The callbacks of the edges are called by
+    the thread that advances the clock with the virtual tick in us.
+
+    There is a single hardware per process, as there is a single pigpiod per PI:
+
+        from hardwareSimulator import hardware
+        motor = hardware.addStation(referenceAngles = [90])
+
+    The notification pipes of pigpio (batched step counting) are not simulated
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import heapq
+import itertools
+
+from virtualClock import virtualClock
+
+#
+# edges of the callbacks (the values of pigpio)
+RISING_EDGE = 0
+FALLING_EDGE = 1
+EITHER_EDGE = 2
+
+#
+# modes of the waveforms (the values of pigpio)
+WAVE_MODE_ONE_SHOT = 0
+WAVE_MODE_REPEAT = 1
+WAVE_MODE_ONE_SHOT_SYNC = 2
+WAVE_MODE_REPEAT_SYNC = 3
+
+#
+# wave_tx_at when nothing is sent
+NO_TX_WAVE = 9999
+
+#
+# PWM frequencies available with the default sample rate of 5 us
+PWM_FREQUENCIES = [10,20,40,50,80,100,160,200,250,320,400,500,800,1000,1600,2000,4000,8000]
+
+#
+# resources of the DMA transmitter
+MAX_WAVES = 250
+MAX_PULSES = 12000
+MAX_CBS = 25016
+
+
+class edgeCallback:
+    """ a function called on the edges of a pin: func(gpio, level, tick) """
+
+    def __init__(self, hardware, pin, edge, func):
+        self.hardware = hardware
+        self.pin = pin
+        self.edge = edge
+        self.func = func
+        self.count = 0
+
+    def matches(self, level):
+        return self.edge == EITHER_EDGE or (self.edge == RISING_EDGE) == (level == 1)
+
+    def tally(self):
+        return self.count
+
+    def reset_tally(self):
+        self.count = 0
+
+    def cancel(self):
+        self.hardware.removeCallback(self)
+
+
+class pwmGenerator:
+    """ square signal on a pin, the rising edges are one period apart """
+
+    def __init__(self, hardware, pin):
+        self.hardware = hardware
+        self.pin = pin
+        self.frequency = 800
+        self.duty = 0.5
+        self.running = False
+        #
+        # time of the last and the next rising edge, of the next falling one
+        self.lastRise = None
+        self.nextRise = None
+        self.nextFall = None
+
+    def setFrequency(self, frequency):
+        """ the next rising edge is one period of the new frequency after the last one """
+        self.frequency = frequency
+        if (self.running and self.lastRise != None):
+            self.nextRise = max(self.hardware.clock.now, self.lastRise + 1.0 / frequency)
+
+    def start(self, duty):
+        self.duty = duty
+        if (not self.running):
+            self.running = True
+            self.nextRise = self.hardware.clock.now
+
+    def stop(self):
+        self.running = False
+        self.nextRise = None
+
+    def nextEventTime(self):
+        if (self.nextFall != None and (self.nextRise == None or self.nextFall <= self.nextRise)):
+            return self.nextFall
+        return self.nextRise
+
+    def process(self, now):
+        if (self.nextFall != None and (self.nextRise == None or self.nextFall <= self.nextRise)):
+            self.nextFall = None
+            self.hardware.setLevel(self.pin, 0)
+        else:
+            period = 1.0 / self.frequency
+            self.lastRise = now
+            self.nextRise = now + period
+            self.nextFall = now + period * self.duty
+            self.hardware.setLevel(self.pin, 1)
+
+
+class waveTransmitter:
+    """ the DMA transmitter of pigpio, sends a waveform or a chain at a time """
+
+    def __init__(self, hardware):
+        self.hardware = hardware
+        #
+        # pulses being sent: generator of (wave id, pins on, pins off, delay in s)
+        self.pulses = None
+        self.nextTime = None
+        self.currentWave = NO_TX_WAVE
+        #
+        # pulses that start when the current waveform cycle ends (sync modes)
+        self.pending = None
+
+    def isBusy(self):
+        return self.pulses != None
+
+    def waveCycles(self, waveId, pulses, repeat):
+        while True:
+            for pulse in pulses:
+                yield (waveId,) + pulse
+            if (not repeat or self.pending != None):
+                return
+
+    def chainPulses(self, entries):
+        for entry in entries:
+            if (entry[0] == "wave"):
+                for pulse in entry[2]:
+                    yield (entry[1],) + pulse
+            elif (entry[0] == "delay"):
+                yield (self.currentWave, (), (), entry[1])
+            elif (entry[0] == "loop"):
+                for repetition in range(entry[2]):
+                    for pulse in self.chainPulses(entry[1]):
+                        yield pulse
+            else:
+                while True:
+                    for pulse in self.chainPulses(entry[1]):
+                        yield pulse
+
+    def start(self, pulses, now):
+        self.pulses = pulses
+        self.pending = None
+        self.nextTime = now
+
+    def send(self, waveId, mode):
+        repeat = mode in (WAVE_MODE_REPEAT, WAVE_MODE_REPEAT_SYNC)
+        pulses = self.waveCycles(waveId, self.hardware.waves[waveId], repeat)
+        if (self.isBusy() and mode in (WAVE_MODE_ONE_SHOT_SYNC, WAVE_MODE_REPEAT_SYNC)):
+            self.pending = pulses
+        else:
+            self.start(pulses, self.hardware.clock.now)
+
+    def chain(self, data):
+        """ sends the chain of wave_chain, the loops are followed lazily """
+        stack = [[]]
+        pos = 0
+        while (pos < len(data)):
+            if (data[pos] == 255):
+                command = data[pos + 1]
+                if (command == 0):
+                    stack.append([])
+                    pos = pos + 2
+                elif (command == 1):
+                    entries = stack.pop()
+                    stack[-1].append(("loop", entries, data[pos + 2] + 256 * data[pos + 3]))
+                    pos = pos + 4
+                elif (command == 2):
+                    stack[-1].append(("delay", (data[pos + 2] + 256 * data[pos + 3]) / 1000000.0))
+                    pos = pos + 4
+                else:
+                    entries = stack.pop()
+                    stack[-1].append(("forever", entries))
+                    pos = pos + 2
+            else:
+                stack[-1].append(("wave", data[pos], self.hardware.waves[data[pos]]))
+                pos = pos + 1
+        self.start(self.chainPulses(stack[0]), self.hardware.clock.now)
+
+    def stop(self):
+        self.pulses = None
+        self.pending = None
+        self.nextTime = None
+        self.currentWave = NO_TX_WAVE
+
+    def nextEventTime(self):
+        return self.nextTime
+
+    def process(self, now):
+        try:
+            waveId, pinsOn, pinsOff, delay = next(self.pulses)
+        except StopIteration:
+            if (self.pending != None):
+                self.start(self.pending, now)
+            else:
+                self.stop()
+            return
+        self.currentWave = waveId
+        self.nextTime = now + delay
+        for pin in pinsOn:
+            self.hardware.setLevel(pin, 1)
+        for pin in pinsOff:
+            self.hardware.setLevel(pin, 0)
+
+
+class simulatedStepMotor:
+    """ step motor of a DRV8825, its position is counted in microsteps of 1/32 """
+
+    MICROSTEPS_PER_STEP = 32
+
+    #
+    # microsteps of the value of the microstep pins (first pin is the most significant bit)
+    MICROSTEP_MODES = [1, 2, 4, 8, 16, 32, 32, 32]
+
+    #
+    # level of the dir pin to move forward
+    FORWARD = 1
+
+    def __init__(self, hardware, stepPin, dirPin, microstepPins, stepsPerRevolution = 200, angle = 0):
+        self.hardware = hardware
+        self.stepPin = stepPin
+        self.dirPin = dirPin
+        self.microstepPins = list(microstepPins)
+        self.stepsPerRevolution = stepsPerRevolution
+        self.microstepsPerRevolution = stepsPerRevolution * self.MICROSTEPS_PER_STEP
+        self.positionMicrosteps = int(round(angle * self.microstepsPerRevolution / 360.0))
+        #
+        # steps received and steps moved, a jammed motor does not move
+        self.steps = 0
+        self.jammed = False
+        self.sensors = []
+
+    @property
+    def angle(self):
+        """ position in degrees, not limited to a revolution """
+        return self.positionMicrosteps * 360.0 / self.microstepsPerRevolution
+
+    def microsteps(self):
+        """ microsteps of 1/32 of a step in the current configuration """
+        mode = 0
+        for pin in self.microstepPins:
+            mode = (mode << 1) | self.hardware.levels.get(pin, 0)
+        return self.MICROSTEPS_PER_STEP // self.MICROSTEP_MODES[mode]
+
+    def step(self):
+        self.steps = self.steps + 1
+        if (self.jammed):
+            return
+        if (self.hardware.levels.get(self.dirPin, 0) == self.FORWARD):
+            self.positionMicrosteps = self.positionMicrosteps + self.microsteps()
+        else:
+            self.positionMicrosteps = self.positionMicrosteps - self.microsteps()
+        for sensor in self.sensors:
+            sensor.update()
+
+
+class simulatedUnipolarMotor:
+    """ unipolar step motor (28BYJ-48), it follows the phase of its coils, the position is in half steps """
+
+    #
+    # coils on in each phase of the half step sequence
+    PHASES = [(1,1,0,0), (0,1,0,0), (0,1,1,0), (0,0,1,0), (0,0,1,1), (0,0,0,1), (1,0,0,1), (1,0,0,0)]
+
+    def __init__(self, hardware, coilPins, halfStepsPerRevolution = 4096):
+        self.hardware = hardware
+        self.coilPins = list(coilPins)
+        self.halfStepsPerRevolution = halfStepsPerRevolution
+        self.positionHalfSteps = 0
+        self.phase = None
+        #
+        # changes of the coils that skip a phase, the rotor does not know where to go
+        self.lostSteps = 0
+
+    @property
+    def angle(self):
+        """ position in degrees, not limited to a revolution """
+        return self.positionHalfSteps * 360.0 / self.halfStepsPerRevolution
+
+    def coilsChanged(self):
+        levels = tuple([self.hardware.levels.get(pin, 0) for pin in self.coilPins])
+        if (levels not in self.PHASES):
+            return
+        phase = self.PHASES.index(levels)
+        if (self.phase != None):
+            delta = (phase - self.phase) % len(self.PHASES)
+            if (delta > len(self.PHASES) // 2):
+                delta = delta - len(self.PHASES)
+            if (abs(delta) > 2):
+                self.lostSteps = self.lostSteps + 1
+            else:
+                self.positionHalfSteps = self.positionHalfSteps + delta
+        self.phase = phase
+
+
+class angleSensor:
+    """ input that is active while a motor is within width degrees of one of angles """
+
+    def __init__(self, hardware, motor, pin, angles, width = 2.0, activeLevel = 1):
+        self.hardware = hardware
+        self.motor = motor
+        self.pin = pin
+        self.angles = list(angles)
+        self.width = width
+        self.activeLevel = activeLevel
+        motor.sensors.append(self)
+        self.update()
+
+    def isActive(self):
+        angle = self.motor.angle % 360
+        for sensorAngle in self.angles:
+            if (abs((angle - sensorAngle + 180) % 360 - 180) <= self.width / 2.0):
+                return True
+        return False
+
+    def update(self):
+        level = self.activeLevel if self.isActive() else 1 - self.activeLevel
+        self.hardware.setLevel(self.pin, level)
+
+
+class simulatedHardware:
+    """ pins, PWM, waveforms, motors and sensors of a PI on the virtual time of clock """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.levels = {}
+        self.modes = {}
+        self.callbacks = {}
+        #
+        # pins driven by each pin
+        self.wires = {}
+        #
+        # motor of each step pin, unipolar motor of each coil pin
+        self.motors = {}
+        self.coilMotors = {}
+        #
+        # PWM of each pin
+        self.pwm = {}
+        #
+        # waveform in construction and created ones (id: tuple of (pins on, pins off, delay in s))
+        self.wavePulses = []
+        self.waves = {}
+        self.transmitter = waveTransmitter(self)
+        #
+        # scheduled changes of the inputs: (time, sequence, pin, level)
+        self.inputChanges = []
+        self.sequence = itertools.count()
+        self.edges = 0
+        clock.addSource(self)
+
+    def tick(self):
+        """ virtual time in us as the ticks of pigpio """
+        return int(self.clock.now * 1000000) & 0xFFFFFFFF
+
+    def setLevel(self, pin, level):
+        """ changes the level of pin, the wired pins, motors and callbacks follow it """
+        if (self.levels.get(pin, 0) == level):
+            return
+        self.levels[pin] = level
+        self.edges = self.edges + 1
+        for wiredPin in self.wires.get(pin, ()):
+            self.setLevel(wiredPin, level)
+        if (level == 1 and pin in self.motors):
+            self.motors[pin].step()
+        if (pin in self.coilMotors):
+            self.coilMotors[pin].coilsChanged()
+        if (pin in self.callbacks):
+            tick = self.tick()
+            for callback in list(self.callbacks[pin]):
+                if (callback.matches(level)):
+                    callback.count = callback.count + 1
+                    if (callback.func != None):
+                        callback.func(pin, level, tick)
+
+    def read(self, pin):
+        return self.levels.get(pin, 0)
+
+    def write(self, pin, level):
+        with self.clock.condition:
+            self.setLevel(pin, int(level))
+
+    def writeBank(self, setMask, clearMask):
+        """ sets the pins of setMask and clears the ones of clearMask at the same time """
+        with self.clock.condition:
+            for pin in self.maskPins(clearMask):
+                self.setLevel(pin, 0)
+            for pin in self.maskPins(setMask):
+                self.setLevel(pin, 1)
+
+    def readBank(self):
+        with self.clock.condition:
+            return sum([1 << pin for pin in range(32) if self.read(pin) == 1])
+
+    def addCallback(self, pin, edge, func):
+        with self.clock.condition:
+            callback = edgeCallback(self, pin, edge, func)
+            self.callbacks.setdefault(pin, []).append(callback)
+            return callback
+
+    def removeCallback(self, callback):
+        with self.clock.condition:
+            if (callback in self.callbacks.get(callback.pin, [])):
+                self.callbacks[callback.pin].remove(callback)
+
+    def wire(self, outputPin, inputPin):
+        """ inputPin follows the level of outputPin """
+        with self.clock.condition:
+            self.wires.setdefault(outputPin, []).append(inputPin)
+
+    def unwire(self, outputPin, inputPin):
+        with self.clock.condition:
+            if (inputPin in self.wires.get(outputPin, [])):
+                self.wires[outputPin].remove(inputPin)
+
+    def addMotor(self, stepPin, dirPin, microstepPins, stepsPerRevolution = 200, angle = 0):
+        with self.clock.condition:
+            motor = simulatedStepMotor(self, stepPin, dirPin, microstepPins, stepsPerRevolution, angle)
+            self.motors[stepPin] = motor
+            return motor
+
+    def addUnipolarMotor(self, coilPins = (17, 22, 23, 24), halfStepsPerRevolution = 4096):
+        """ a 28BYJ-48 on coilPins, the default pins of stepMotorDriver28BYJ48 """
+        with self.clock.condition:
+            motor = simulatedUnipolarMotor(self, coilPins, halfStepsPerRevolution)
+            for pin in coilPins:
+                self.coilMotors[pin] = motor
+            return motor
+
+    def addAngleSensor(self, motor, pin, angles, width = 2.0, activeLevel = 1):
+        with self.clock.condition:
+            return angleSensor(self, motor, pin, angles, width, activeLevel)
+
+    def addStation(self, stepPin = 21, dirPin = 20, microstepPins = (14, 15, 18), stepCountPin = 4,
+                   referencePin = 16, referenceAngles = (90,), referenceWidth = 2.0, angle = 0):
+        """ the motor of a stepMotorDriver8825 with its default pins: the step pin is wired to the
+            step count pin and the reference sensor is active at referenceAngles. returns the motor """
+        motor = self.addMotor(stepPin, dirPin, microstepPins, angle = angle)
+        self.wire(stepPin, stepCountPin)
+        self.addAngleSensor(motor, referencePin, referenceAngles, referenceWidth)
+        return motor
+
+    def setInput(self, pin, level, at = None):
+        """ changes the level of an input pin now or at the virtual time at """
+        with self.clock.condition:
+            if (at == None or at <= self.clock.now):
+                self.setLevel(pin, level)
+            else:
+                heapq.heappush(self.inputChanges, (at, next(self.sequence), pin, level))
+                self.clock.condition.notify_all()
+
+    def presentPart(self, pin, at, duration, bounces = 0, bouncePeriod = 0.0002):
+        """ the part present sensor on pin is active from at during duration seconds,
+            the signal bounces the first bounces times """
+        for bounce in range(bounces):
+            self.setInput(pin, 1, at + 2 * bounce * bouncePeriod)
+            self.setInput(pin, 0, at + (2 * bounce + 1) * bouncePeriod)
+        self.setInput(pin, 1, at + 2 * bounces * bouncePeriod)
+        self.setInput(pin, 0, at + duration)
+
+    #
+    # PWM
+    def pwmOf(self, pin):
+        if (pin not in self.pwm):
+            self.pwm[pin] = pwmGenerator(self, pin)
+        return self.pwm[pin]
+
+    def setPwmFrequency(self, pin, frequency):
+        """ sets the frequency of the PWM of pin, returns the available frequency used """
+        with self.clock.condition:
+            achieved = min(PWM_FREQUENCIES, key = lambda f: abs(f - frequency))
+            self.pwmOf(pin).setFrequency(achieved)
+            return achieved
+
+    def setPwmDutycycle(self, pin, dutycycle, scale = 255):
+        with self.clock.condition:
+            if (dutycycle > 0):
+                self.pwmOf(pin).start(dutycycle / float(scale))
+            else:
+                self.pwmOf(pin).stop()
+            self.clock.condition.notify_all()
+
+    def hardwarePwm(self, pin, frequency, duty):
+        with self.clock.condition:
+            if (frequency > 0 and duty > 0):
+                self.pwmOf(pin).setFrequency(frequency)
+                self.setPwmDutycycle(pin, duty, 1000000)
+            else:
+                self.setPwmDutycycle(pin, 0)
+
+    #
+    # waveforms
+    def waveAddNew(self):
+        self.wavePulses = []
+
+    def waveAddGeneric(self, pulses):
+        """ adds pulses (gpio_on, gpio_off, delay) with the masks of the pins """
+        for gpioOn, gpioOff, delay in pulses:
+            self.wavePulses.append((self.maskPins(gpioOn), self.maskPins(gpioOff), delay / 1000000.0))
+        return len(self.wavePulses)
+
+    def maskPins(self, mask):
+        return tuple([pin for pin in range(32) if mask & (1 << pin)])
+
+    def waveCreate(self):
+        """ returns the id of the waveform, None when there are no more ids """
+        with self.clock.condition:
+            for waveId in range(MAX_WAVES):
+                if (waveId not in self.waves):
+                    self.waves[waveId] = tuple(self.wavePulses)
+                    self.wavePulses = []
+                    return waveId
+            return None
+
+    def waveDelete(self, waveId):
+        with self.clock.condition:
+            self.waves.pop(waveId, None)
+
+    def waveClear(self):
+        with self.clock.condition:
+            self.waves = {}
+            self.wavePulses = []
+
+    def waveSend(self, waveId, mode):
+        with self.clock.condition:
+            self.transmitter.send(waveId, mode)
+            self.clock.condition.notify_all()
+
+    def waveChain(self, data):
+        with self.clock.condition:
+            self.transmitter.chain(list(data))
+            self.clock.condition.notify_all()
+
+    def waveStop(self):
+        with self.clock.condition:
+            self.transmitter.stop()
+
+    def waveBusy(self):
+        return self.transmitter.isBusy()
+
+    def waveAt(self):
+        return self.transmitter.currentWave
+
+    #
+    # source of the clock
+    def nextSource(self):
+        """ the generator with the earliest edge and its time """
+        first = None
+        firstTime = None
+        if (len(self.inputChanges) > 0):
+            first = self
+            firstTime = self.inputChanges[0][0]
+        if (self.transmitter.nextTime != None and (firstTime == None or self.transmitter.nextTime < firstTime)):
+            first = self.transmitter
+            firstTime = self.transmitter.nextTime
+        for generator in self.pwm.values():
+            when = generator.nextEventTime()
+            if (when != None and (firstTime == None or when < firstTime)):
+                first = generator
+                firstTime = when
+        return first, firstTime
+
+    def nextEventTime(self):
+        return self.nextSource()[1]
+
+    def process(self, now):
+        source = self.nextSource()[0]
+        if (source is self):
+            when, sequence, pin, level = heapq.heappop(self.inputChanges)
+            self.setLevel(pin, level)
+        elif (source != None):
+            source.process(now)
+
+
+#
+# the simulated PI of the process
+clock = virtualClock()
+hardware = simulatedHardware(clock)
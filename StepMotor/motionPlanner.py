@@ -0,0 +1,153 @@
+""" Queue of movements of a step motor
+
+Description:
+    moveTo of stepMotorDriver8825 refuses a new movement while the motor is moving,
+    the client has to wait for the stop to demand the next position. This module
+    implements a thread that executes a queue of positions, each one with an optional
+    dwell time in seconds.
+
+    The planner looks ahead: consecutive positions in the same direction without dwell
+    are blended in a single movement, the motor passes the intermediate positions
+    without ramping down and up at each one
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import threading
+from collections import deque
+
+from hardwareBackend import clock
+
+
+def blendMovement(movements, start):
+    """ returns the first movement of movements from start blending the following ones
+        in the same direction: (position, dwell, number of movements blended) """
+    position, dwell = movements[0]
+    direction = position > start
+    count = 1
+    while (dwell == 0 and count < len(movements)):
+        nextPosition, nextDwell = movements[count]
+        if (nextPosition == position or (nextPosition > position) != direction):
+            break
+        position, dwell = nextPosition, nextDwell
+        count = count + 1
+    return position, dwell, count
+
+
+class motionPlanner(threading.Thread):
+    """ Executes the queued movements of a motor """
+
+    def __init__(self, motorControl):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.motorControl = motorControl
+        #
+        # queued movements (position, dwell in s)
+        self.queue = deque()
+        self.queueLock = threading.Lock()
+        #
+        # movement in execution (position, dwell in s), its start time and estimated duration
+        self.current = None
+        self.currentStart = 0
+        self.currentDuration = 0
+        #
+        # wakes up the planner when a movement is queued or the queue is cleared
+        self.queueEvent = clock.Event()
+        self.idleEvent = clock.Event()
+        self.idleEvent.set()
+        #
+        # movements executed and positions blended into other movements
+        self.executed = 0
+        self.blended = 0
+        self.loop_active = True
+        self.start()
+
+    def enqueue(self, position, dwell = 0):
+        """ adds a movement to the queue, the motor waits dwell seconds at position """
+        with self.queueLock:
+            self.queue.append((position, dwell))
+            self.idleEvent.clear()
+        self.queueEvent.set()
+
+    def clear(self):
+        """ drops the queued movements, the current one is completed """
+        with self.queueLock:
+            self.queue.clear()
+        self.queueEvent.set()
+
+    def getQueueDepth(self):
+        """ return the movements pending, the current one included """
+        with self.queueLock:
+            return len(self.queue) + (1 if self.current != None else 0)
+
+    def getEstimatedCompletion(self):
+        """ return the estimated seconds until the queue is completed """
+        with self.queueLock:
+            pending = list(self.queue)
+            current = self.current
+        eta = 0
+        position = self.motorControl.getCurrPlatePosition()
+        if (current != None):
+            eta = max(0, self.currentStart + self.currentDuration - clock.time())
+            position = current[0]
+        while (len(pending) > 0):
+            target, dwell, count = blendMovement(pending, position)
+            eta = eta + self.motorControl.estimateMoveTime(target, position) + dwell
+            position = target
+            pending = pending[count:]
+        return eta
+
+    def waitQueueEnd(self, timeout = None):
+        """ waits until all the queued movements are completed, False on timeout """
+        return self.idleEvent.wait(timeout)
+
+    def nextMovement(self):
+        """ takes the next movement from the queue blending the following ones in the same direction """
+        with self.queueLock:
+            if (len(self.queue) == 0):
+                return None
+            start = self.motorControl.getCurrPlatePosition()
+            position, dwell, count = blendMovement(self.queue, start)
+            for i in range(count):
+                self.queue.popleft()
+            self.blended = self.blended + count - 1
+            self.current = (position, dwell)
+            self.currentStart = clock.time()
+            self.currentDuration = self.motorControl.estimateMoveTime(position, start) + dwell
+            return self.current
+
+    #
+    # infinite loop of the thread
+    def run(self):
+        #
+        # on the simulator the clock waits for this thread
+        with clock.participant():
+            while self.loop_active:
+                self.queueEvent.wait()
+                self.queueEvent.clear()
+                while self.loop_active:
+                    movement = self.nextMovement()
+                    if (movement == None):
+                        break
+                    position, dwell = movement
+                    #
+                    # the motor could be moving due to a direct demand
+                    while (self.loop_active and not clock.result(self.motorControl.moveTo(position))):
+                        self.motorControl.waitMovementEnd(0.1)
+                    self.motorControl.waitMovementEnd()
+                    self.executed = self.executed + 1
+                    if (dwell > 0):
+                        clock.sleep(dwell)
+                    with self.queueLock:
+                        self.current = None
+                with self.queueLock:
+                    if (len(self.queue) == 0):
+                        self.idleEvent.set()
+
+    #
+    # collaboative method to terminale
+    def terminate(self):
+        self.clear()
+        self.loop_active = False
+        self.queueEvent.set()
@@ -0,0 +1,76 @@
+""" Motion state of a step motor shared by several threads
+
+Description:
+    The pigpio callback thread, the control thread of the driver, the TCP connections
+    and the GUI use the motion state of the motor at the same time. This module
+    implements a compact record of the state that is never modified once published:
+    a writer builds a new record and replaces the reference, a reader takes the
+    reference once and sees a consistent state without locks.
+
+    The step callback does not publish records, it only increments an edge counter.
+    The position and the pending steps are derived from the edges counted since
+    the record was published
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+
+#
+# direction of stepMotorDriver8825.MOVE_BACKWARD
+MOVE_BACKWARD = 0
+
+
+class motionState:
+    """ published motion state of a motor, it is not modified after it is published """
+
+    __slots__ = ("inMovement", "lookingForReference", "moveToDemanded", "updatePosition", "moveDirection",
+                 "stepMicrosteps", "baseMicrosteps", "baseEdges", "stopAtEdges")
+
+    def __init__(self, baseMicrosteps = 0, stepMicrosteps = 1, moveDirection = 1):
+        self.inMovement = False
+        self.lookingForReference = False
+        self.moveToDemanded = False
+        self.updatePosition = False
+        self.moveDirection = moveDirection
+        #
+        # microsteps of each step edge
+        self.stepMicrosteps = stepMicrosteps
+        #
+        # position in microsteps when the edge counter was baseEdges
+        self.baseMicrosteps = baseMicrosteps
+        self.baseEdges = 0
+        #
+        # edge count that completes the current moveTo
+        self.stopAtEdges = 0
+
+    def copy(self):
+        """ returns a record with the same state to be modified before publishing it """
+        state = motionState.__new__(motionState)
+        for name in self.__slots__:
+            setattr(state, name, getattr(self, name))
+        return state
+
+    def positionAt(self, edges):
+        """ position in microsteps when the edge counter is edges """
+        if (not self.updatePosition):
+            return self.baseMicrosteps
+        moved = (edges - self.baseEdges) * self.stepMicrosteps
+        if (self.moveDirection == MOVE_BACKWARD):
+            return self.baseMicrosteps - moved
+        return self.baseMicrosteps + moved
+
+    def pendingAt(self, edges):
+        """ steps pending to complete the moveTo when the edge counter is edges """
+        return self.stopAtEdges - edges
+
+
+def stateField(name, doc = None):
+    """ property of the driver that reads name from its published state and publishes a new state on write """
+    def get(self):
+        return getattr(self.state, name)
+
+    def set(self, value):
+        self.publishState(**{name: value})
+
+    return property(get, set, doc = doc)
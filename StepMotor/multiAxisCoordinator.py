@@ -0,0 +1,260 @@
+""" Synchronized movements of several step motors
+
+Description:
+    pigpio has a single waveform transmitter, the motors can not send their own
+    waveforms at the same time. This module implements a thread that moves several
+    stepMotorDriver8825 at once with a combined waveform: the motor with more steps
+    leads and the steps of the others are distributed along the movement (Bresenham),
+    so all the motors start and arrive together.
+
+    The lead motor follows a constant acceleration ramp. The steps are not repeated
+    as in waveMotionEngine, the movement is sent in segments of about SEGMENT_TIME
+    seconds queued with WAVE_MODE_ONE_SHOT_SYNC while the previous one is sent
+
+    All the motors have to share the same pigpio connection. The motors are claimed
+    in their control threads, after the commands already queued on them: the
+    coordinated movement is refused if any of them is moving, and the commands
+    queued on a motor meanwhile find it in movement
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import math
+import threading
+from concurrent.futures import Future
+
+from hardwareBackend import pigpio, clock
+
+from waveMotionEngine import waveMotionEngine, waveCache
+
+
+class multiAxisCoordinator(threading.Thread):
+    """ Moves several motors with one combined waveform """
+
+    #
+    # target duration of each segment in seconds, a stop is applied at the next segment
+    SEGMENT_TIME = 0.1
+
+    #
+    # maximum steps of a segment, two segments and the one in construction must fit in pigpio
+    MAX_SEGMENT_STEPS = 1000
+
+    def __init__(self, drivers, acceleration = waveMotionEngine.DEFAULT_ACCELERATION, startFreq = waveMotionEngine.DEFAULT_START_FREQ):
+        self.drivers = list(drivers)
+        if (len(self.drivers) == 0):
+            raise ValueError("no motors to coordinate")
+        self.gpioControl = self.drivers[0].gpioControl
+        for driver in self.drivers:
+            if (driver.gpioControl is not self.gpioControl):
+                raise ValueError("the coordinated motors must share the pigpio connection")
+        self.acceleration = acceleration
+        self.startFreq = startFreq
+        self.cache = waveCache.forConnection(self.gpioControl)
+        #
+        # movement to execute: positions of the motors and the Future of moveTo
+        self.plan = None
+        self.planLock = threading.Lock()
+        self.inMovement = False
+        self.stopDemanded = False
+        #
+        # wakes up the thread when a movement is demanded, set when no movement is in progress
+        self.motionEvent = clock.Event()
+        self.idleEvent = clock.Event()
+        self.idleEvent.set()
+        self.segmentCount = 0
+        #
+        # steps of each motor sent in the current movement
+        self.stepsDone = []
+        self.loop_active = True
+        threading.Thread.__init__(self)
+        self.start()
+
+    def isMoving(self):
+        """ True while a coordinated movement is in progress """
+        return self.inMovement
+
+    def moveTo(self, positions):
+        """ moves each motor to its position (None to keep it), all of them arrive together.
+            returns a Future with False if a motor is in movement """
+        future = Future()
+        with self.planLock:
+            if (self.inMovement or len(positions) != len(self.drivers)):
+                future.set_result(False)
+                return future
+            self.inMovement = True
+            self.stopDemanded = False
+            self.idleEvent.clear()
+            self.plan = (list(positions), future)
+        self.motionEvent.set()
+        return future
+
+    def claimAxis(self, driver, position):
+        """ runs in the control thread of driver: marks it in movement towards position,
+            returns its steps (0 to keep it) or None if it is moving """
+        if (driver.inMovement or (driver.motionEngine != None and driver.motionEngine.isBusy())):
+            return None
+        axisSteps = 0
+        if (position != None):
+            axisSteps, direction = driver.stepsTo(position)
+        if (axisSteps > 0):
+            driver.publishState(moveDirection = direction, inMovement = True)
+            driver.idleEvent.clear()
+            driver.gpioControl.write(driver.dirPin, driver.moveDirection)
+        return axisSteps
+
+    def releaseAxis(self, driver, axisSteps):
+        """ runs in the control thread of driver: the movement has ended after axisSteps steps """
+        moved = axisSteps * driver.stepMicrosteps
+        if (driver.moveDirection == driver.MOVE_BACKWARD):
+            moved = -moved
+        driver.publishState(positionMicrosteps = driver.positionMicrosteps + moved, inMovement = False)
+        driver.notifyMovementEnd()
+
+    def claimAxes(self, positions):
+        """ claims all the motors, returns the steps of each one or None (nothing is claimed) if a motor is moving """
+        claims = [driver.submitCommand(self.claimAxis, driver, position) for driver, position in zip(self.drivers, positions)]
+        steps = [clock.result(claim) for claim in claims]
+        if (None in steps):
+            for driver, axisSteps in zip(self.drivers, steps):
+                if (axisSteps != None and axisSteps > 0):
+                    driver.submitCommand(self.releaseAxis, driver, 0)
+            return None
+        return steps
+
+    def stop(self):
+        """ ramps down the current movement, the positions of the motors are kept exact """
+        if (self.inMovement):
+            self.stopDemanded = True
+
+    def waitMovementEnd(self, timeout = None):
+        """ waits until the current movement ends, False on timeout """
+        return self.idleEvent.wait(timeout)
+
+    def stepFrequency(self, step, end, leadFreq):
+        """ frequency of the lead motor in a step of a movement of end steps """
+        distance = min(step, end - 1 - step)
+        return min(leadFreq, math.sqrt(self.startFreq ** 2 + 2 * self.acceleration * distance))
+
+    def createSegment(self, pulses, duration):
+        """ creates the waveform of a segment and pins it in the cache, returns its key """
+        if (not self.cache.makeRoom(len(pulses))):
+            raise ValueError("segment of " + str(len(pulses)) + " pulses does not fit in pigpio")
+        self.gpioControl.wave_add_new()
+        self.gpioControl.wave_add_generic(pulses)
+        waveId = self.gpioControl.wave_create()
+        self.segmentCount = self.segmentCount + 1
+        key = ("segment", id(self), self.segmentCount)
+        self.cache.add(key, waveId, duration / 1000000.0, len(pulses))
+        self.cache.pin(self, waveId)
+        return key
+
+    def execute(self, steps, leadFreq):
+        """ sends the movement segment by segment, the steps sent of each motor are kept in stepsDone """
+        leadSteps = max(steps)
+        end = leadSteps
+        masks = [1 << driver.stepPin for driver in self.drivers]
+        errors = [leadSteps // 2] * len(steps)
+        done = [0] * len(steps)
+        self.stepsDone = done
+        sentKeys = []
+        step = 0
+        while (step < end):
+            #
+            # the stop shortens the movement to ramp down from the current frequency
+            if (self.stopDemanded):
+                self.stopDemanded = False
+                rampSteps = int(math.ceil((leadFreq ** 2 - self.startFreq ** 2) / (2.0 * self.acceleration)))
+                end = min(end, step + min(step, end - 1 - step, max(rampSteps, 0)) + 1)
+
+            pulses = []
+            duration = 0
+            segmentSteps = 0
+            while (step < end and segmentSteps < self.MAX_SEGMENT_STEPS and duration < self.SEGMENT_TIME * 1000000):
+                mask = 0
+                for axis in range(len(steps)):
+                    errors[axis] = errors[axis] - steps[axis]
+                    if (errors[axis] < 0):
+                        errors[axis] = errors[axis] + leadSteps
+                        mask = mask | masks[axis]
+                        done[axis] = done[axis] + 1
+                period = int(round(1000000.0 / self.stepFrequency(step, end, leadFreq)))
+                highTime = period // 2
+                pulses.append(pigpio.pulse(mask, 0, highTime))
+                pulses.append(pigpio.pulse(0, mask, period - highTime))
+                duration = duration + period
+                segmentSteps = segmentSteps + 1
+                step = step + 1
+
+            key = self.createSegment(pulses, duration)
+            waveId = self.cache.entries[key][0]
+            if (len(sentKeys) == 0):
+                self.gpioControl.wave_send_using_mode(waveId, pigpio.WAVE_MODE_ONE_SHOT)
+                for axis in range(len(steps)):
+                    if (steps[axis] > 0):
+                        self.drivers[axis].notifyMovementStart()
+            else:
+                self.gpioControl.wave_send_using_mode(waveId, pigpio.WAVE_MODE_ONE_SHOT_SYNC)
+                #
+                # the previous segment can be deleted when this one starts
+                while (self.gpioControl.wave_tx_busy() == 1 and self.gpioControl.wave_tx_at() != waveId):
+                    clock.sleep(0.001)
+                self.cache.evict(sentKeys.pop(0))
+            sentKeys.append(key)
+
+        while (self.gpioControl.wave_tx_busy() == 1):
+            clock.sleep(0.001)
+        for key in sentKeys:
+            self.cache.evict(key)
+        self.cache.unpin(self)
+
+    #
+    # infinite loop of the thread
+    def run(self):
+        #
+        # on the simulator the clock waits for this thread
+        with clock.participant():
+            while self.loop_active:
+                self.motionEvent.wait()
+                self.motionEvent.clear()
+                if (self.plan != None):
+                    positions, future = self.plan
+                    self.plan = None
+                    steps = self.claimAxes(positions)
+                    future.set_result(steps != None)
+                    if (steps != None and max(steps) > 0):
+                        self.move(steps)
+                    with self.planLock:
+                        self.inMovement = False
+                        self.idleEvent.set()
+
+    def move(self, steps):
+        """ moves the motors claimed, steps of each one """
+        leadSteps = max(steps)
+        #
+        # the lead frequency is limited so no motor runs faster than its stepMotorFreq
+        leadFreq = min([driver.stepMotorFreq * leadSteps / float(axisSteps) for driver, axisSteps in zip(self.drivers, steps) if axisSteps > 0])
+        try:
+            self.execute(steps, leadFreq)
+        except (pigpio.error, ValueError) as e:
+            #
+            # the last segment built may not be sent, the positions are approximate.
+            # only the segments of this movement are deleted, the cache is shared with the engines
+            print("coordinated movement error: ", e)
+            self.gpioControl.wave_tx_stop()
+            for key in [key for key in self.cache.entries if key[0:2] == ("segment", id(self))]:
+                self.cache.evict(key)
+            self.cache.unpin(self)
+        #
+        # the steps sent are exact, the positions do not depend on the step count
+        for driver, axisSteps, axisDone in zip(self.drivers, steps, self.stepsDone):
+            if (axisSteps > 0):
+                driver.submitCommand(self.releaseAxis, driver, axisDone)
+
+    #
+    # collaboative method to terminale
+    def terminate(self):
+        self.stop()
+        self.waitMovementEnd()
+        self.loop_active = False
+        self.motionEvent.set()
@@ -0,0 +1,169 @@
+""" Batched counting of step edges through the pigpio notification pipe
+
+Description:
+    A pigpio callback calls python on every edge of the step count pin, at high
+    step rates the GIL is always busy and edges are lost. This module implements
+    a thread that reads the notification pipe of pigpio (notify_open) in blocks,
+    counts the rising edges and reports them in batches on a configurable cadence.
+    The batch is reported at once when the expected number of steps is reached
+
+    Each report of the pipe has 12 bytes: seqno (H), flags (H), tick (I), level (I)
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import os
+import select
+import struct
+import threading
+import time
+
+#
+# size and format of a pigpio notification report
+REPORT_SIZE = 12
+REPORT_FORMAT = "<HHII"
+
+#
+# reports read from the pipe in one go
+REPORTS_PER_READ = 1024
+
+#
+# shorter waits for edges to pile up are not worth a sleep
+MIN_WAIT = 0.0005
+
+
+class notifyStepCounter(threading.Thread):
+    """ counts the rising edges of a pin reading the pigpio notification pipe """
+
+    #
+    # pipe created by pigpio for each notification handle
+    PIPE_PATH = "/dev/pigpio%d"
+
+    #
+    # default time between batches in seconds
+    DEFAULT_CADENCE = 0.005
+
+    def __init__(self, gpioControl, pin, onSteps, cadence = DEFAULT_CADENCE):
+        """ onSteps(steps) is called from the counter thread with each batch """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.gpioControl = gpioControl
+        self.mask = 1 << pin
+        self.onSteps = onSteps
+        self.cadence = cadence
+        #
+        # the batch is reported at once when it reaches flushAt steps
+        self.flushAt = None
+        #
+        # steps counted since the last batch and total
+        self.pendingSteps = 0
+        self.totalSteps = 0
+        #
+        # offset in a report of the level byte with our pin and table to map it to 0 / 1
+        self.levelOffset = 8 + pin // 8
+        self.levelTable = bytes([int((value >> (pin % 8)) & 1) for value in range(256)])
+        self.lastLevel = b"\x00"
+        self.loop_active = True
+
+        self.handle = self.gpioControl.notify_open()
+        self.fd = os.open(self.PIPE_PATH % self.handle, os.O_RDONLY | os.O_NONBLOCK)
+        self.gpioControl.notify_begin(self.handle, self.mask)
+        self.start()
+
+    def countReports(self, data):
+        """ counts the rising edges in data, returns the bytes of an incomplete report """
+        usable = len(data) - len(data) % REPORT_SIZE
+        reports = usable // REPORT_SIZE
+        if (data[2:usable:REPORT_SIZE].count(0) == reports and data[3:usable:REPORT_SIZE].count(0) == reports):
+            #
+            # only level reports: the byte of the level with our pin is mapped to 0 / 1
+            # and the rising edges are the "01" sequences, counted without a python loop
+            levels = data[self.levelOffset:usable:REPORT_SIZE].translate(self.levelTable)
+            rising = (self.lastLevel + levels).count(b"\x00\x01")
+            if (reports > 0):
+                self.lastLevel = levels[-1:]
+        else:
+            rising = 0
+            lastLevel = self.lastLevel
+            for seqno, flags, tick, level in struct.iter_unpack(REPORT_FORMAT, data[:usable]):
+                #
+                # watchdog, keep alive and event reports do not carry levels
+                if (flags == 0):
+                    level = b"\x01" if (level & self.mask) else b"\x00"
+                    if (level == b"\x01" and lastLevel == b"\x00"):
+                        rising = rising + 1
+                    lastLevel = level
+            self.lastLevel = lastLevel
+        self.pendingSteps = self.pendingSteps + rising
+        self.totalSteps = self.totalSteps + rising
+        return data[usable:]
+
+    def flush(self):
+        """ reports the steps counted since the last batch """
+        steps = self.pendingSteps
+        self.pendingSteps = 0
+        flushAt = self.flushAt
+        if (flushAt != None):
+            self.flushAt = flushAt - steps
+        if (steps > 0):
+            self.onSteps(steps)
+
+    def run(self):
+        remainder = b""
+        lastFlush = time.monotonic()
+        lastRead = lastFlush
+        #
+        # current steps per second
+        rate = 0
+        while self.loop_active:
+            #
+            # with no steps to report we wait for the next edge
+            timeout = None
+            if (self.pendingSteps > 0):
+                timeout = max(0, self.cadence - (time.monotonic() - lastFlush))
+            ready = select.select([self.fd], [], [], timeout)[0]
+            if (len(ready) > 0):
+                try:
+                    data = os.read(self.fd, REPORT_SIZE * REPORTS_PER_READ)
+                except BlockingIOError:
+                    data = b""
+                except OSError:
+                    break
+                if (len(data) == 0 and len(remainder) == 0):
+                    #
+                    # the writer closed the pipe
+                    time.sleep(self.cadence)
+                counted = self.pendingSteps
+                remainder = self.countReports(remainder + data)
+                now = time.monotonic()
+                if (now > lastRead):
+                    rate = (self.pendingSteps - counted) / (now - lastRead)
+                lastRead = now
+
+            now = time.monotonic()
+            flushAt = self.flushAt
+            #
+            # report at once the step that completes the expected ones
+            if (now - lastFlush >= self.cadence or (flushAt != None and self.pendingSteps >= flushAt)):
+                self.flush()
+                lastFlush = now
+            elif (self.pendingSteps > 0):
+                #
+                # let the edges pile up in the pipe until the next batch, but
+                # wake up before the expected steps are reached
+                wait = self.cadence - (now - lastFlush)
+                if (flushAt != None and rate > 0):
+                    wait = min(wait, (flushAt - self.pendingSteps) / rate / 2)
+                if (wait > MIN_WAIT):
+                    time.sleep(wait)
+        os.close(self.fd)
+
+    #
+    # collaboative method to terminale
+    def terminate(self):
+        self.loop_active = False
+        try:
+            self.gpioControl.notify_close(self.handle)
+        except:
+            print("error closing notification handle")
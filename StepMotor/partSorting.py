@@ -5,7 +5,11 @@ Description:
 
     * When the sation starts it moves the platform until "origin" is found
     * The PC can issue the command "?" to chek if a part is present, the station will answer
-    with "Y<cr><lf>" or "N<cr><lf>" depending if a part is present or not
+    with "Y<cr><lf>" or "N<cr><lf>" depending if a part is present or not. The pin is filtered
+    in the background (the level has to be stable 0.2 s), the answer is immediate. Until the
+    pin has been filtered once after the start the state is unknown, it is answered "?<cr><lf>"
+    * "P" the station sends "Y<cr><lf>" / "N<cr><lf>" each time the part state changes, without
+    being asked ("P" again to stop), it is answered with "OK<cr><lf>"
     * The PC checks the parts:
        * if part is accepted the control PC sends a "A" message, the station moves
        the motor in ACEPTATION_DIR until the platform returns to "origin". In this moment the station
@@ -13,11 +17,13 @@ Description:
        * if part is rejected the control PC sends a "R" message, the station moves
        the motor in REJECTION_DIR until the platform returns to "origin". In this moment the station
        returns the mesage "OK<cr><lf>"
+       * if a step loss stops the plate before the "origin" the movement is answered "KO<cr><lf>"
     * Other messages:
        * "D"  to change the part aceptation direction, the station performs a 360 round and answers with
        "OK<cr><fl>"
        * "+": increments speed, it is answered with "OK<cr><lf>"
        * "-": increments speed, it is answered with "OK<cr><lf>"
+       * "V<RPM>": sets the speed (i.e: "V20", 2-88 RPM), it is answered with "OK<cr><lf>"
        * "0"  Set microstep full
           "1" Set microstep 1/2
           "2" Set microstep 1/4
@@ -26,12 +32,19 @@ Description:
           "5" Set microstep 1/32
 
           All are anwered with "OK<cr><lf>"
+
+       A command is a line, several commands can be sent at once ("?<cr><lf>A<cr><lf>"),
+       they are run in order and each one is answered
           
        * "S" to order the station to save the configuration, the answer is "OK<cr><lf>"
        * "H"  A menu with the opions and current cfg is shown
+       * "L"  the latency percentiles of each command are sent, followed by "OK<cr><lf>"
        * "C" to close the connection
 
        Incorrect commands are answered with "KO<cr><lf>"
+
+    Several clients can be connected at once (the line PC, an operator telnet...), the
+    commands of each client are answered in order on its connection
         
 Author:
     Pablo Rodriguez-2018-06-30
@@ -42,439 +55,677 @@ Author:
 
 import time
 import sys
-import RPi.GPIO as GPIO
-import  socket
 import threading
+from hardwareBackend import pigpio, clock
+from collections import deque
+from concurrent.futures import Future
 from  stepMotorDRV8825 import stepMotorDriver8825 
+from commandLatency import commandLatencyRecorder
+from stepLossDetector import describeStepLoss
+from terminalServer import terminalServer, terminalConnection, parseArgument
+from binaryTerminal import binaryConnection, BINARY_PORT, KIND_EVENT, CODE_OK, CODE_BUSY, CODE_IDLE, CODE_BAD_ARGUMENT, CODE_FAILED
+from binaryTerminal import OP_ACCEPT, OP_REJECT, OP_END_MOVEMENT, OP_PART_PRESENT, OP_ACCEPT_DIRECTION, OP_PART_EVENTS
 
-class partSortingTerminalConnection(threading.Thread):
-    """ Connection instance from TCP/IP terminal to control de motor """
-    loop_active = True
-    sock = None
+#
+# configuration saved by the "S" command and loaded at startup
+CFG_FILE_NAME = "partSorting.cfg"
+
+
+class debounceTimer(threading.Thread):
+    """ calls function once interval seconds have passed since the last restart, one
+          thread serves all the restarts (the edges of a bouncing sensor) """
+
+    def __init__(self, interval, function):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.interval = interval
+        self.function = function
+        #
+        # time function is called, None while stopped
+        self.deadline = None
+        self.lock = threading.Lock()
+        self.wakeEvent = clock.Event()
+        self.loop_active = True
+        self.start()
+
+    def restart(self):
+        """ function is called interval seconds from now, can be called from any thread """
+        with self.lock:
+            self.deadline = clock.time() + self.interval
+        self.wakeEvent.set()
+
+    def cancel(self):
+        with self.lock:
+            self.deadline = None
+        self.wakeEvent.set()
+
+    def expired(self):
+        """ True (and stopped) if the deadline has passed """
+        with self.lock:
+            if (self.deadline == None or clock.time() < self.deadline):
+                return False
+            self.deadline = None
+            return True
+
+    def run(self):
+        #
+        # on the simulator the clock waits for this thread
+        with clock.participant():
+            while (self.loop_active):
+                if (self.expired()):
+                    self.function()
+                    continue
+                deadline = self.deadline
+                if (deadline == None):
+                    self.wakeEvent.wait()
+                else:
+                    self.wakeEvent.wait(max(0, deadline - clock.time()))
+                self.wakeEvent.clear()
+
+    def terminate(self):
+        self.loop_active = False
+        self.wakeEvent.set()
+
+class partSortingStation:
+    """ accept / reject movements and part detection of the station, shared by all the
+          connections and only used from the thread of their server """
     motorControl = None
     inOrigin = None
     partDetectionPin = None
-    
+    #
+    # pigpio callback of the origin edges
+    originCallback = None
     
     #
     # direction accept and reject parts
     acceptDirection = None
     rejectDirection = None
-    
 
-    def showMenu(self):
-        try:
-            self.sock.send("\r\n".encode())
-            self.sock.send("=================  Plate control menu ===============\r\n".encode())
-            self.sock.send("\r\n".encode())
-            self.sock.send("                 A.-  Accept part\r\n".encode())
-            self.sock.send("                 R.-  Reject part\r\n".encode())
-            self.sock.send("                 E.-  End current movement\r\n".encode())
-            self.sock.send("                 ?.-  Is part present or not\r\n".encode())
-            self.sock.send("\r\n".encode())
-            self.sock.send("                 D.-  Change Direction of part aceptation\r\n".encode())
-            self.sock.send("                 +.-  Increase Speed \r\n".encode())
-            self.sock.send("                  -.-  Decrease Speed \r\n".encode())
-            self.sock.send("                  S.-  Record configuration \r\n".encode())
-            self.sock.send("\r\n".encode())
-            self.sock.send("                 0.- Set microstep full\r\n".encode())
-            self.sock.send("                 1.- Set microstep 1/2\r\n".encode())
-            self.sock.send("                 2.- Set microstep 1/4\r\n".encode())
-            self.sock.send("                 3.- Set resolution 1/8\r\n".encode())
-            self.sock.send("                 4.- Set microstep 1/16\r\n".encode())
-            self.sock.send("                 5.- Set microstep 1/32\r\n".encode())
-            self.sock.send("\r\n".encode())
-            self.sock.send("                 C.-  Close connection\r\n".encode())
-            self.sock.send("\r\n".encode())
-            self.sock.send(self.motorControl.getCurrParams().encode())
-            self.sock.send("\r\n".encode())
-            self.sock.send("\r\n".encode())
-            
-            self.sock.send("               Type option and press [Enter]:".encode())
-        except:
-            print("Connection, error refreshing menu")
+    #
+    # the plate moves to the origin, once it has left the origin sensor the next
+    # origin edge stops it
+    moving = False
+    waitingOrigin = False
+    stopping = False
+    #
+    # tick of the edge that left the origin, the edges of the next ORIGIN_BOUNCE_US
+    # are the sensor bouncing
+    leftOriginTick = None
+    ORIGIN_BOUNCE_US = 5000
+    #
+    # direction of the last movement stopped by the origin, the plate stops a bit
+    # after the sensor (ramp down)
+    overshootDirection = None
+    #
+    # connection that started the movement and function called when it ends, with
+    # False if a step loss has stopped it (stepLossStop)
+    owner = None
+    movementDone = None
+    stepLossStop = False
+
+    #
+    # filtered state of the part detection pin, the level has to be stable PART_FILTER
+    # seconds (partTimer) to change it. None (unknown) until the pin is filtered once
+    PART_FILTER = 0.2
+    partPresent = None
+    partTimer = None
+    partCallback = None
+    #
+    # functions called with the new state when it changes (of each connection)
+    partListeners = None
 
 
-    def detectedOrigin(self,channel):
-        self.inOrigin  = True
+    def detectedOrigin(self,gpio,level,tick):
+        """ pigpio callback, the edge is processed by the server thread """
+        self.server.callFromThread(self.originEdge, level, tick)
+
+    def detectedPart(self,gpio,level,tick):
+        """ pigpio callback, the filter is restarted, the server thread is called when it ends """
+        self.partEdge()
       
 
     
-    def __init__(self,s=None, motorControl = None, acceptDirection = None):
-        self.sock = s
-        self.sock.settimeout(0.001) # timeout for listening
+    def __init__(self, server, motorControl = None, acceptDirection = None, partFilter = None):
+        self.server = server
         self.motorControl = motorControl
-        self.acceptDirection = acceptDirection
+        self.setAcceptDirection(acceptDirection)
+        if (partFilter == None):
+            partFilter = self.PART_FILTER
+        self.partFilter = partFilter
+        self.partListeners = {}
+        self.partTimer = debounceTimer(partFilter, lambda: self.server.callFromThread(self.partSettled))
+        motorControl.stepLossCallbacks.append(self.stepLost)
         #
         # setup de part detection pin
         self.partDetectionPin = 12
-        GPIO.setup(self.partDetectionPin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-        
+        motorControl.gpioControl.set_mode(self.partDetectionPin, pigpio.INPUT)
+        motorControl.gpioControl.set_pull_up_down(self.partDetectionPin, pigpio.PUD_DOWN)
+
+        self.inOrigin = False
+
+    def setAcceptDirection(self, acceptDirection):
+        self.acceptDirection = acceptDirection
         #
         # calculate reject direction in base to accept direction value
         self.rejectDirection = 1
         if (acceptDirection == 1):
             self.rejectDirection = 0
 
-        self.inOrigin = False
-        
+    def switchDirection(self):
+        """ switch acceptance direction """
+        if (self.acceptDirection == 1):
+            self.setAcceptDirection(0)
+        else:
+            self.setAcceptDirection(1)
+
+    def moveToOrigin(self, direction, owner, movementDone):
+        """ starts the plate in direction, it is stopped when the origin is found (or endMovement),
+            then movementDone(reached) is called, reached is False if a step loss has stopped it.
+            Returns False if the plate is already moving """
+        if (self.moving):
+            return False
         #
-        # capture motor_control referencePin RISING events to start/stop the motor
-        GPIO.add_event_detect(motorControl.referencePIN,GPIO.RISING,callback=self.detectedOrigin)
-    
-        
-        self.loop_active = True
-        threading.Thread.__init__(self)
-        self.start()
-
-    #
-    # closes the current server socket
-    def closeSocket(self):
-        try:
-            self.sock.shutdown(socket.SHUT_RDWR)
-            self.sock.close()
-            print("connection socket closed")
-        except:
-            print("error closing connetion socket")
-    
-    def waitOrigin(self):
-        """ waits until origin is found """
-        commError = False
-        endDemmandArrives = False
+        # capture motor_control referencePin RISING events to stop the motor
+        if (self.originCallback == None):
+            self.originCallback = self.motorControl.gpioControl.callback(self.motorControl.referencePIN,pigpio.EITHER_EDGE,self.detectedOrigin)
+        self.motorControl.startMovementIn(int(direction))
+        self.owner = owner
+        self.movementDone = movementDone
+        self.moving = True
+        self.stopping = False
+        self.stepLossStop = False
+        self.leftOriginTick = None
         #
-        # wait 200 ms
-        time.sleep(0.2)
+        # if the plate is on the origin sensor, or just after it and turns back, the
+        # origin is waited once the plate leaves the sensor
+        self.inOrigin = (self.motorControl.gpioControl.read(self.motorControl.referencePIN) == 1)
+        turnsBack = (self.overshootDirection != None and self.overshootDirection != int(direction))
+        self.waitingOrigin = not (self.inOrigin or turnsBack)
+        return True
+
+    def originEdge(self, level, tick):
+        if (level == 1):
+            self.originReached(tick)
+        else:
+            self.originLeft(tick)
+
+    def originLeft(self, tick):
+        """ the plate has left the origin sensor, from now on the origin edge stops it """
         self.inOrigin = False
-
-        while (not self.inOrigin) and not endDemmandArrives and not commError:
-            #
-            # if "E" is received we stop
-            try:
-                data = self.sock.recv(1024).decode()
-                if (data[0] == "E" or data[0] == "e"):       
-                    endDemmandArrives = True
-            except socket.timeout:
-                pass
-            except:
-                #
-                # otherwise we stuck in the loop
-                commError = True
-                print ("unhandle exception in connection")
-                self.terminate()
+        if (self.moving and not self.stopping):
+            self.waitingOrigin = True
+            self.leftOriginTick = tick
+
+    def originReached(self, tick):
+        self.inOrigin = True
+        if (self.leftOriginTick != None and ((tick - self.leftOriginTick) & 0xFFFFFFFF) < self.ORIGIN_BOUNCE_US):
+            return
+        if (self.waitingOrigin):
+            self.endMovement()
+            self.overshootDirection = self.motorControl.moveDirection
+
+    def endMovement(self):
+        """ stops the plate, movementDone is called when the motor is stopped """
+        if (not self.moving or self.stopping):
+            return
+        self.stopping = True
+        self.waitingOrigin = False
+        self.overshootDirection = None
+        self.motorControl.stopMovement().add_done_callback(lambda stopped: self.server.callFromThread(self.movementEnded))
+
+    def movementEnded(self):
+        movementDone = self.movementDone
+        self.moving = False
+        self.owner = None
+        self.movementDone = None
+        if (movementDone != None):
+            movementDone(not self.stepLossStop)
+
+    def stepLost(self, motorControl, reason, commanded, counted):
+        """ step loss callback (detector thread), the plate does not reach the origin """
+        self.server.callFromThread(self.movementFailed, reason, commanded, counted)
+
+    def movementFailed(self, reason, commanded, counted):
+        print(describeStepLoss(reason, commanded, counted))
+        if (self.moving and not self.stopping):
+            self.stepLossStop = True
+            self.endMovement()
             
+    def watchPart(self):
+        """ starts the filter of the part detection pin, called once the server runs.
+            the state is unknown until the level has been stable partFilter seconds """
+        self.partCallback = self.motorControl.gpioControl.callback(self.partDetectionPin,pigpio.EITHER_EDGE,self.detectedPart)
+        self.partTimer.restart()
+
+    def partEdge(self):
+        """ the pin has changed, its level is taken once it is stable partFilter seconds """
+        self.partTimer.restart()
+
+    def partSettled(self):
+        present = (self.motorControl.gpioControl.read(self.partDetectionPin) == 1)
+        if (present != self.partPresent):
+            self.partPresent = present
+            for partChanged in list(self.partListeners.values()):
+                partChanged(present)
+
     def isPartPresent(self):
-        """ check if a part is present a small filter of 0.2 s is used"""
-        retVal = False
+        """ filtered state of the part detection pin, None if it is not known yet """
+        return self.partPresent
+
+    def connectionClosed(self, connection):
+        """ the plate is stopped if it was moving for the connection """
+        self.partListeners.pop(connection, None)
+        if (self.owner == connection):
+            self.movementDone = None
+            self.endMovement()
+
+    def terminate(self):
+        if (self.originCallback != None):
+            self.originCallback.cancel()
+        if (self.partCallback != None):
+            self.partCallback.cancel()
+        self.partTimer.terminate()
+        if (self.stepLost in self.motorControl.stepLossCallbacks):
+            self.motorControl.stepLossCallbacks.remove(self.stepLost)
+
+
+class partSortingTerminalConnection(terminalConnection):
+    """ Connection instance from TCP/IP terminal to control de motor """
+    motorControl = None
+    station = None
+    #
+    # latencies of the commands of the motor
+    latency = None
+    #
+    # letters of the commands, their latencies are measured apart
+    COMMANDS = "?012345ACDEHLPRSV+-"
 
-        if (GPIO.input(self.partDetectionPin) == 1):
-            time.sleep(0.2)
-            if (GPIO.input(self.partDetectionPin) == 1):
-                retVal = True
+    #
+    # commands received while other is in progress, (text, latency record)
+    commands = None
+    #
+    # latency record of the command in progress (a movement to the origin), its Future
+    # is done when it is answered
+    pending = None
+    pendingDone = None
+    
+
+    #
+    # static part of the menu, encoded once for all the connections
+    MENU = ("\r\n"
+            "=================  Plate control menu ===============\r\n"
+            "\r\n"
+            "                 A.-  Accept part\r\n"
+            "                 R.-  Reject part\r\n"
+            "                 E.-  End current movement\r\n"
+            "                 ?.-  Is part present or not\r\n"
+            "\r\n"
+            "                 D.-  Change Direction of part aceptation\r\n"
+            "                 +.-  Increase Speed \r\n"
+            "                  -.-  Decrease Speed \r\n"
+            "                  V.-  Set Speed (V<RPM>, 2-88) \r\n"
+            "                  S.-  Record configuration \r\n"
+            "                  L.-  Command latencies \r\n"
+            "\r\n"
+            "                 0.- Set microstep full\r\n"
+            "                 1.- Set microstep 1/2\r\n"
+            "                 2.- Set microstep 1/4\r\n"
+            "                 3.- Set resolution 1/8\r\n"
+            "                 4.- Set microstep 1/16\r\n"
+            "                 5.- Set microstep 1/32\r\n"
+            "\r\n"
+            "                 C.-  Close connection\r\n"
+            "\r\n").encode()
+
+    def showMenu(self):
+        try:
+            self.sendMenu(self.MENU, self.motorControl.getCurrParams())
+        except:
+            print("Connection, error refreshing menu")
 
-        return retVal
+    
+    def __init__(self, server, s, motorControl = None, station = None):
+        terminalConnection.__init__(self, server, s)
+        self.motorControl = motorControl
+        self.station = station
+        self.latency = commandLatencyRecorder.forMotor(motorControl, self.COMMANDS)
+        self.commands = deque()
+
+    def movementEnded(self, reached):
+        """ the plate is stopped in the origin, KO if a step loss has stopped it before """
+        print ("sending answer: ", reached)
+        if (reached):
+            self.finish("OK\r\n")
+        else:
+            self.finish("KO\r\n")
+
+    def partChanged(self, present):
+        """ the state of the part is sent without being asked ("P") """
+        if (present == None):
+            self.send("?\r\n")
+        elif (present):
+            self.send("Y\r\n")
+        else:
+            self.send("N\r\n")
 
     def searchOrigin(self):
         """ similates a rejection to search the origin"""
-        self.motorControl.moveDirection = int(self.rejectDirection)
-        self.motorControl.startMovement()
-        self.waitOrigin()
+        self.station.moveToOrigin(self.station.rejectDirection, self, None)
+
+    def finish(self, answer):
+        """ answers the movement in progress, the commands received meanwhile are run """
+        command = self.pending
+        self.pending = None
+        self.pendingDone.set_result(True)
+        self.send(answer)
+        self.latency.answered(command)
+        self.runCommands()
+
+    def commandReceived(self, data):
         #
-        # after the origin is found we clean PC input buffer
-        try:
-            data = self.sock.recv(1024).decode()
-        except socket.timeout:
-            pass
-        except:
-            print ("unhandle exception in connection")
-            self.terminate()
+        # if "E" is received we stop
+        if (self.station.moving and (data[0] == "E" or data[0] == "e")):
+            self.station.endMovement()
+            return
+        self.commands.append((data, self.latency.received(data[0])))
+        self.runCommands()
+
+    def runCommands(self):
+        """ runs the commands received in order, until one is in progress """
+        while (len(self.commands) > 0 and self.pending == None and self.active and not self.closing):
+            data, command = self.commands.popleft()
+            self.execute(data, command)
    
-    def run(self):
+    def execute(self, data, command):
+        result = None
+        answerOK = False
         #
         # if an answer has to be sent back
-        sendAnswer = False
-        #
-        # search origin
-        #self.searchOrigin()
+        sendAnswer = True
         
-        while self.loop_active:
+        if (data[0] == "C" or data[0] == "c"):
+           self.terminate()
+           #
+           # the connection sockect is closed,we can't answer
+           sendAnswer = False
+           
+           
+        if (data[0] == "S" or data[0] == "s"):
             try:
-                data = self.sock.recv(1024).decode()
-            except socket.timeout:
-                pass
+                currRPM = int(round(self.motorControl.getCurrRPM()))
+                currMicrostepCfg = self.motorControl.getCurrMicrostepCfg()
+                
+                cfgFile = open(CFG_FILE_NAME, "w")
+                cfgFile.write(str(self.station.acceptDirection)+"\n")
+                cfgFile.write(str(currRPM)+"\n")
+                cfgFile.write(str(currMicrostepCfg)+"\n")
+               
+                cfgFile.close()
+
+                answerOK = True
+                
             except:
-                print ("unhandle exception in connection")
-                self.terminate()
+                print("Imposible to save configuration file!")
+
+        #
+        # part is accepted, answered when the plate is back in the origin
+        if (data[0] == "A" or data[0] == "a"):
+            if (self.station.moveToOrigin(self.station.acceptDirection, self, self.movementEnded)):
+                self.pending = command
+                self.pendingDone = result = Future()
+                sendAnswer = False
+
+        #
+        # reject movement, answered when the plate is back in the origin
+        if (data[0] == "R" or data[0] == "r"):
+            if (self.station.moveToOrigin(self.station.rejectDirection, self, self.movementEnded)):
+                self.pending = command
+                self.pendingDone = result = Future()
+                sendAnswer = False
+
+        #
+        # is part present, the filtered state of the pin
+        if (data[0] == "?"):
+            self.partChanged(self.station.isPartPresent())
+            sendAnswer = False
+
+        #
+        # the changes of the part state are sent without being asked (on / off)
+        if (data[0] == "P" or data[0] == "p"):
+            if (self in self.station.partListeners):
+                del self.station.partListeners[self]
             else:
-                if (len(data) >= 1):
-                    answerOK = False
-                    sendAnswer = True
-                    
-                    if (data[0] == "C" or data[0] == "c"):
-                       self.terminate()
-                       #
-                       # the connection sockect is closed,we can't answer
-                       sendAnswer = False
-                       
-                       
-                    if (data[0] == "S" or data[0] == "s"):
-                        try:
-                            currRPM = int(self.motorControl.getCurrRPM())
-                            currMicrostepCfg = self.motorControl.getCurrMicrostepCfg()
-                            
-                            cfgFile = open(CFG_FILE_NAME, "w")
-                            cfgFile.write(str(self.acceptDirection)+"\n")
-                            cfgFile.write(str(currRPM)+"\n")
-                            cfgFile.write(str(currMicrostepCfg)+"\n")
-                           
-                            cfgFile.close()
-
-                            answerOK = True
-                            
-                        except:
-                            print("Imposible to save configuration file!")
-
-                    #
-                    # part is accepted
-                    if (data[0] == "A" or data[0] == "a"):
-                        self.motorControl.moveDirection = int(self.acceptDirection)
-                        self.motorControl.startMovement()
-                        self.waitOrigin()
-                        self.motorControl.stopMovement()
-                        answerOK = True
-
-                    #
-                    # reject movement
-                    if (data[0] == "R" or data[0] == "r"):
-                        self.motorControl.moveDirection = int(self.rejectDirection)
-                        self.motorControl.startMovement()
-                        self.waitOrigin()
-                        self.motorControl.stopMovement()
-                        answerOK = True
-
-                    #
-                    # reject movement
-                    if (data[0] == "?"):
-                        if (self.isPartPresent()):
-                            self.sock.send("Y\r\n".encode())
-                            sendAnswer = False
-                        else:
-                            self.sock.send("N\r\n".encode())
-                            sendAnswer = False
-
-                    #
-                    # switch acceptance direction
-                    if (data[0] == "D" or data[0] == "d"):
-                        if (self.acceptDirection == 1):
-                            self.acceptDirection = 0
-                            self.rejectDirection = 1
-                        else:
-                            self.acceptDirection = 1
-                            self.rejectDirection = 0
-                        answerOK = True
-
-                      #
-                      # changes on  microstep relation
-                    if (data[0] == "0"):
-                        self.motorControl.setMicrostepCfg(self.motorControl.MICROSTEP_RELATION_1)
-                        answerOK = True
-                        
-                    if (data[0] == "1"):
-                        self.motorControl.setMicrostepCfg(self.motorControl.MICROSTEP_RELATION_2)
-                        answerOK = True
-                        
-                    if (data[0] == "2"):
-                        self.motorControl.setMicrostepCfg(self.motorControl.MICROSTEP_RELATION_4)
-                        answerOK = True
-                        
-                    if (data[0] == "3"):
-                        self.motorControl.setMicrostepCfg(self.motorControl.MICROSTEP_RELATION_8)
-                        answerOK = True
-                        
-                    if (data[0] == "4"):
-                        self.motorControl.setMicrostepCfg(self.motorControl.MICROSTEP_RELATION_16)
-                        answerOK = True
-                        
-                    if (data[0] == "5"):
-                        self.motorControl.setMicrostepCfg(self.motorControl.MICROSTEP_RELATION_32)
-                        answerOK = True
-                        
-                    #
-                    # speed up and down
-                    if (data[0] == "+"):
-                        #
-                        # maximun of 44-45 RPM
-                        if (self.motorControl.getCurrRPM() < 88):
-                            newRPM = int(round(self.motorControl.getCurrRPM())) + 1
-                            self.motorControl.changeSpeed(newRPM)
-                        answerOK = True
-                        
-                    if (data[0] == "-"):
-                        #
-                        # minimum of 1-2 RPM
-                        if (self.motorControl.getCurrRPM() > 2):
-                            newRPM = int(round(self.motorControl.getCurrRPM())) - 1
-                            self.motorControl.changeSpeed(newRPM)
-                        answerOK = True
-
-                    #
-                    # show help menu
-                    if (data[0] == "H" or data[0] == "h"):
-                        self.showMenu();
-                        answerOK = True
-
-                    #
-                    # in case an answer is needed
-                    if (sendAnswer):
-                        sendAnswer = False
-                        print ("sending answer: ", answerOK)
-                        if (answerOK):
-                            self.sock.send("OK\r\n".encode())
-                        else:
-                            self.sock.send("KO\r\n".encode())
-                        
+                self.station.partListeners[self] = self.partChanged
+            answerOK = True
+
+        #
+        # switch acceptance direction
+        if (data[0] == "D" or data[0] == "d"):
+            self.station.switchDirection()
+            answerOK = True
+
+          #
+          # changes on  microstep relation
+        if (data[0] == "0"):
+            self.motorControl.setMicrostepCfg(self.motorControl.MICROSTEP_RELATION_1)
+            answerOK = True
             
-    #
-    # collaboative method to terminale
-    def terminate(self):
-        self.loop_active = False
-        try:
-            self.motorControl.stopMovement();
-            GPIO.remove_event_detect(self.motorControl.referencePIN)
-            self.sock.send("\r\n".encode())
-            self.sock.send("Connection Closed\r\n".encode())
-            self.sock.send("\r\n".encode())
-            self.closeSocket()
-        except:
-            print ("Unhandle terminating Connection")
+        if (data[0] == "1"):
+            self.motorControl.setMicrostepCfg(self.motorControl.MICROSTEP_RELATION_2)
+            answerOK = True
+            
+        if (data[0] == "2"):
+            self.motorControl.setMicrostepCfg(self.motorControl.MICROSTEP_RELATION_4)
+            answerOK = True
+            
+        if (data[0] == "3"):
+            self.motorControl.setMicrostepCfg(self.motorControl.MICROSTEP_RELATION_8)
+            answerOK = True
+            
+        if (data[0] == "4"):
+            self.motorControl.setMicrostepCfg(self.motorControl.MICROSTEP_RELATION_16)
+            answerOK = True
             
+        if (data[0] == "5"):
+            self.motorControl.setMicrostepCfg(self.motorControl.MICROSTEP_RELATION_32)
+            answerOK = True
+            
+        #
+        # speed up and down
+        if (data[0] == "+"):
+            #
+            # maximun of 44-45 RPM
+            result = self.motorControl.changeSpeedBy(1, 2, 88)
+            answerOK = True
+            
+        if (data[0] == "-"):
+            #
+            # minimum of 1-2 RPM
+            result = self.motorControl.changeSpeedBy(-1, 2, 88)
+            answerOK = True
 
-class partSortingTerminalServer(threading.Thread):
+        if (data[0] == "V" or data[0] == "v"):
+            newRPM = parseArgument(data, 2, 88)
+            if (newRPM != None):
+                result = self.motorControl.changeSpeed(newRPM)
+                answerOK = True
+
+        #
+        # show help menu
+        if (data[0] == "H" or data[0] == "h"):
+            self.showMenu();
+            answerOK = True
+
+        #
+        # latencies of the commands
+        if (data[0] == "L" or data[0] == "l"):
+            for line in self.latency.formatReport():
+                self.send(line + "\r\n")
+            answerOK = True
+
+        self.latency.handled(command, result)
+
+        #
+        # in case an answer is needed
+        if (sendAnswer):
+            print ("sending answer: ", answerOK)
+            if (answerOK):
+                self.send("OK\r\n")
+            else:
+                self.send("KO\r\n")
+        if (self.pending == None):
+            self.latency.answered(command)
+
+    def closed(self):
+        """ the plate is stopped if it was moving for this connection """
+        self.station.connectionClosed(self)
+
+
+class partSortingBinaryConnection(binaryConnection):
+    """ binary protocol of the station, the motor operations and the parts """
+
+    OPERATIONS = dict(binaryConnection.OPERATIONS)
+    OPERATIONS.update({OP_ACCEPT: ("opAccept", "!"),
+                       OP_REJECT: ("opReject", "!"),
+                       OP_END_MOVEMENT: ("opEndMovement", "!"),
+                       OP_PART_PRESENT: ("opPartPresent", "!"),
+                       OP_ACCEPT_DIRECTION: ("opAcceptDirection", "!B"),
+                       OP_PART_EVENTS: ("opPartEvents", "!B")})
+
+    MAX_RPM = 88
+
+    def __init__(self, server, s, motorControl = None, station = None):
+        binaryConnection.__init__(self, server, s, motorControl)
+        self.station = station
+
+    def closed(self):
+        binaryConnection.closed(self)
+        self.station.connectionClosed(self)
+
+    def moveToOrigin(self, requestId, direction):
+        if (self.station.moveToOrigin(direction, self, lambda reached: self.complete(requestId, CODE_OK if reached else CODE_FAILED))):
+            self.reply(requestId, CODE_OK)
+        else:
+            self.reply(requestId, CODE_BUSY)
+
+    def opAccept(self, requestId):
+        self.moveToOrigin(requestId, self.station.acceptDirection)
+
+    def opReject(self, requestId):
+        self.moveToOrigin(requestId, self.station.rejectDirection)
+
+    def opEndMovement(self, requestId):
+        if (self.station.moving):
+            self.station.endMovement()
+            self.reply(requestId, CODE_OK)
+        else:
+            self.reply(requestId, CODE_IDLE)
+
+    def opPartPresent(self, requestId):
+        """ BUSY until the sensor has been filtered once """
+        present = self.station.isPartPresent()
+        if (present == None):
+            self.reply(requestId, CODE_BUSY)
+        else:
+            self.reply(requestId, CODE_OK, "!B", int(present))
+
+    def opPartEvents(self, requestId, enabled):
+        """ the changes of the part state are sent as EVENTs of requestId """
+        if (enabled > 1):
+            self.reply(requestId, CODE_BAD_ARGUMENT)
+            return
+        self.station.partListeners.pop(self, None)
+        if (enabled):
+            self.station.partListeners[self] = lambda present: self.answer(KIND_EVENT, requestId, CODE_OK, "!B", int(present))
+        self.reply(requestId, CODE_OK)
+
+    def opAcceptDirection(self, requestId, acceptDirection):
+        if (acceptDirection > 1):
+            self.reply(requestId, CODE_BAD_ARGUMENT)
+        else:
+            self.station.setAcceptDirection(acceptDirection)
+            self.reply(requestId, CODE_OK)
+            
+
+class partSortingTerminalServer(terminalServer):
     """ TCP/IP socket server class that admit connections of 12345
           on connection a partSortingTerminalConnection is created to
-          process command to control de step motor """
+          process command to control de step motor, and connections of the
+          binary protocol on 12346, all the clients are served by the thread
+          of the server """
     
-    loop_active = True
-    TCP_IP = '0.0.0.0'
-    TCP_PORT = 12345
-    BUFFER_SIZE = 1024  # Normally 1024, but we want fast response
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    s.bind((TCP_IP, TCP_PORT))
-    s.listen(1)
-    client = None
+    BINARY_PORT = BINARY_PORT
     motorControl = None
     #
-    # part aceptance rotation direction
-    acceptDirection = None
-
-    def isActive(self):
-        return self.loop_active
-    
+    # accept / reject movements of the plate, shared by the connections
+    station = None
 
     def __init__(self, motorControl = None, acceptDirection = None):
         self.motorControl= motorControl
-        self.loop_active = True
-        self.acceptDirection = acceptDirection
-        threading.Thread.__init__(self)
-        self.start()
+        self.station = partSortingStation(self, motorControl, acceptDirection)
+        terminalServer.__init__(self, partSortingTerminalConnection, partSortingBinaryConnection, (motorControl, self.station))
+        self.station.watchPart()
 
-    #
-    # closes the current server socket
-    def closeSocket(self):
-        try:
-            self.s.close()
-            print("server socket closed")
-        except:
-            print("error closing server socket")
-    
-    def run(self):
-        print("Wating client ...")
-        while self.loop_active:
-            try:
-                self.s.settimeout(1) # timeout for listening
-                self.s.listen(1)
-                (conn, (ip, port)) = self.s.accept()
-            except socket.timeout:
-                pass
-            except:
-                print ("Unhandle exception ControlTerminal")
-                self.terminate()
-            else:
-                # work with the connection, create a thread etc.
-                print("connection!")
-                #
-                # if a previous connection exits, drop it
-                if (not self.client == None):
-                    print ("Finishing previous clonnection...")
-                    self.client.terminate()
-                    time.sleep(1)
-                    self.client = None
-                    
-                self.client = partSortingTerminalConnection(conn,self.motorControl, self.acceptDirection)                   
-    #
-    # collaboative method to terminale
     def terminate(self):
-        self.loop_active = False
-        try:           
-            if (not self.client == None):
-                print ("Finishing client ...")
-                self.client.terminate()
-        except:
-            print ("Unhandle terminating ControlTerminal")
-
-        self.closeSocket()
+        terminalServer.terminate(self)
+        self.station.terminate()
 
 """ *****************************  MAIN APP *******************************************  """
-CFG_FILE_NAME = "partSorting.cfg"
-
 #
-# create the plate control thread 
-motor_control = stepMotorDriver8825()
+# the station runs when the module is the script, importing it does not start it
+if (__name__ == "__main__"):
+    #
+    # create the plate control thread, a jammed plate is stopped as soon as the steps are lost
+    motor_control = stepMotorDriver8825(detectStepLoss = True)
 
-#
-# direction to accept the parts
-acceptDirection = None
+    #
+    # direction to accept the parts
+    acceptDirection = None
 
-#
-# load ans set configuration
-try:
-    cfgFile = open(CFG_FILE_NAME, "r")
-    acceptDirection = cfgFile.readline()
-    speedRMP = cfgFile.readline()
-    microstripCfg = cfgFile.readline()
-    cfgFile.close()
-
-    motor_control.moveDirection = int(acceptDirection)
-    motor_control.setMicrostepCfg(int(microstripCfg))
-    motor_control.changeSpeed(int(speedRMP))
-except:
-    print("imposible to load cfg file, using defaults")
-    acceptDirection = 1
-    
+    #
+    # load ans set configuration
+    try:
+        cfgFile = open(CFG_FILE_NAME, "r")
+        acceptDirection = cfgFile.readline()
+        speedRMP = cfgFile.readline()
+        microstripCfg = cfgFile.readline()
+        cfgFile.close()
+
+        motor_control.moveDirection = int(acceptDirection)
+        motor_control.setMicrostepCfg(int(microstripCfg))
+        motor_control.changeSpeed(int(speedRMP))
+    except:
+        print("imposible to load cfg file, using defaults")
+        acceptDirection = 1
+
+
+    def helicopterStartStop(gpio, level, tick):
+        """ start or stop helicopter depending on current status"""
+        if (motor_control.inMovement):
+            motor_control.stopMovement()
+        else:
+            motor_control.startMovement()
 
-def helicopterStartStop(channel):
-    """ start or stop helicopter depending on current status"""
-    if (motor_control.inMovement):
-        motor_control.stopMovement()
-    else:
-        motor_control.startMovement()
+    #
+    # capture motor_control referencePin RISING events to start/stop the motor
+    #motor_control.gpioControl.callback(motor_control.referencePIN,pigpio.RISING_EDGE,helicopterStartStop)
 
-#
-# capture motor_control referencePin RISING events to start/stop the motor
-#GPIO.add_event_detect(motor_control.referencePIN,GPIO.RISING,callback=helicopterStartStop)
+    #
+    # create TCP-IP server to build remote control connections
+    control_terminal = partSortingTerminalServer(motor_control,int(acceptDirection))
 
-#
-# create TCP-IP server to build remote control connections
-control_terminal = partSortingTerminalServer(motor_control,int(acceptDirection))
 
+    while (control_terminal.isActive()):
+        time.sleep(0.5)
 
-while (control_terminal.isActive()):
-    time.sleep(0.5)
+    #
+    # kill plate control terminal
+    control_terminal.terminate()
 
-#
-# kill plate control terminal
-control_terminal.terminate()
+    #
+    # kill  plate control thread
+    motor_control.terminate()
 
-#
-# kill  plate control thread
-motor_control.terminate()
+    #
+    # where the time of the commands went
+    commandLatencyRecorder.forMotor(motor_control).dump()
@@ -0,0 +1,145 @@
+""" pigpio client library on the simulated hardware
+
+Description:
+    Offers the part of the pigpio API used by the step motor control on the
+    simulated PI of hardwareSimulator: all the pi connections share its pins and
+    its DMA transmitter, as the connections to pigpiod do. The ticks are the
+    virtual time in us.
+
+    hardwareBackend uses this module as pigpio when the simulator is selected
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import hardwareSimulator
+from hardwareSimulator import (RISING_EDGE, FALLING_EDGE, EITHER_EDGE, WAVE_MODE_ONE_SHOT, WAVE_MODE_REPEAT,
+                               WAVE_MODE_ONE_SHOT_SYNC, WAVE_MODE_REPEAT_SYNC, NO_TX_WAVE)
+
+INPUT = 0
+OUTPUT = 1
+
+PUD_OFF = 0
+PUD_DOWN = 1
+PUD_UP = 2
+
+#
+# wave_tx_at of a waveform that does not exist
+WAVE_NOT_FOUND = 9998
+
+
+class error(Exception):
+    """ error returned by the daemon """
+    pass
+
+
+class pulse:
+    """ a pulse of a waveform """
+
+    def __init__(self, gpio_on, gpio_off, delay):
+        self.gpio_on = gpio_on
+        self.gpio_off = gpio_off
+        self.delay = delay
+
+
+class pi:
+    """ connection to the simulated PI """
+
+    def __init__(self, host = "localhost", port = 8888):
+        self.hardware = hardwareSimulator.hardware
+        self.connected = True
+
+    def get_current_tick(self):
+        return self.hardware.tick()
+
+    def set_mode(self, gpio, mode):
+        self.hardware.modes[gpio] = mode
+        return 0
+
+    def set_pull_up_down(self, gpio, pud):
+        return 0
+
+    def read(self, gpio):
+        return self.hardware.read(gpio)
+
+    def write(self, gpio, level):
+        self.hardware.write(gpio, level)
+        return 0
+
+    def read_bank_1(self):
+        return self.hardware.readBank()
+
+    def set_bank_1(self, bits):
+        self.hardware.writeBank(bits, 0)
+        return 0
+
+    def clear_bank_1(self, bits):
+        self.hardware.writeBank(0, bits)
+        return 0
+
+    def set_PWM_frequency(self, user_gpio, frequency):
+        return self.hardware.setPwmFrequency(user_gpio, frequency)
+
+    def set_PWM_dutycycle(self, user_gpio, dutycycle):
+        self.hardware.setPwmDutycycle(user_gpio, dutycycle)
+        return 0
+
+    def hardware_PWM(self, gpio, PWMfreq, PWMduty):
+        self.hardware.hardwarePwm(gpio, PWMfreq, PWMduty)
+        return 0
+
+    def callback(self, user_gpio, edge = RISING_EDGE, func = None):
+        return self.hardware.addCallback(user_gpio, edge, func)
+
+    def wave_clear(self):
+        self.hardware.waveClear()
+        return 0
+
+    def wave_add_new(self):
+        self.hardware.waveAddNew()
+        return 0
+
+    def wave_add_generic(self, pulses):
+        return self.hardware.waveAddGeneric([(p.gpio_on, p.gpio_off, p.delay) for p in pulses])
+
+    def wave_create(self):
+        waveId = self.hardware.waveCreate()
+        if (waveId == None):
+            raise error("no more waveform ids")
+        return waveId
+
+    def wave_delete(self, wave_id):
+        self.hardware.waveDelete(wave_id)
+        return 0
+
+    def wave_chain(self, data):
+        self.hardware.waveChain(data)
+        return 0
+
+    def wave_send_using_mode(self, wave_id, mode):
+        if (wave_id not in self.hardware.waves):
+            raise error("unknown wave id")
+        self.hardware.waveSend(wave_id, mode)
+        return 0
+
+    def wave_tx_at(self):
+        return self.hardware.waveAt()
+
+    def wave_tx_busy(self):
+        return int(self.hardware.waveBusy())
+
+    def wave_tx_stop(self):
+        self.hardware.waveStop()
+        return 0
+
+    def wave_get_max_pulses(self):
+        return hardwareSimulator.MAX_PULSES
+
+    def wave_get_max_cbs(self):
+        return hardwareSimulator.MAX_CBS
+
+    def notify_open(self):
+        raise error("notifications are not simulated")
+
+    def stop(self):
+        self.connected = False
@@ -0,0 +1,248 @@
+""" Generation of the square signal of the step pin at any frequency
+
+Description:
+    The PWM of pigpio only offers 18 frequencies with the default sample rate
+    (10 Hz to 8000 Hz). This module implements backends that produce any step
+    rate up to the limit of the hardware and report the achieved frequency:
+       * hardwarePwmFrequencyBackend: hardware PWM, only on GPIO 12, 13, 18 and 19
+       * waveFrequencyBackend: a one step pigpio waveform repeated, 1 us resolution
+       * pwmFrequencyBackend: the PWM of pigpio, the frequency is quantized
+
+    createFrequencyBackend selects the best backend for a pin. pigpio has a single
+    waveform transmitter: waveFrequencyBackend only uses it when nobody else owns it
+    (claimWaveTransmitter), otherwise it uses the PWM of its pin, so several motors
+    can step at the same time
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+from hardwareBackend import pigpio
+
+#
+# the DRV8825 needs pulses of at least 1.9 us high and low
+MAX_STEP_FREQ = 250000
+
+#
+# slowest step rate
+MIN_STEP_FREQ = 1
+
+#
+# pins with hardware PWM
+HARDWARE_PWM_PINS = [12, 13, 18, 19]
+
+#
+# frequencies of the pigpio PWM with the default sample rate of 5 us
+PWM_FREQUENCIES = [10,20,40,50,80,100,160,200,250,320,400,500,800,1000,1600,2000,4000,8000]
+
+
+#
+# owner of the waveform transmitter of each pigpio connection
+transmitterOwners = {}
+
+
+def claimWaveTransmitter(gpioControl, owner):
+    """ owner takes the waveform transmitter of gpioControl, returns False if other owns it """
+    if (transmitterOwners.get(gpioControl, owner) is not owner):
+        return False
+    transmitterOwners[gpioControl] = owner
+    return True
+
+
+def releaseWaveTransmitter(gpioControl, owner):
+    """ owner leaves the waveform transmitter of gpioControl """
+    if (transmitterOwners.get(gpioControl) is owner):
+        del transmitterOwners[gpioControl]
+
+
+def clampFrequency(freq):
+    """ returns freq within the range the backends can produce """
+    return min(max(freq, MIN_STEP_FREQ), MAX_STEP_FREQ)
+
+
+class pwmFrequencyBackend:
+    """ PWM of pigpio, the frequency is quantized to the available ones """
+
+    def __init__(self, gpioControl, pin):
+        self.gpioControl = gpioControl
+        self.pin = pin
+        self.requestedFrequency = None
+        self.achievedFrequency = None
+        self.running = False
+
+    def achieved(self, freq):
+        """ returns the frequency produced when freq is demanded """
+        return min(PWM_FREQUENCIES, key = lambda available: abs(available - freq))
+
+    def setFrequency(self, freq):
+        """ sets the step frequency, returns the achieved one """
+        self.requestedFrequency = freq
+        self.achievedFrequency = self.gpioControl.set_PWM_frequency(self.pin, int(round(clampFrequency(freq))))
+        return self.achievedFrequency
+
+    def commandedFrequency(self):
+        """ returns the frequency being produced on the pin, 0 if it is stopped """
+        if (self.running):
+            return self.achievedFrequency
+        return 0
+
+    def start(self):
+        """ starts the pulses on the pin """
+        self.running = True
+        self.gpioControl.set_PWM_dutycycle(self.pin, 128)
+
+    def stop(self):
+        """ stops the pulses on the pin """
+        self.running = False
+        self.gpioControl.set_PWM_dutycycle(self.pin, 0)
+
+
+class hardwarePwmFrequencyBackend(pwmFrequencyBackend):
+    """ hardware PWM of the PI, only available on some pins """
+
+    #
+    # the range of the PWM is the integral part of 250 MHz divided by the frequency
+    PWM_CLOCK = 250000000
+
+    #
+    # 50% duty cycle in pigpio units
+    DUTY_CYCLE = 500000
+
+    def achieved(self, freq):
+        """ returns the frequency produced when freq is demanded """
+        return self.PWM_CLOCK / float(int(self.PWM_CLOCK / clampFrequency(freq)))
+
+    def setFrequency(self, freq):
+        """ sets the step frequency, returns the achieved one """
+        self.requestedFrequency = freq
+        self.achievedFrequency = self.achieved(freq)
+        if (self.running):
+            self.gpioControl.hardware_PWM(self.pin, int(round(clampFrequency(freq))), self.DUTY_CYCLE)
+        return self.achievedFrequency
+
+    def start(self):
+        """ starts the pulses on the pin """
+        self.running = True
+        self.gpioControl.hardware_PWM(self.pin, int(round(clampFrequency(self.requestedFrequency))), self.DUTY_CYCLE)
+
+    def stop(self):
+        """ stops the pulses on the pin """
+        self.running = False
+        self.gpioControl.hardware_PWM(self.pin, 0, 0)
+
+
+class waveFrequencyBackend(pwmFrequencyBackend):
+    """ a waveform of one step sent repeatedly, the period has a resolution of 1 us.
+          if the transmitter is owned by other (or pigpio has no room for the waveform)
+          the movement uses the PWM of the pin """
+
+    def __init__(self, gpioControl, pin):
+        pwmFrequencyBackend.__init__(self, gpioControl, pin)
+        #
+        # last waveform sent, the previous one is sent until the end of its cycle
+        self.waveId = None
+        #
+        # frequency of each waveform not deleted yet
+        self.waveFrequencies = {}
+        #
+        # the movement in progress is sent with waveforms, or with the PWM of the pin
+        self.usingWaves = False
+        self.pwm = pwmFrequencyBackend(gpioControl, pin)
+
+    def achieved(self, freq):
+        """ returns the frequency produced when freq is demanded """
+        if (self.running and not self.usingWaves):
+            return self.pwm.achieved(freq)
+        return 1000000.0 / int(round(1000000.0 / clampFrequency(freq)))
+
+    def setFrequency(self, freq):
+        """ sets the step frequency, returns the achieved one """
+        self.requestedFrequency = freq
+        if (self.running and not self.usingWaves):
+            self.achievedFrequency = self.pwm.setFrequency(freq)
+            return self.achievedFrequency
+        self.achievedFrequency = self.achieved(freq)
+        if (self.running):
+            self.send()
+        return self.achievedFrequency
+
+    def commandedFrequency(self):
+        """ returns the frequency of the waveform being sent, the lowest one sent if it is unknown,
+            0 if it is stopped """
+        if (not self.running):
+            return 0
+        if (not self.usingWaves):
+            return self.pwm.commandedFrequency()
+        waveId = self.gpioControl.wave_tx_at()
+        if (waveId in self.waveFrequencies):
+            return self.waveFrequencies[waveId]
+        return min(self.waveFrequencies.values())
+
+    def send(self):
+        """ sends the waveform of the current frequency, the change happens at the end of a step """
+        mask = 1 << self.pin
+        period = int(round(1000000.0 / self.achievedFrequency))
+        try:
+            self.gpioControl.wave_add_new()
+            self.gpioControl.wave_add_generic([pigpio.pulse(mask, 0, period // 2), pigpio.pulse(0, mask, period - period // 2)])
+            waveId = self.gpioControl.wave_create()
+        except pigpio.error:
+            #
+            # no room for the waveform in pigpio, the movement goes on with the PWM
+            print("Step frequency, no room for the waveform, using the PWM")
+            self.usePwm()
+            return
+        self.waveFrequencies[waveId] = self.achievedFrequency
+        self.gpioControl.wave_send_using_mode(waveId, pigpio.WAVE_MODE_REPEAT_SYNC)
+        self.waveId = waveId
+        #
+        # the waveforms that are not sent any more are deleted: a waveform replaced before it
+        # started, or the previous one once its cycle ended. all of them have the same size,
+        # pigpio reuses the resources of the deleted ones
+        sending = self.gpioControl.wave_tx_at()
+        for oldWaveId in list(self.waveFrequencies.keys()):
+            if (oldWaveId != waveId and oldWaveId != sending):
+                self.gpioControl.wave_delete(oldWaveId)
+                del self.waveFrequencies[oldWaveId]
+
+    def stopWaves(self):
+        """ stops the waveforms and leaves the transmitter """
+        self.gpioControl.wave_tx_stop()
+        for waveId in self.waveFrequencies.keys():
+            self.gpioControl.wave_delete(waveId)
+        self.waveId = None
+        self.waveFrequencies = {}
+        self.usingWaves = False
+        releaseWaveTransmitter(self.gpioControl, self)
+
+    def usePwm(self):
+        """ the movement in progress goes on with the PWM of the pin """
+        if (self.usingWaves):
+            self.stopWaves()
+        self.achievedFrequency = self.pwm.setFrequency(self.requestedFrequency)
+        self.pwm.start()
+
+    def start(self):
+        """ starts the pulses on the pin """
+        self.running = True
+        if (claimWaveTransmitter(self.gpioControl, self)):
+            self.usingWaves = True
+            self.achievedFrequency = self.achieved(self.requestedFrequency)
+            self.send()
+        else:
+            self.usePwm()
+
+    def stop(self):
+        """ stops the pulses on the pin """
+        self.running = False
+        if (self.usingWaves):
+            self.stopWaves()
+        else:
+            self.pwm.stop()
+
+
+def createFrequencyBackend(gpioControl, pin):
+    """ returns the backend to generate any frequency on pin """
+    if (pin in HARDWARE_PWM_PINS):
+        return hardwarePwmFrequencyBackend(gpioControl, pin)
+    return waveFrequencyBackend(gpioControl, pin)
@@ -0,0 +1,149 @@
+""" Detection of lost steps and stalls of a step motor
+
+Description:
+    The steps the driver commands and the steps counted on the step count pin should
+    match, when the motor jams or the driver misses pulses they diverge. This module
+    implements a thread that every few ms compares:
+       * the commanded steps, the commanded frequency integrated over the elapsed time
+       * the counted steps, the edge counter of the driver
+
+    The step path does no extra work, the detector only reads the edge counter.
+    A loss is flagged when:
+       * divergence: the counted steps are behind the commanded ones by more than tolerance
+       * stall: no step is counted during several periods of the commanded frequency
+
+    The edges of the last latency seconds may not be counted yet (the pigpio callbacks
+    are delivered in batches), they are not demanded. While ramping the lowest frequency
+    of the ramp is integrated, the commanded steps are never overestimated
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import threading
+
+from hardwareBackend import clock
+
+#
+# reasons of a step loss
+STEP_LOSS_DIVERGENCE = "divergence"
+STEP_LOSS_STALL = "stall"
+
+
+def describeStepLoss(reason, commanded, counted):
+    """ text of a step loss for the terminals """
+    return "step loss (" + reason + "): commanded " + str(commanded) + " steps, counted " + str(counted)
+
+
+class stepLossDetector(threading.Thread):
+    """ compares the commanded and counted steps of a motor while it moves """
+
+    #
+    # seconds between checks while the motor moves
+    DEFAULT_PERIOD = 0.002
+
+    #
+    # seconds between checks while the motor is stopped
+    IDLE_PERIOD = 0.02
+
+    #
+    # seconds the step edges can take to be counted, the callbacks of pigpio
+    # and the python threads can be delayed some ms
+    DEFAULT_LATENCY = 0.015
+
+    #
+    # steps the count can be behind the commanded steps
+    DEFAULT_TOLERANCE = 4
+
+    #
+    # a stall is flagged when no step is counted during STALL_PERIODS periods
+    # of the commanded frequency, and at least during MIN_STALL_TIME seconds
+    STALL_PERIODS = 4
+    MIN_STALL_TIME = 0.005
+
+    # motorControl must offer idleEvent, edgeCount and getCommandedFrequency(),
+    # onStepLoss(reason, commanded, counted) is called from this thread on each loss
+    def __init__(self, motorControl, onStepLoss, period = DEFAULT_PERIOD, latency = DEFAULT_LATENCY, tolerance = DEFAULT_TOLERANCE):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.motorControl = motorControl
+        self.onStepLoss = onStepLoss
+        self.period = period
+        self.latency = latency
+        self.tolerance = tolerance
+        self.loop_active = True
+        #
+        # commanded steps and edge counter when the count started
+        self.commanded = 0.0
+        self.baseEdges = 0
+        #
+        # frequency and time of the previous check, None when the motor was stopped
+        self.lastFreq = 0
+        self.lastCheck = None
+        #
+        # last edge counter read and when it changed
+        self.lastEdges = 0
+        self.lastEdgeTime = 0
+        #
+        # statistics
+        self.checks = 0
+        self.losses = 0
+        self.start()
+
+    def reset(self, edges, now):
+        """ starts counting the commanded and counted steps again """
+        self.commanded = 0.0
+        self.baseEdges = edges
+        self.lastEdges = edges
+        self.lastEdgeTime = now
+        self.lastFreq = 0
+        self.lastCheck = now
+
+    def check(self, now = None):
+        """ compares the commanded and counted steps, returns the reason of a loss or None """
+        if (now == None):
+            now = clock.time()
+        self.checks = self.checks + 1
+        freq = self.motorControl.getCommandedFrequency()
+        edges = self.motorControl.edgeCount
+        if (freq <= 0 or self.lastCheck == None):
+            self.reset(edges, now)
+            if (freq > 0):
+                self.lastFreq = freq
+            return None
+        #
+        # the lowest of the frequencies at both ends of the interval, it is not overestimated while ramping
+        self.commanded = self.commanded + min(freq, self.lastFreq) * (now - self.lastCheck)
+        self.lastFreq = freq
+        self.lastCheck = now
+        if (edges != self.lastEdges):
+            self.lastEdges = edges
+            self.lastEdgeTime = now
+        counted = edges - self.baseEdges
+
+        reason = None
+        if (self.commanded - freq * self.latency - counted > self.tolerance):
+            reason = STEP_LOSS_DIVERGENCE
+        elif (now - self.lastEdgeTime > max(self.MIN_STALL_TIME, self.STALL_PERIODS / float(freq)) + self.latency):
+            reason = STEP_LOSS_STALL
+        if (reason != None):
+            self.losses = self.losses + 1
+            commanded = int(self.commanded)
+            self.reset(edges, now)
+            self.onStepLoss(reason, commanded, counted)
+        return reason
+
+    def run(self):
+        #
+        # on the simulator the clock waits for this thread
+        with clock.participant():
+            while (self.loop_active):
+                if (self.motorControl.idleEvent.is_set()):
+                    self.lastCheck = None
+                    clock.sleep(self.IDLE_PERIOD)
+                else:
+                    self.check()
+                    clock.sleep(self.period)
+
+    def terminate(self):
+        self.loop_active = False
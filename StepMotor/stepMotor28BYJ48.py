@@ -0,0 +1,588 @@
+""" Control of unipolar step motor 28BYJ-48
+
+Description:
+    This module implements a class to control the unipolar 28BYJ-48 step motor
+    (ULN2003 board) with the same interface as stepMotorDriver8825: moveTo,
+    startMovement, stopMovement, changeSpeed, switchDirection, getCurrParams...
+    so it can be used by the TCP-IP terminals of the DRV8825 and the helicopter.
+
+    The coil sequences are sent as pigpio waveforms (coilWaveMotionEngine), the
+    DMA of the PI emits each phase with exact timing and python does no work per
+    step:
+       * full step (MICROSTEP_RELATION_1): two coils on, 2048 steps per revolution
+       * half step (MICROSTEP_RELATION_2): one or two coils on, 4096 steps per revolution
+    The movements ramp up and down, a moveTo emits exactly the demanded steps.
+
+    The position is counted in half steps from the edges of the coils, the phase
+    of the coils is the position modulo the 8 phases of the half step sequence
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from hardwareBackend import pigpio, clock
+from gpioBank import gpioBank, bankMask
+from waveMotionEngine import waveMotionEngine, waveCache
+
+#
+# coils on in each phase of the half step sequence, the full step sequence is every other phase
+HALF_STEP_SEQUENCE = [[1,1,0,0],
+                      [0,1,0,0],
+                      [0,1,1,0],
+                      [0,0,1,0],
+                      [0,0,1,1],
+                      [0,0,0,1],
+                      [1,0,0,1],
+                      [1,0,0,0]]
+
+PHASES = len(HALF_STEP_SEQUENCE)
+
+
+class coilWaveMotionEngine(waveMotionEngine):
+    """ Builds and sends the waveforms of the coil sequence of a unipolar motor
+
+    Each step is a pulse that sets the coils of the next phase. The waveforms depend
+    on the phase they start at, it is part of their keys in the cache. A cruise waveform
+    is a whole turn of the sequence so it can be repeated """
+
+    #
+    # the 28BYJ-48 is geared down 1:64, it accelerates slower than a NEMA 17
+    DEFAULT_ACCELERATION = 2000
+
+    def __init__(self, gpioControl, coilPins, acceleration = DEFAULT_ACCELERATION,
+                 startFreq = waveMotionEngine.DEFAULT_START_FREQ, cache = None):
+        waveMotionEngine.__init__(self, gpioControl, coilPins[0], acceleration, startFreq, cache)
+        self.stepMask = bankMask(coilPins)
+        #
+        # (coils on, coils off) masks of each phase
+        self.phaseMasks = []
+        for phase in HALF_STEP_SEQUENCE:
+            coilsOn = bankMask([pin for pin, level in zip(coilPins, phase) if level == 1])
+            self.phaseMasks.append((coilsOn, self.stepMask & ~coilsOn))
+
+    def createWave(self, frequencies, phase, delta):
+        """ creates a waveform with a step at each frequency from phase, delta phases each step.
+            returns its id, duration in s and pulses """
+        pulses = []
+        duration = 0
+        for freq in frequencies:
+            phase = (phase + delta) % PHASES
+            period = int(round(1000000.0 / freq))
+            pulses.append(pigpio.pulse(self.phaseMasks[phase][0], self.phaseMasks[phase][1], period))
+            duration = duration + period
+
+        if (not self.cache.makeRoom(len(pulses))):
+            raise ValueError("waveform of " + str(len(pulses)) + " pulses does not fit in pigpio")
+        self.gpioControl.wave_add_new()
+        self.gpioControl.wave_add_generic(pulses)
+        waveId = self.gpioControl.wave_create()
+        return waveId, duration / 1000000.0, len(pulses)
+
+    def segmentWave(self, key, frequencies):
+        """ returns the id and duration of the waveform of key, it is created if not cached.
+            the keys are (segment, coil mask, start phase, delta, ...) """
+        entry = self.cache.get(key)
+        if (entry == None):
+            entry = self.cache.add(key, *self.createWave(list(frequencies), key[2], key[3]))
+        self.cache.pin(self, entry[0])
+        self.waves.append(entry[0])
+        if (key[0] == "cruise"):
+            self.waveFrequencies[entry[0]] = key[-1]
+        else:
+            self.waveFrequencies[entry[0]] = self.startFreq
+        return entry[0], entry[1]
+
+    def compile(self, key, steps, targetFreq, ramp):
+        """ builds the wave_chain of a movement from the phase and delta of key[0],
+            returns the chain, its duration and ramp down key """
+        phase, delta = key[0]
+        rampFreqs = []
+        if (ramp):
+            rampFreqs = self.rampFrequencies(targetFreq, steps)
+        cruiseSteps = steps - 2 * len(rampFreqs)
+        rampKey = (self.startFreq, targetFreq, self.acceleration, len(rampFreqs))
+
+        chain = []
+        duration = 0
+        keys = []
+        decelKey = None
+        if (len(rampFreqs) > 0):
+            keys.append(("ramp up", self.stepMask, phase, delta) + rampKey)
+            accelWave, accelDuration = self.segmentWave(keys[-1], rampFreqs)
+            chain.append(accelWave)
+            duration = duration + accelDuration
+            phase = (phase + delta * len(rampFreqs)) % PHASES
+        if (cruiseSteps > 0):
+            #
+            # the turns of the sequence are repeated, the remaining steps go in their own waveform
+            turnSteps = PHASES // abs(delta)
+            turns, remaining = divmod(cruiseSteps, turnSteps)
+            if (turns > 0):
+                keys.append(("cruise", self.stepMask, phase, delta, turnSteps, targetFreq))
+                cruiseWave, cruiseDuration = self.segmentWave(keys[-1], [targetFreq] * turnSteps)
+                chain = chain + self.loopChain(cruiseWave, turns)
+                duration = duration + cruiseDuration * turns
+            if (remaining > 0):
+                keys.append(("cruise", self.stepMask, phase, delta, remaining, targetFreq))
+                remainingWave, remainingDuration = self.segmentWave(keys[-1], [targetFreq] * remaining)
+                chain.append(remainingWave)
+                duration = duration + remainingDuration
+                phase = (phase + delta * remaining) % PHASES
+        if (len(rampFreqs) > 0):
+            decelKey = ("ramp down", self.stepMask, phase, delta) + rampKey
+            keys.append(decelKey)
+            decelWave, decelDuration = self.segmentWave(decelKey, reversed(rampFreqs))
+            chain.append(decelWave)
+            duration = duration + decelDuration
+
+        return chain, duration, decelKey, keys
+
+    def compileContinuous(self, targetFreq, ramp, microstepCfg):
+        """ builds the waveforms of a continuous movement from the phase and delta of microstepCfg,
+            returns the ramp up (None if no ramp) and cruise waveforms """
+        phase, delta = microstepCfg
+        rampFreqs = []
+        if (ramp):
+            rampFreqs = self.rampFrequencies(targetFreq)
+        rampKey = (self.startFreq, targetFreq, self.acceleration, len(rampFreqs))
+        accelWave = None
+        if (len(rampFreqs) > 0):
+            accelWave, accelDuration = self.segmentWave(("ramp up", self.stepMask, phase, delta) + rampKey, rampFreqs)
+            phase = (phase + delta * len(rampFreqs)) % PHASES
+        turnSteps = PHASES // abs(delta)
+        cruiseWave, cruiseDuration = self.segmentWave(("cruise", self.stepMask, phase, delta, turnSteps, targetFreq),
+                                                      [targetFreq] * turnSteps)
+        if (len(rampFreqs) > 0):
+            #
+            # a cruise turn ends at the phase it started, the ramp down starts there
+            self.decelWave, self.decelDuration = self.segmentWave(("ramp down", self.stepMask, phase, delta) + rampKey,
+                                                                  reversed(rampFreqs))
+        return accelWave, cruiseWave
+
+    def stop(self):
+        """ stops the current movement, returns the ramp down duration in seconds.
+            a moveTo in progress stops at once, its ramp down would not start at the phase of the coils """
+        if (self.isBusy() and not self.continuous):
+            self.gpioControl.wave_tx_stop()
+            return 0
+        return waveMotionEngine.stop(self)
+
+
+class stepMotorDriver28BYJ48(threading.Thread):
+    """ Class to control a 28BYJ-48 step motor with pigpio waveforms """
+    #
+    # defult plate position
+    DEFAULT_PLATE_POSITION = 90
+
+    #
+    # step modes, the same names as the DRV8825 microstep configurations.
+    # the 28BYJ-48 only has full and half step, the rest are ignored
+    MICROSTEP_RELATION_1 = 0
+    MICROSTEP_RELATION_2  = 1
+    MICROSTEP_RELATION_4  = 2
+    MICROSTEP_RELATION_8  = 3
+    MICROSTEP_RELATION_16  = 4
+    MICROSTEP_RELATION_32  = 5
+
+    #
+    # phases advanced on each step and default step frequency of each step mode
+    STEP_MODES = [[2, 500], [1, 1000]]
+
+    #
+    # default pins of the IN1-IN4 inputs of the ULN2003 board
+    COIL_PINS = [17,22,23,24]
+
+    #
+    # the position is counted in half steps, 64 half steps of the motor by 1:64 gear
+    MICROSTEPS_PER_REVOLUTION = 4096
+
+    #
+    # back direction
+    MOVE_BACKWARD = 0
+    #
+    # forward direction
+    MOVE_FORWARD = 1
+
+    #
+    # step mode, degrees and half steps of each step
+    currMicrostepCfg = None
+    stepResolution = None
+    stepMicrosteps = None
+
+    #
+    # step frequency
+    stepMotorFreq = 500
+
+    #
+    # start with ramp-up
+    rampUp = True
+
+    #
+    # if the motor is currently in movement, if it is, we can not demand a new movement until the current is ended
+    inMovement = False
+
+    #
+    # we are moving to a position
+    moveToDemanded = False
+
+    #
+    # direction of the current movement in execution
+    moveDirection = MOVE_FORWARD
+
+    #
+    # position in half steps counted from the edges of the coils and phase of the coils
+    positionMicrosteps = 0
+    countedPhase = 0
+    coilLevels = 0
+
+    #
+    # half steps where the current moveTo ends
+    moveTargetMicrosteps = None
+
+    #
+    # seconds the coil edges can take to be counted once the waveform ends
+    COUNT_LATENCY = 0.05
+
+    #
+    # without reference sensor lookForReference is not possible
+    referencePIN = None
+
+    #
+    # on construction the thread starts
+    # by default a connection to pigpiod is opened for the motor
+    def __init__(self, coilPins = COIL_PINS, gpioControl = None, referencePIN = None):
+        self.loop_active = True
+        self.motionEvent = clock.Event()
+        self.idleEvent = clock.Event()
+        self.idleEvent.set()
+        self.movementEndCallbacks = []
+        self.movementStartCallbacks = []
+        self.commands = deque()
+        self.positionLock = threading.Lock()
+        self.moveEndTimer = None
+        self.coilPins = list(coilPins)
+        self.referencePIN = referencePIN
+        self.ownsConnection = gpioControl == None
+        self.gpioControl = gpioControl
+        if (self.ownsConnection):
+            self.gpioControl = pigpio.pi()
+        threading.Thread.__init__(self)
+        self.setupPins()
+        self.motionEngine = coilWaveMotionEngine(self.gpioControl, self.coilPins, cache = waveCache.forConnection(self.gpioControl))
+        self.start()
+
+    def setupPins(self):
+        """ sets the coils of the default position and counts their edges """
+        if (not self.gpioControl.connected):
+            print ("pigiod connection error")
+        self.coils = gpioBank(self.gpioControl, self.coilPins)
+        self.phaseOfLevels = {}
+        for phase, levels in enumerate(HALF_STEP_SEQUENCE):
+            self.phaseOfLevels[self.coils.masksOf(levels)[0]] = phase
+        self.positionMicrosteps = self.degreesToMicrosteps(self.DEFAULT_PLATE_POSITION)
+        self.countedPhase = self.positionMicrosteps % PHASES
+        self.coils.write(HALF_STEP_SEQUENCE[self.countedPhase])
+        self.coilLevels = self.coils.masksOf(HALF_STEP_SEQUENCE[self.countedPhase])[0]
+        for pin in self.coilPins:
+            self.gpioControl.callback(pin, pigpio.EITHER_EDGE, self.coilEdge)
+        self.setMicrostepCfg(self.MICROSTEP_RELATION_1)
+
+    def coilEdge(self, gpio, level, tick):
+        """ on each coil edge the phase of the coils is decoded, the position follows the phase.
+            the combinations between two phases of the full step sequence are not phases """
+        with self.positionLock:
+            if (level == 1):
+                self.coilLevels = self.coilLevels | (1 << gpio)
+            else:
+                self.coilLevels = self.coilLevels & ~(1 << gpio)
+            phase = self.phaseOfLevels.get(self.coilLevels)
+            if (phase == None):
+                return
+            delta = (phase - self.countedPhase) % PHASES
+            if (delta == 1 or delta == 2):
+                self.positionMicrosteps = self.positionMicrosteps + delta
+            elif (delta == PHASES - 1 or delta == PHASES - 2):
+                self.positionMicrosteps = self.positionMicrosteps - (PHASES - delta)
+            self.countedPhase = phase
+            target = self.moveTargetMicrosteps
+        #
+        # the demanded movement is completed, the control thread has to stop the motor
+        if (target != None and self.positionMicrosteps == target):
+            self.motionEvent.set()
+
+    def degreesToMicrosteps(self, position):
+        """ return the half steps nearest to position in degrees """
+        return int(round(position * self.MICROSTEPS_PER_REVOLUTION / 360.0))
+
+    @property
+    def currPlatePosition(self):
+        """ current plate position in degrees """
+        return self.positionMicrosteps * 360 / self.MICROSTEPS_PER_REVOLUTION
+
+    def stepsTo(self, position):
+        """ return the steps and direction to move from the current position to position """
+        distance = self.degreesToMicrosteps(position) - self.positionMicrosteps
+        if (distance < 0):
+            return -distance // self.stepMicrosteps, self.MOVE_BACKWARD
+        return distance // self.stepMicrosteps, self.MOVE_FORWARD
+
+    def phaseDelta(self):
+        """ return the start phase and the phases advanced each step in the current direction """
+        delta = self.stepMicrosteps
+        if (self.moveDirection == self.MOVE_BACKWARD):
+            delta = -delta
+        return self.countedPhase, delta
+
+    def setMicrostepCfg(self, microstepCfg):
+        """ set the step mode, full or half step. returns False if it is not changed (moving or not supported) """
+        if (not self.inMovement):
+            if (microstepCfg >= self.MICROSTEP_RELATION_1 and microstepCfg < len(self.STEP_MODES)):
+                self.currMicrostepCfg = microstepCfg
+                self.stepMicrosteps = self.STEP_MODES[microstepCfg][0]
+                self.stepResolution = 360.0 * self.stepMicrosteps / self.MICROSTEPS_PER_REVOLUTION
+                self.stepMotorFreq = self.STEP_MODES[microstepCfg][1]
+                return True
+        return False
+
+    def getCurrMicrostepCfg(self):
+        """ return curr step mode """
+        return self.currMicrostepCfg
+
+    def getCurrRPM(self):
+        """ return curr RPM of the motor """
+        return (self.stepResolution*self.stepMotorFreq*60)/360
+
+    def getAchievedFreq(self):
+        """ return the step frequency the waveforms produce for the demanded one """
+        return 1000000.0 / int(round(1000000.0 / self.stepMotorFreq))
+
+    def getCommandedFrequency(self):
+        """ return the step frequency being produced on the coils, 0 if no steps are produced """
+        return self.motionEngine.commandedFrequency()
+
+    def getCurrPlatePosition(self):
+        """ return curr plate position """
+        return self.currPlatePosition
+
+    def getCurrParams(self):
+        """ return curr plate position and speed in string"""
+        return "Pos: " + str(int(self.currPlatePosition)) + " --- Microstep : " + str(self.getCurrMicrostepCfg()) + "  --- Speed (RPM): " + str(self.getCurrRPM()) + " --- Freq: " + str(round(self.stepMotorFreq,2)) + " (" + str(round(self.getAchievedFreq(),2)) + ")" + " --- Dir: "+str(self.moveDirection)
+
+    def submitCommand(self, method, *args):
+        """ hands method to the control thread, returns a Future with its result.
+            the commands are executed in order """
+        future = Future()
+        self.commands.append((future, method, args))
+        self.motionEvent.set()
+        return future
+
+    def executeCommands(self):
+        """ executes the commands handed to the control thread """
+        while (len(self.commands) > 0):
+            future, method, args = self.commands.popleft()
+            #
+            # the command could be cancelled before its execution
+            if (future.set_running_or_notify_cancel()):
+                try:
+                    future.set_result(method(*args))
+                except Exception as e:
+                    future.set_exception(e)
+
+    def notifyMovementStart(self):
+        """ the steps have started, calls the movement start callbacks """
+        for callback in list(self.movementStartCallbacks):
+            callback(self)
+
+    def notifyMovementEnd(self):
+        """ marks the motor as stopped and calls the movement end callbacks """
+        self.idleEvent.set()
+        for callback in list(self.movementEndCallbacks):
+            callback(self)
+
+    def waitMovementEnd(self, timeout = None):
+        """ waits until the motor stops, False on timeout """
+        return self.idleEvent.wait(timeout)
+
+    def moveTo(self, position):
+        """ start movement of plate to demanded position in the control thread, returns a Future
+            with False if the movement is not possible (the motor is moving) """
+        return self.submitCommand(self.doMoveTo, position)
+
+    def doMoveTo(self, position):
+        """ starts the movement of the plate to position """
+        #
+        # by default we return that the movement is not possible
+        retVal = False
+        if (not self.inMovement):
+            retVal = True
+            steps, direction = self.stepsTo(position)
+            if (steps > 0):
+                self.moveDirection = direction
+                self.moveSteps = steps
+                self.moveToDemanded = True
+                self.doStartMovement()
+        return retVal
+
+    def advanceOneDegree(self):
+        """ moves one degree or the minimum current resolution """
+        destination = self.currPlatePosition + 1
+
+        if (self.stepResolution > 1):
+            destination = self.currPlatePosition + self.stepResolution + 1
+
+        return self.moveTo(destination)
+
+    def lookForReference(self):
+        """ the 28BYJ-48 has no reference sensor, returns a Future with False (the movement is not possible) """
+        future = Future()
+        future.set_result(False)
+        return future
+
+    def setReference(self):
+        """ marks curr possition as reference in the control thread, returns a Future """
+        return self.submitCommand(self.doSetReference)
+
+    def doSetReference(self):
+        """ marks curr possition as reference, the phase of the coils does not change """
+        if (self.inMovement):
+            self.stopPulses()
+            self.endMovement()
+        with self.positionLock:
+            reference = self.degreesToMicrosteps(self.DEFAULT_PLATE_POSITION)
+            self.positionMicrosteps = reference - (reference - self.countedPhase) % PHASES
+
+    def startMovement(self):
+        """ starts moving the motor with current parameters in the control thread, returns a Future """
+        return self.submitCommand(self.doStartMovement)
+
+    def doStartMovement(self):
+        """ just starts moving the motor with current parameters"""
+        if (not self.inMovement):
+            self.inMovement = True
+            self.idleEvent.clear()
+            if (self.moveToDemanded):
+                with self.positionLock:
+                    delta = self.phaseDelta()[1]
+                    self.moveTargetMicrosteps = self.positionMicrosteps + delta * self.moveSteps
+                duration = self.motionEngine.move(self.moveSteps, self.stepMotorFreq, self.rampUp, self.phaseDelta())
+                self.notifyMovementStart()
+                #
+                # in case coil edges are lost the end of the waveform also wakes up the control thread
+                self.moveEndTimer = clock.Timer(duration, self.motionEvent.set)
+                self.moveEndTimer.daemon = True
+                self.moveEndTimer.start()
+            else:
+                self.motionEngine.run(self.stepMotorFreq, self.rampUp, self.phaseDelta())
+                self.notifyMovementStart()
+
+    def stopMovement(self):
+        """ stops the motor in the control thread, returns a Future """
+        return self.submitCommand(self.doStopMovement)
+
+    def doStopMovement(self):
+        """ just stop moving the motor"""
+        if (self.inMovement):
+            self.stopPulses()
+            self.endMovement()
+
+    def stopPulses(self):
+        """ stops the coil sequence, ramping down if needed """
+        if (self.moveEndTimer != None):
+            self.moveEndTimer.cancel()
+        self.motionEngine.waitEnd(self.motionEngine.stop())
+        self.waitCounted()
+
+    def waitCounted(self):
+        """ waits until the coil edges are counted, the counted phase is the phase of the pins """
+        waited = 0
+        phase = self.phaseOfLevels.get(self.gpioControl.read_bank_1() & self.coils.mask)
+        while (phase != None and phase != self.countedPhase and waited < self.COUNT_LATENCY):
+            clock.sleep(0.001)
+            waited = waited + 0.001
+
+    def endMovement(self):
+        """ the motor is stopped, the position is the one of the phase of the coils """
+        self.moveToDemanded = False
+        self.moveTargetMicrosteps = None
+        self.inMovement = False
+        self.notifyMovementEnd()
+
+    def restartMovement(self, pause, change, *args):
+        """ calls change(*args), if we are in movement it is called once the motor is stopped
+            and the motor is re-started after pause seconds """
+        if (self.inMovement):
+            self.doStopMovement()
+            change(*args)
+            clock.sleep(pause)
+            self.doStartMovement()
+        else:
+            change(*args)
+
+    def switchDirection(self):
+        """ change current motor direction, the motor is restarted in the control thread, returns a Future """
+        return self.submitCommand(self.restartMovement, 0.1, self.reverseDirection)
+
+    def reverseDirection(self):
+        """ just change the motor direction, the steps of the ramp down are counted in the previous one """
+        if (self.moveDirection == self.MOVE_FORWARD):
+            self.moveDirection = self.MOVE_BACKWARD
+        else:
+            self.moveDirection = self.MOVE_FORWARD
+
+    def changeSpeed(self, newRPM):
+        """ change the motor frequency according to the new RPM value, the motor is restarted in the control thread, returns a Future """
+        return self.submitCommand(self.restartMovement, 0.01, self.setSpeed, newRPM)
+
+    def setSpeed(self, newRPM):
+        """ just change the motor frequency according to the new RPM value """
+        self.stepMotorFreq = (360 * newRPM)/(self.stepResolution*60)
+
+    def changeSpeedBy(self, deltaRPM, minimumRPM, maximumRPM):
+        """ change the RPM by deltaRPM from the current one (rounded) unless it is already over
+            maximumRPM / under minimumRPM, the motor is restarted in the control thread, returns a Future """
+        return self.submitCommand(self.doChangeSpeedBy, deltaRPM, minimumRPM, maximumRPM)
+
+    def doChangeSpeedBy(self, deltaRPM, minimumRPM, maximumRPM):
+        """ just change the RPM by deltaRPM, the pending speed changes are already applied """
+        currRPM = self.getCurrRPM()
+        if ((deltaRPM > 0 and currRPM < maximumRPM) or (deltaRPM < 0 and currRPM > minimumRPM)):
+            self.restartMovement(0.01, self.setSpeed, int(round(currRPM)) + deltaRPM)
+
+    #
+    # infinite loop of the thread
+    def run(self):
+        #
+        # on the simulator the clock waits for this thread
+        with clock.participant():
+            while self.loop_active:
+                #
+                # sleep until a movement is demanded or the moveTo is completed
+                self.motionEvent.wait()
+                self.motionEvent.clear()
+                self.executeCommands()
+
+                if (self.inMovement and self.moveToDemanded):
+                    if (self.positionMicrosteps == self.moveTargetMicrosteps or not self.motionEngine.isBusy()):
+                        self.stopPulses()
+                        self.endMovement()
+            #
+            # the commands not executed are cancelled
+            while (len(self.commands) > 0):
+                self.commands.popleft()[0].cancel()
+
+    #
+    # collaboative method to terminale
+    def terminate(self):
+        #
+        # stop the sequence and switch off the coils, the 28BYJ-48 does not need holding current
+        self.motionEngine.release()
+        self.coils.forget()
+        self.coils.write([0,0,0,0])
+        if (self.ownsConnection):
+            self.gpioControl.stop()
+        self.loop_active = False
+        self.motionEvent.set()
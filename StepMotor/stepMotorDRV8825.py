@@ -18,16 +18,25 @@ Author:
 # Import required libraries
 
 import sys
-import RPi.GPIO as GPIO
-import pigpio
+from hardwareBackend import pigpio, clock
 
-import  socket
-
-from tkinter import *
-import tkinter.font
 import time
 import threading
 from enum import Enum
+from collections import deque
+from concurrent.futures import Future
+
+from waveMotionEngine import waveMotionEngine, waveCache
+from stepFrequencyBackend import createFrequencyBackend
+from gpioBank import gpioBank
+from notifyStepCounter import notifyStepCounter
+from motionPlanner import motionPlanner
+from motionState import motionState, stateField
+from stepTimingBuffer import stepTimingBuffer
+from stepLossDetector import stepLossDetector, describeStepLoss
+from commandLatency import commandLatencyRecorder
+from terminalServer import terminalServer, terminalConnection, parseArgument
+from binaryTerminal import binaryConnection, BINARY_PORT
 
 appDebug = False
 
@@ -35,9 +44,6 @@ appDebug = False
 # set to True to run the module main APP
 drv8825RunMain = False
 
-def lostStep(channel):
-    print("lostStep" )
-
 
 class stepMotorDriver8825(threading.Thread):
     """ Class to control  step motor movements using a 8825 driver """
@@ -55,9 +61,18 @@ class stepMotorDriver8825(threading.Thread):
     MICROSTEP_RELATION_32  = 5
     
     #
-    # holds the pins to use to set microstep configuration of DRV8825
+    # default pins to produce steps and set the direction
+    STEP_PIN = 21
+    DIR_PIN = 20
+
+    #
+    # holds the default pins to use to set microstep configuration of DRV8825
     MICROSTEP_PINS  = [14,15,18]
 
+    #
+    # pins to set microstep configuration of this motor
+    microstepPins = None
+
     #
     # holds the values to use for each microstep configuration of the DRV8825
     # as well as the  step mode: full-step, 1/2-step, 1/4-step, 1/8-step, 1/16-step, 1/32
@@ -72,14 +87,26 @@ class stepMotorDriver8825(threading.Thread):
     # how many degress in each motor step
     # i.e: stepResolution = 360 / (200) when relsoltion is full
     stepResolution = None
+
+    #
+    # the position is counted in microsteps of the finest configuration (1/32),
+    # a step of a coarser configuration is stepMicrosteps of them
+    MICROSTEPS_PER_REVOLUTION = 200 * 32
+    stepMicrosteps = stateField("stepMicrosteps")
         
     #
     # step motor frequency in pigiod   17        16     15      14      13      12  11  10      9
     #                                                   (8000  4000  2000 1600 1000  800  500  400  320)
     #                                                       8           7       6       5       4       3       2   1       0
     #                                                   (250       200    160   100    80     50     40  20     10 )
+    #
+    # the steps of the ramp up/down use these frequencies, the motor can run at any frequency
     availableFreq = [10,20,40,50,80,100,160,200,250,320,400,500,800,1000,1600,2000,4000,8000]
     stepMotorFreq =  200
+
+    #
+    # generates the square signal of the step pin at stepMotorFreq
+    frequencyBackend = None
     
         
     #
@@ -89,11 +116,28 @@ class stepMotorDriver8825(threading.Thread):
     # forward direction
     MOVE_FORWARD = 1
     #
-    # current plate position
-    currPlatePosition = DEFAULT_PLATE_POSITION
+    # motion state published for all the threads (motionState), only publishState replaces it
+    state = None
+    stateLock = None
+    #
+    # step edges counted, only written by the step callback (or the batched counter)
+    edgeCount = 0
+
+    #
+    # edges at which the demanded movement is completed, NO_STOP if no moveTo is demanded
+    # (copy of the motion state for the step callback)
+    NO_STOP = sys.maxsize
+    stopEdges = NO_STOP
+
+    #
+    # ticks of the last step edges seen by the step callback, it writes the tick of
+    # the edge n in stepTicks[n & stepTickMask]
+    stepTiming = None
+    stepTicks = None
+    stepTickMask = 0
     #
     # possition demanded by GUI
-    demandedPlatePosition = currPlatePosition
+    demandedPlatePosition = DEFAULT_PLATE_POSITION
     #
     # detectection of reference position PIN
     referencePIN = 16
@@ -104,23 +148,19 @@ class stepMotorDriver8825(threading.Thread):
 
     #
     # if the plate is currently in movement, if it is, we can not demand a new movement until the current is ended
-    inMovement = False
+    inMovement = stateField("inMovement")
 
     #
     # we are looking for reference
-    lookingForReference = False
+    lookingForReference = stateField("lookingForReference")
 
     #
     # we are moven to a predefined possition
-    moveToDemanded = False
-
-    #
-    # step movements pending to be executed
-    pendingMovements = 0
+    moveToDemanded = stateField("moveToDemanded")
 
     #
     # direction of the current movement in execution
-    moveDirection = MOVE_FORWARD
+    moveDirection = stateField("moveDirection")
 
     #
     # start with ramp-up
@@ -139,34 +179,252 @@ class stepMotorDriver8825(threading.Thread):
 
     #
     # if the postion have to be update
-    updatePosition = False
+    updatePosition = stateField("updatePosition")
+
+    #
+    # access to GPIO, by default the connection is shared by all the motors.
+    # the first motor opens it, importing the module does not connect to pigpiod
+    gpioControl = None
+
+    #
+    # motors using the shared connection, the last one to terminate closes it
+    sharedConnectionUsers = 0
+    sharedConnectionLock = threading.Lock()
+    usesSharedConnection = False
+
+    #
+    # wakes up the control thread when there is something to do
+    motionEvent = None
+
+    #
+    # reference edge detected while looking for reference
+    referenceDetected = False
+    #
+    # edges counted when the reference was detected, the motor goes on while it ramps down
+    referenceEdges = 0
+
+    #
+    # builds the movements as pigpio waveforms, None to use the PWM of the step pin
+    motionEngine = None
+
+    #
+    # LRU cache of the waveforms created by the motion engine
+    waveCache = None
+
+    #
+    # position in microsteps where the current moveTo started and its steps
+    moveStartMicrosteps = None
+    moveSteps = 0
+
+    #
+    # wakes up the control thread when the waveform of a moveTo ends
+    moveEndTimer = None
+
+    #
+    # counts the steps in batches reading the pigpio notification pipe,
+    # None to count them with a callback on each edge
+    stepCounter = None
+
+    #
+    # set while the motor is stopped
+    idleEvent = None
+
+    #
+    # functions called with the driver each time the motor stops
+    movementEndCallbacks = None
+
+    #
+    # functions called with the driver each time the pulses start
+    movementStartCallbacks = None
 
     #
-    # access to GPIO
-    gpioControl = pigpio.pi()
+    # compares the commanded and counted steps, None if the step loss is not detected
+    stepLossDetector = None
+
+    #
+    # set when a step loss is detected, lastStepLoss holds (reason, commanded steps, counted steps)
+    stepLossEvent = None
+    lastStepLoss = None
+
+    #
+    # functions called with the driver, reason, commanded and counted steps on each step loss
+    stepLossCallbacks = None
+
+    #
+    # the motor is stopped when a step loss is detected
+    stopOnStepLoss = True
+
+    #
+    # executes the queued movements
+    planner = None
+
+    #
+    # commands handed to the control thread: (future, method, arguments)
+    commands = None
 
     def stepDetection(self,g,b,t):
-        """ on each step detected we decrement the number of pending movements """
-        self.pendingMovements = self.pendingMovements - 1
-        if (self.updatePosition):
+        """ on each step detected we count the edge, the position and pending movements derive from it """
+        edges = self.edgeCount
+        self.stepTicks[edges & self.stepTickMask] = t
+        edges = edges + 1
+        self.edgeCount = edges
+        #
+        # the demanded movement is completed, the control thread has to stop the motor
+        if (edges >= self.stopEdges):
+            self.motionEvent.set()
+
+    def applySteps(self,steps):
+        """ on each batch of steps counted we count the edges """
+        self.edgeCount = self.edgeCount + steps
+        if (self.edgeCount >= self.stopEdges):
+            self.motionEvent.set()
+
+    def publishState(self, **changes):
+        """ publishes a new motion state with changes, the fields are replaced at once.
+            positionMicrosteps and pendingMovements are converted to the edge counter """
+        with self.stateLock:
+            edges = self.edgeCount
+            state = self.state.copy()
             #
-            # update curr plate position
-            if (self.moveDirection == self.MOVE_BACKWARD):
-                self.currPlatePosition = self.currPlatePosition - self.stepResolution
+            # the position counted until now is the base of the new state
+            state.baseMicrosteps = self.state.positionAt(edges)
+            state.baseEdges = edges
+            if ("positionMicrosteps" in changes):
+                state.baseMicrosteps = changes.pop("positionMicrosteps")
+            if ("pendingMovements" in changes):
+                state.stopAtEdges = edges + changes.pop("pendingMovements")
+            for name, value in changes.items():
+                setattr(state, name, value)
+            self.state = state
+            if (state.moveToDemanded):
+                self.stopEdges = state.stopAtEdges
             else:
-                self.currPlatePosition = self.currPlatePosition + self.stepResolution
+                self.stopEdges = self.NO_STOP
+
+    def getMotionState(self):
+        """ return a consistent snapshot of the motion state (motionState) and the edge count """
+        return self.state, self.edgeCount
+
+    @property
+    def positionMicrosteps(self):
+        """ current plate position in microsteps """
+        return self.state.positionAt(self.edgeCount)
+
+    @positionMicrosteps.setter
+    def positionMicrosteps(self, position):
+        self.publishState(positionMicrosteps = position)
+
+    @property
+    def pendingMovements(self):
+        """ step movements pending to be executed """
+        return self.state.pendingAt(self.edgeCount)
+
+    @pendingMovements.setter
+    def pendingMovements(self, pending):
+        self.publishState(pendingMovements = pending)
+
+    @property
+    def currPlatePosition(self):
+        """ current plate position in degrees """
+        return self.positionMicrosteps * 360 / self.MICROSTEPS_PER_REVOLUTION
+
+    @currPlatePosition.setter
+    def currPlatePosition(self, position):
+        self.positionMicrosteps = self.degreesToMicrosteps(position)
+
+    def degreesToMicrosteps(self, position):
+        """ return the microsteps nearest to position in degrees """
+        return int(round(position * self.MICROSTEPS_PER_REVOLUTION / 360.0))
+
+    def stepsTo(self, position):
+        """ return the steps and direction to move from the current position to position """
+        distance = self.degreesToMicrosteps(position) - self.positionMicrosteps
+        if (distance < 0):
+            return -distance // self.stepMicrosteps, self.MOVE_BACKWARD
+        return distance // self.stepMicrosteps, self.MOVE_FORWARD
+
+    def referenceDetection(self,g,b,t):
+        """ on reference edge we wake up the control thread if it is looking for it """
+        if (self.lookingForReference):
+            self.referenceEdges = self.edgeCount
+            self.referenceDetected = True
+            self.motionEvent.set()
         
     
     #
     # on construction the thread starts
-    def __init__(self):
+    # if useWaves is True the movements are generated as pigpio waveforms
+    # if batchedCounting is True the steps are counted in batches each countCadence seconds
+    # the pins of the motor can be changed to drive several motors from the same process,
+    # by default all the motors share the gpioControl connection to pigpiod
+    # if detectStepLoss is True the commanded and counted steps are compared while moving,
+    # on a step loss the motor is stopped if stopOnStepLoss is True
+    def __init__(self, useWaves = False, batchedCounting = False, countCadence = notifyStepCounter.DEFAULT_CADENCE,
+                 stepPin = STEP_PIN, dirPin = DIR_PIN, microstepPins = MICROSTEP_PINS, referencePIN = referencePIN,
+                 stepCountPin = stepCountPin, gpioControl = None, timingBufferSize = stepTimingBuffer.DEFAULT_SIZE,
+                 detectStepLoss = False, stopOnStepLoss = True):
         self.loop_active = True
+        self.motionEvent = clock.Event()
+        self.idleEvent = clock.Event()
+        self.idleEvent.set()
+        self.movementEndCallbacks = []
+        self.movementStartCallbacks = []
+        self.stepLossEvent = clock.Event()
+        self.stepLossCallbacks = []
+        self.stopOnStepLoss = stopOnStepLoss
+        self.commands = deque()
+        #
+        # pins of this motor
+        self.stepPin = stepPin
+        self.dirPin = dirPin
+        self.microstepPins = list(microstepPins)
+        self.referencePIN = referencePIN
+        self.stepCountPin = stepCountPin
+        if (gpioControl != None):
+            self.gpioControl = gpioControl
+        else:
+            self.usesSharedConnection = True
+            with self.sharedConnectionLock:
+                if (self.gpioControl == None):
+                    stepMotorDriver8825.gpioControl = pigpio.pi()
+                stepMotorDriver8825.sharedConnectionUsers = stepMotorDriver8825.sharedConnectionUsers + 1
+                #
+                # the motor keeps its connection when the shared one is closed
+                self.gpioControl = self.gpioControl
+        #
+        # state of this motor
+        self.stateLock = threading.Lock()
+        self.edgeCount = 0
+        if (batchedCounting):
+            self.stepTiming = stepTimingBuffer(timingBufferSize)
+        else:
+            self.stepTiming = stepTimingBuffer(timingBufferSize, lambda: self.edgeCount)
+        self.stepTicks = self.stepTiming.ticks
+        self.stepTickMask = self.stepTiming.mask
+        self.state = motionState(self.degreesToMicrosteps(self.DEFAULT_PLATE_POSITION), moveDirection = self.MOVE_FORWARD)
+        self.demandedPlatePosition = self.DEFAULT_PLATE_POSITION
+        self.referenceDetected = False
         threading.Thread.__init__(self)
         self.setupPins()
+        if (batchedCounting):
+            self.stepCounter = notifyStepCounter(self.gpioControl, self.stepCountPin, self.applySteps, countCadence)
+        else:
+            self.gpioControl.callback(self.stepCountPin,pigpio.RISING_EDGE,self.stepDetection)
+        if (useWaves):
+            self.waveCache = waveCache.forConnection(self.gpioControl)
+            self.motionEngine = waveMotionEngine(self.gpioControl, self.stepPin, cache = self.waveCache)
         self.start()
+        self.planner = motionPlanner(self)
+        if (detectStepLoss):
+            #
+            # the batched steps are counted up to countCadence seconds later
+            latency = stepLossDetector.DEFAULT_LATENCY
+            if (batchedCounting):
+                latency = latency + countCadence
+            self.stepLossDetector = stepLossDetector(self, self.stepLoss, latency = latency)
 
     def setMicrostepCfg(self,microstepCfg):
-        """ set the DRV8825 microstep configuration"""
+        """ set the DRV8825 microstep configuration, returns False if it is not changed (moving or not valid) """
         if (not self.inMovement):
             #
             # check it  is a valid configuration
@@ -174,55 +432,50 @@ class stepMotorDriver8825(threading.Thread):
 
                 self.currMicrostepCfg =  microstepCfg
                 #
-                # set pins values
-                GPIO.output(self.MICROSTEP_PINS[0],self.MICROSTEP_PINS_SETUP[self.currMicrostepCfg][0])
-                GPIO.output(self.MICROSTEP_PINS[1],self.MICROSTEP_PINS_SETUP[self.currMicrostepCfg][1])
-                GPIO.output(self.MICROSTEP_PINS[2],self.MICROSTEP_PINS_SETUP[self.currMicrostepCfg][2])
+                # set pins values with one or two calls, the motor is stopped during the
+                # intermediate mode between them (gpioBank)
+                self.microstepBank.apply(self.microstepMasks[self.currMicrostepCfg])
 
                 #
                 # adjust resolution (numer of sdegres in each step)
                 self.stepResolution= 360 / (200 *  self.MICROSTEP_PINS_SETUP[self.currMicrostepCfg][3])
+                #
+                # the position counter does not change, only the microsteps of each step
+                self.stepMicrosteps = self.MICROSTEPS_PER_REVOLUTION // (200 *  self.MICROSTEP_PINS_SETUP[self.currMicrostepCfg][3])
 
                 #
                 # set frequency to defult value for the resolution
                 self.stepMotorFreq = self.MICROSTEP_PINS_SETUP[self.currMicrostepCfg][4]
+                return True
+        return False
     
 
     #
     #  setup board pins
     def setupPins(self):
-        # Use BCM GPIO references
-        # instead of physical pin numbers
-        GPIO.setmode(GPIO.BCM)
-        
-        #
-        # Define GPIO signals to use
-        #GPIO20 for direction and 21 for step
-        self.stepPin = 21
-        self.dirPin = 20
-
         if (not self.gpioControl.connected):
             print ("pigiod connection error")
 
         self.gpioControl.set_mode(self.stepPin,pigpio.OUTPUT)
-        self.gpioControl.set_PWM_frequency(self.stepPin,self.stepMotorFreq)
+        self.frequencyBackend = createFrequencyBackend(self.gpioControl,self.stepPin)
         #
         # step detection
-        GPIO.setup(self.stepCountPin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-        self.gpioControl.callback(self.stepCountPin,pigpio.RISING_EDGE,self.stepDetection)
+        self.gpioControl.set_mode(self.stepCountPin,pigpio.INPUT)
+        self.gpioControl.set_pull_up_down(self.stepCountPin,pigpio.PUD_DOWN)
         
-        GPIO.setup(self.dirPin,GPIO.OUT)
-        GPIO.output(self.dirPin,self.moveDirection)
+        self.gpioControl.set_mode(self.dirPin,pigpio.OUTPUT)
+        self.gpioControl.write(self.dirPin,self.moveDirection)
 
         #
         # set reference pin as input
-        GPIO.setup(self.referencePIN,GPIO.IN,GPIO.PUD_DOWN)
+        self.gpioControl.set_mode(self.referencePIN,pigpio.INPUT)
+        self.gpioControl.set_pull_up_down(self.referencePIN,pigpio.PUD_DOWN)
+        self.gpioControl.callback(self.referencePIN,pigpio.RISING_EDGE,self.referenceDetection)
 
         #
-        # setup microstep control pins as output
-        GPIO.setup(self.MICROSTEP_PINS[0],GPIO.OUT)
-        GPIO.setup(self.MICROSTEP_PINS[1],GPIO.OUT)
-        GPIO.setup(self.MICROSTEP_PINS[2],GPIO.OUT)
+        # setup microstep control pins as output, the masks of each configuration are computed once
+        self.microstepBank = gpioBank(self.gpioControl, self.microstepPins)
+        self.microstepMasks = [self.microstepBank.masksOf(setup[0:3]) for setup in self.MICROSTEP_PINS_SETUP]
 
         #
         # by default max resolution (more steps and minimum vibration
@@ -230,21 +483,33 @@ class stepMotorDriver8825(threading.Thread):
 
     
     def lookForReference(self):
-        """look for the plate initial posiition (DEFAULT_PLATE_POSITION)"""
+        """look for the plate initial posiition (DEFAULT_PLATE_POSITION) in the control thread,
+            returns a Future with False if the movement is not possible """
+        return self.submitCommand(self.doLookForReference)
+
+    def doLookForReference(self):
+        """ starts the movement looking for the reference """
         #
         # by default we return that the movement is not possible
         retVal = False
         if (not  self.inMovement):
             retVal = True
-            self.moveDirection = self.MOVE_FORWARD
-            self.lookingForReference = True
-            self.inMovement = True
+            self.referenceDetected = False
+            self.publishState(moveDirection = self.MOVE_FORWARD, lookingForReference = True, inMovement = True)
+            self.idleEvent.clear()
             #
             # update direction before start movement
-            GPIO.output(self.dirPin,self.moveDirection)
+            self.gpioControl.write(self.dirPin,self.moveDirection)
             #
             # start pulses on step pin
-            self.gpioControl.set_PWM_dutycycle(self.stepPin,128)
+            if (self.motionEngine != None):
+                self.motionEngine.run(self.stepMotorFreq, self.rampUp, self.currMicrostepCfg)
+            else:
+                self.frequencyBackend.setFrequency(self.stepMotorFreq)
+                self.frequencyBackend.start()
+            #
+            # the reference could be already detected
+            self.motionEvent.set()
                     
         return retVal
 
@@ -252,6 +517,28 @@ class stepMotorDriver8825(threading.Thread):
         """ return curr RPM of the motor """
         return (self.stepResolution*self.stepMotorFreq*60)/360           
 
+    def getAchievedFreq(self):
+        """ return the step frequency the hardware produces for the demanded one """
+        if (self.motionEngine != None):
+            return 1000000.0 / int(round(1000000.0 / self.stepMotorFreq))
+        return self.frequencyBackend.achieved(self.stepMotorFreq)
+
+    def getCommandedFrequency(self):
+        """ return the step frequency being produced on the step pin, 0 if no steps are produced """
+        if (self.motionEngine != None):
+            return self.motionEngine.commandedFrequency()
+        return self.frequencyBackend.commandedFrequency()
+
+    def stepLoss(self, reason, commanded, counted):
+        """ called by the step loss detector when the counted steps do not follow the commanded ones,
+            the stepLossCallbacks (the terminals, the binary connections) are told """
+        self.lastStepLoss = (reason, commanded, counted)
+        self.stepLossEvent.set()
+        for callback in list(self.stepLossCallbacks):
+            callback(self, reason, commanded, counted)
+        if (self.stopOnStepLoss):
+            self.stopMovement()
+
     def getCurrPlatePosition(self):
         """ return curr plate position """
         return self.currPlatePosition
@@ -260,93 +547,231 @@ class stepMotorDriver8825(threading.Thread):
         """ return curr microstep configuration """
         return self.currMicrostepCfg
 
+    def getWaveCacheStats(self):
+        """ return hits, misses and evictions of the waveform cache, None if waveforms are not used """
+        if (self.waveCache == None):
+            return None
+        return self.waveCache.getStats()
+
+    def getStepTimingReport(self, steps = None):
+        """ return the commanded and achieved frequency and the jitter of the last steps,
+            the ticks are only recorded when the steps are counted with the callback """
+        return self.stepTiming.report(self.stepMotorFreq, steps)
+
     def getCurrParams(self):
         """ return curr plate position and speed in string"""
-        return "Pos: " + str(int( self.currPlatePosition)) + " --- Microstep : " + str(self.getCurrMicrostepCfg()) + "  --- Speed (RPM): " + str(self.getCurrRPM()) + " --- Freq: " + str(self.stepMotorFreq) + " --- Dir: "+str(self.moveDirection)
+        state, edges = self.getMotionState()
+        position = state.positionAt(edges) * 360 / self.MICROSTEPS_PER_REVOLUTION
+        return "Pos: " + str(int(position)) + " --- Microstep : " + str(self.getCurrMicrostepCfg()) + "  --- Speed (RPM): " + str(self.getCurrRPM()) + " --- Freq: " + str(round(self.stepMotorFreq,2)) + " (" + str(round(self.getAchievedFreq(),2)) + ")" + " --- Dir: "+str(state.moveDirection)
+
+    def submitCommand(self, method, *args):
+        """ hands method to the control thread, returns a Future with its result.
+            the commands are executed in order """
+        future = Future()
+        self.commands.append((future, method, args))
+        self.motionEvent.set()
+        return future
+
+    def executeCommands(self):
+        """ executes the commands handed to the control thread """
+        while (len(self.commands) > 0):
+            future, method, args = self.commands.popleft()
+            #
+            # the command could be cancelled before its execution
+            if (future.set_running_or_notify_cancel()):
+                try:
+                    future.set_result(method(*args))
+                except Exception as e:
+                    future.set_exception(e)
 
     def startMovement(self):
+        """ starts moving the motor with current parameters in the control thread, returns a Future """
+        return self.submitCommand(self.doStartMovement)
+
+    def startMovementIn(self, direction):
+        """ starts moving the motor in direction in the control thread (if it is stopped), returns a Future """
+        return self.submitCommand(self.doStartMovementIn, direction)
+
+    def doStartMovementIn(self, direction):
+        """ just change the direction and start moving the motor, the motor must be stopped """
+        if (not self.inMovement):
+            self.moveDirection = direction
+            self.doStartMovement()
+
+    def doStartMovement(self):
         """ just starts moving the motor with current parameters"""
         if (not  self.inMovement):
             print("start movement demanded")
             self.inMovement = True
+            self.idleEvent.clear()
             #
             # update direction before start movement
-            GPIO.output(self.dirPin,self.moveDirection)
+            self.gpioControl.write(self.dirPin,self.moveDirection)
+            #
+            # the waveform engine emits the exact steps of a moveTo
+            if (self.motionEngine != None):
+                if (self.moveToDemanded):
+                    duration = self.motionEngine.move(self.moveSteps, self.stepMotorFreq, self.rampUp, self.currMicrostepCfg)
+                    self.notifyMovementStart()
+                    #
+                    # in case step edges are lost the end of the waveform also wakes up the control thread
+                    self.moveEndTimer = clock.Timer(duration, self.motionEvent.set)
+                    self.moveEndTimer.daemon = True
+                    self.moveEndTimer.start()
+                else:
+                    self.motionEngine.run(self.stepMotorFreq, self.rampUp, self.currMicrostepCfg)
+                    self.notifyMovementStart()
             #
             # if we want the motor to peform a RAMP up
-            if (self.rampUp):
+            elif (self.rampUp):
                 currPos = 0
-                freqReached = False
+                self.currFreqReference = 0
                 #
                 # set minimum freq
-                self.gpioControl.set_PWM_frequency(self.stepPin,self.availableFreq[currPos])
+                self.frequencyBackend.setFrequency(min(self.availableFreq[currPos],self.stepMotorFreq))
                 #
                 # start pulses on step pin
-                self.gpioControl.set_PWM_dutycycle(self.stepPin,128)
+                self.frequencyBackend.start()
+                self.notifyMovementStart()
                 
                 #
-                # change freq until we reach the desired one
-                while  not freqReached and (currPos < len(self.availableFreq)):
-                    freqReached = self.availableFreq[currPos] >= self.stepMotorFreq
-                    self.gpioControl.set_PWM_frequency(self.stepPin,self.availableFreq[currPos])
+                # change freq until we reach the desired one, the last change is to the exact frequency
+                while  (currPos < len(self.availableFreq)) and (self.availableFreq[currPos] < self.stepMotorFreq):
+                    self.frequencyBackend.setFrequency(self.availableFreq[currPos])
                     self.currFreqReference = currPos
                     currPos = currPos + 1
-                    time.sleep(0.010)
+                    clock.sleep(0.010)
+                self.frequencyBackend.setFrequency(self.stepMotorFreq)
 
             else:
                 #
                 # update motor frequency
-                self.gpioControl.set_PWM_frequency(self.stepPin,self.stepMotorFreq)
+                self.frequencyBackend.setFrequency(self.stepMotorFreq)
                 #
                 # start pulses on step pin
-                self.gpioControl.set_PWM_dutycycle(self.stepPin,128)
+                self.frequencyBackend.start()
+                self.notifyMovementStart()
             
     def stopMovement(self):
+        """ stops the motor in the control thread, returns a Future """
+        return self.submitCommand(self.doStopMovement)
+
+    def doStopMovement(self):
         """ just stop moving the motor"""
         
         if (self.inMovement):
-            #
-            # if we want the motor to peform a RAMP up/RAMP Down
+            self.stopPulses()
+            self.endMovement()
+
+    def stopPulses(self):
+        """ stops the pulses on the step pin, ramping down if needed """
+        if (self.motionEngine != None):
+            self.motionEngine.waitEnd(self.motionEngine.stop())
+        #
+        # if we want the motor to peform a RAMP up/RAMP Down
+        elif (self.rampUp):
+            currPos = self.currFreqReference
+            while   (currPos > 0):
+                currPos = currPos - 1
+                self.frequencyBackend.setFrequency(self.availableFreq[currPos])
+                #
+                # invert direction  in the last step
+                if (currPos == 0):
+                    revDir = 0
+                    if (self.moveDirection == 0):
+                        revDir = 1
+                    self.gpioControl.write(self.dirPin,revDir)
+                    
+                clock.sleep(0.010)
+            self.frequencyBackend.stop()
+        else:
+            self.frequencyBackend.stop()
+
+    def endMovement(self, **changes):
+        """ the motor is stopped: ends the moveTo in progress and accepts new movements.
+            changes of the motion state are published at the same time """
+        if (self.stepCounter != None):
+            self.stepCounter.flushAt = None
+        self.publishState(updatePosition = False, moveToDemanded = False, inMovement = False, **changes)
+        self.notifyMovementEnd()
+
+    def notifyMovementStart(self):
+        """ the pulses have started, calls the movement start callbacks """
+        for callback in list(self.movementStartCallbacks):
+            callback(self)
+
+    def notifyMovementEnd(self):
+        """ marks the motor as stopped and calls the movement end callbacks """
+        self.idleEvent.set()
+        for callback in list(self.movementEndCallbacks):
+            callback(self)
+
+    def waitMovementEnd(self, timeout = None):
+        """ waits until the motor stops, False on timeout """
+        return self.idleEvent.wait(timeout)
+
+    def estimateMoveTime(self, position, fromPosition = None):
+        """ return the estimated seconds to move from fromPosition (current by default) to position """
+        if (fromPosition == None):
+            fromPosition = self.currPlatePosition
+        steps = int(abs(position - fromPosition) / self.stepResolution)
+        if (steps == 0):
+            return 0
+        if (self.motionEngine != None):
+            rampFreqs = []
             if (self.rampUp):
-                currPos = self.currFreqReference
-                while   (currPos > 0):
-                    currPos = currPos - 1
-                    self.gpioControl.set_PWM_frequency(self.stepPin,self.availableFreq[currPos])
-                    #
-                    # invert direction  in the last step
-                    if (currPos == 0):
-                        revDir = 0
-                        if (self.moveDirection == 0):
-                            revDir = 1
-                        GPIO.output(self.dirPin,revDir)
-                        
-                    time.sleep(0.010)
-                self.gpioControl.set_PWM_dutycycle(self.stepPin,0)
-            else:
-                self.gpioControl.set_PWM_dutycycle(self.stepPin,0)
-            self.inMovement = False
+                rampFreqs = self.motionEngine.rampFrequencies(self.stepMotorFreq, steps)
+            return 2 * sum([1.0 / freq for freq in rampFreqs]) + (steps - 2 * len(rampFreqs)) / float(self.stepMotorFreq)
+        rampTime = 0
+        if (self.rampUp):
+            #
+            # each frequency of the ramp ladder lasts 10 ms up and down
+            rampTime = 2 * 0.010 * len([freq for freq in self.availableFreq if freq < self.stepMotorFreq])
+        return steps / float(self.stepMotorFreq) + rampTime
+
+    def queueMoveTo(self, position, dwell = 0):
+        """ queues a movement to position, the motor waits dwell seconds there.
+            consecutive movements in the same direction are blended """
+        self.planner.enqueue(position, dwell)
+
+    def getQueueDepth(self):
+        """ return the queued movements pending """
+        return self.planner.getQueueDepth()
+
+    def getQueueEstimatedCompletion(self):
+        """ return the estimated seconds to complete the queued movements """
+        return self.planner.getEstimatedCompletion()
     
     def  moveTo(self,position):
-        """ start movement of plate to demanded position"""
+        """ start movement of plate to demanded position in the control thread, returns a Future
+            with False if the movement is not possible (the motor is moving) """
+        return self.submitCommand(self.doMoveTo, position)
+
+    def  doMoveTo(self,position):
+        """ starts the movement of the plate to position """
         #
         # by default we return that the movement is not possible
         retVal = False
         if (not  self.inMovement):
             retVal = True
             #
+            #   how far how we have to move and in what direction
+            steps, direction = self.stepsTo(position)
+            #
             # check if we have to move (if we are more than one step away of the desired position
-            if (abs(position - self.currPlatePosition) >= self.stepResolution):
+            if (steps > 0):
+                self.moveSteps = steps
+                self.moveStartMicrosteps = self.positionMicrosteps
                 #
-                #   how far how we have to move and in what direction
-                self.pendingMovements =  int(abs(position - self.currPlatePosition) /self.stepResolution)
+                # the batch that completes the movement is reported at once
+                if (self.stepCounter != None):
+                    self.stepCounter.flushAt = steps
                 
-                if (self.currPlatePosition >  position):
-                    self.moveDirection = self.MOVE_BACKWARD
-                else:
-                    self.moveDirection = self.MOVE_FORWARD
-                self.updatePosition = True
-                self.moveToDemanded = True
-                self.startMovement()
+                self.publishState(pendingMovements = steps, moveDirection = direction, updatePosition = True, moveToDemanded = True)
+                self.doStartMovement()
+                #
+                # the control thread checks the pending movements
+                self.motionEvent.set()
                 
                     
         return retVal
@@ -358,270 +783,295 @@ class stepMotorDriver8825(threading.Thread):
         if (self.stepResolution > 1):
             destination = self.currPlatePosition + self.stepResolution + 1
 
-        self.moveTo(destination)
+        return self.moveTo(destination)
 
     def setReference(self):
+        """ marks curr possition as reference and stop movement in the control thread, returns a Future """
+        return self.submitCommand(self.doSetReference)
+
+    def doSetReference(self):
         """ marks curr possition as reference and stop movement """
-        self.stopMovement()
-        self.currPlatePosition = self.DEFAULT_PLATE_POSITION
+        if (self.inMovement):
+            self.stopPulses()
         print("reference found")
-        self.lookingForReference = False
+        self.endMovement(positionMicrosteps = self.degreesToMicrosteps(self.DEFAULT_PLATE_POSITION), lookingForReference = False)
+
+    def restartMovement(self, pause, change, *args):
+        """ calls change(*args), if we are in movement it is called once the motor is stopped
+            and the motor is re-started after pause seconds """
+        if (self.inMovement):
+            self.doStopMovement()
+            change(*args)
+            clock.sleep(pause)
+            self.doStartMovement()
+        else:
+            change(*args)
 
     def switchDirection(self):
-        """ change current motor direction """
+        """ change current motor direction, the motor is restarted in the control thread, returns a Future """
+        return self.submitCommand(self.restartMovement, 0.1, self.reverseDirection)
+
+    def reverseDirection(self):
+        """ just change the motor direction, the steps of the ramp down are counted in the previous one """
         if (self.moveDirection == self.MOVE_FORWARD):
             self.moveDirection = self.MOVE_BACKWARD
         else:
             self.moveDirection = self.MOVE_FORWARD
-        #
-        # if we are in movement stop and re-start
-        if (self.inMovement):
-            self.stopMovement()
-            time.sleep(0.1)
-            self.startMovement()
             
     def changeSpeed(self, newRPM):
-        """ change the motor frequency according to the new RPM value """
-        self.stepMotorFreq = int(round((360 * newRPM)/(self.stepResolution*60)))
-        #
-        # if we are in movement stop and re-start
-        if (self.inMovement):
-            self.stopMovement()
-            time.sleep(0.01)
-            self.startMovement()
+        """ change the motor frequency according to the new RPM value, the motor is restarted in the control thread, returns a Future """
+        return self.submitCommand(self.restartMovement, 0.01, self.setSpeed, newRPM)
+
+    def setSpeed(self, newRPM):
+        """ just change the motor frequency according to the new RPM value """
+        self.stepMotorFreq = (360 * newRPM)/(self.stepResolution*60)
+
+    def changeSpeedBy(self, deltaRPM, minimumRPM, maximumRPM):
+        """ change the RPM by deltaRPM from the current one (rounded) unless it is already over
+            maximumRPM / under minimumRPM, the motor is restarted in the control thread, returns a Future """
+        return self.submitCommand(self.doChangeSpeedBy, deltaRPM, minimumRPM, maximumRPM)
+
+    def doChangeSpeedBy(self, deltaRPM, minimumRPM, maximumRPM):
+        """ just change the RPM by deltaRPM, the pending speed changes are already applied """
+        currRPM = self.getCurrRPM()
+        if ((deltaRPM > 0 and currRPM < maximumRPM) or (deltaRPM < 0 and currRPM > minimumRPM)):
+            self.restartMovement(0.01, self.setSpeed, int(round(currRPM)) + deltaRPM)
 
 
     #
     # infinite loop of the thread
     def run(self):
-        count = 0
-        while self.loop_active:
-            time.sleep(0.0001)
+        #
+        # on the simulator the clock waits for this thread
+        with clock.participant():
+            while self.loop_active:
+                #
+                # sleep until a movement is demanded, the pending movements are completed
+                # or the reference is detected
+                self.motionEvent.wait()
+                self.motionEvent.clear()
+                self.executeCommands()
        
-            #
-            # the motor is moving  due to lookingForReference or moveTo demand
-            if (self.inMovement):
-                if (self.lookingForReference):
-                    if (GPIO.input(self.referencePIN) == 1):
-                        #
-                        # stop pulses on step pin
-                        self.stopMovement()
-                        self.currPlatePosition = self.DEFAULT_PLATE_POSITION
-                        print("reference found")
-                        self.lookingForReference = False
-                else:
-                    if (self.moveToDemanded):
-                        if (self.pendingMovements <= 0):
-                            self.stopMovement()
-                            self.updatePosition = False
-                            self.moveToDemanded = False
+                #
+                # the motor is moving  due to lookingForReference or moveTo demand
+                if (self.inMovement):
+                    if (self.lookingForReference):
+                        if (self.referenceDetected or self.gpioControl.read(self.referencePIN) == 1):
+                            if (not self.referenceDetected):
+                                self.referenceEdges = self.edgeCount
+                            #
+                            # stop pulses on step pin, the steps of the ramp down are past the reference
+                            self.stopPulses()
+                            print("reference found")
+                            overshoot = (self.edgeCount - self.referenceEdges) * self.stepMicrosteps
+                            self.endMovement(positionMicrosteps = self.degreesToMicrosteps(self.DEFAULT_PLATE_POSITION) + overshoot, lookingForReference = False)
+                    else:
+                        if (self.moveToDemanded):
+                            if (self.pendingMovements <= 0 or (self.motionEngine != None and not self.motionEngine.isBusy())):
+                                if (self.motionEngine != None):
+                                    #
+                                    # the waveform ramps down by itself, wait for its last step.
+                                    # the position is exact even if some step edges were not counted
+                                    self.moveEndTimer.cancel()
+                                    self.motionEngine.waitEnd(0)
+                                    self.stopPulses()
+                                    if (self.moveDirection == self.MOVE_BACKWARD):
+                                        position = self.moveStartMicrosteps - self.moveSteps * self.stepMicrosteps
+                                    else:
+                                        position = self.moveStartMicrosteps + self.moveSteps * self.stepMicrosteps
+                                    self.endMovement(pendingMovements = 0, positionMicrosteps = position)
+                                else:
+                                    self.stopPulses()
+                                    self.endMovement()
                             
-                        count = count + 1
-                        if (count % 100 == 0):
                             if (appDebug):
                                 print("curr position:", int(self.currPlatePosition) , " - In movement: ", self.inMovement, " - Pending steps: ", self.pendingMovements)
+            #
+            # the commands not executed are cancelled
+            while (len(self.commands) > 0):
+                self.commands.popleft()[0].cancel()
 
     #
     # collaboative method to terminale
     def terminate(self):
         #
         # stop pulses on step pin and close connection
-        self.gpioControl.set_PWM_dutycycle(self.stepPin,0)
-        self.gpioControl.stop()
+        if (self.motionEngine != None):
+            self.motionEngine.release()
+        self.frequencyBackend.stop()
+        if (self.stepCounter != None):
+            self.stepCounter.terminate()
+        self.planner.terminate()
+        if (self.stepLossDetector != None):
+            self.stepLossDetector.terminate()
+        #
+        # the shared connection is closed by the last motor
+        if (self.usesSharedConnection):
+            with self.sharedConnectionLock:
+                stepMotorDriver8825.sharedConnectionUsers = stepMotorDriver8825.sharedConnectionUsers - 1
+                if (stepMotorDriver8825.sharedConnectionUsers == 0):
+                    self.gpioControl.stop()
+                    stepMotorDriver8825.gpioControl = None
                 
         self.loop_active = False
+        self.motionEvent.set()
 
 
 
-class motorControlTerminalConnection(threading.Thread):
+class motorControlTerminalConnection(terminalConnection):
     """ Connection instance from TCP/IP terminal to control de motor """
-    loop_active = True
-    sock = None
     motorControl = None
+    #
+    # latencies of the commands of the motor
+    latency = None
+    #
+    # letters of the commands, their latencies are measured apart
+    COMMANDS = "F012345MRASHDLVT+-"
+    #
+    # commands that move the motor to a position, they complete when it stops
+    POSITION_COMMANDS = "12345MRA"
+
+    #
+    # static part of the menu, encoded once for all the connections
+    MENU = ("\r\n"
+            "=================  Plate control menu ===============\r\n"
+            "\r\n"
+            "                 1.-  Move to 0\r\n"
+            "                 2.-  Move to 45\r\n"
+            "                 3.-  Move to 90\r\n"
+            "                 4.-  Move to 135\r\n"
+            "                 5.-  Move to  180\r\n"
+            "                 M.-  Move to angle (M<angle>, 0-360)\r\n"
+            "\r\n"
+            "                 F.-  Fix\r\n"
+            "                 R.-  Search reference\r\n"
+            "                 A.-  Advance One step\r\n"
+            "\r\n"
+            "                 S.-  Start\r\n"
+            "                 H.-  Halt\r\n"
+            "\r\n"
+            "                 D.-  Change Direction\r\n"
+            "                 +.-  Increase Speed \r\n"
+            "                  -.-  Decrease Speed \r\n"
+            "                 V.-  Set Speed (V<RPM>, 2-44)\r\n"
+            "\r\n"
+            "                 L.-  Command latencies\r\n"
+            "                 T.-  Terse mode on/off (no menu)\r\n"
+            "                 0.-  Close connection\r\n"
+            "\r\n").encode()
 
     def showMenu(self):
         try:
-            self.sock.send("\r\n".encode())
-            self.sock.send("=================  Plate control menu ===============\r\n".encode())
-            self.sock.send("\r\n".encode())
-            
-            self.sock.send("                 1.-  Move to 0\r\n".encode())
-            self.sock.send("                 2.-  Move to 45\r\n".encode())
-            self.sock.send("                 3.-  Move to 90\r\n".encode())
-            self.sock.send("                 4.-  Move to 135\r\n".encode())
-            self.sock.send("                 5.-  Move to  180\r\n".encode())
-            self.sock.send("\r\n".encode())
-            self.sock.send("                 F.-  Fix\r\n".encode())
-            self.sock.send("                 R.-  Search reference\r\n".encode())
-            self.sock.send("                 A.-  Advance One step\r\n".encode())
-            self.sock.send("\r\n".encode())
-            self.sock.send("                 S.-  Start\r\n".encode())
-            self.sock.send("                 H.-  Halt\r\n".encode())
-            self.sock.send("\r\n".encode())
-            self.sock.send("                 D.-  Change Direction\r\n".encode())
-            self.sock.send("                 +.-  Increase Speed \r\n".encode())
-            self.sock.send("                  -.-  Decrease Speed \r\n".encode())
-            self.sock.send("\r\n".encode())
-            self.sock.send("                 0.-  Close connection\r\n".encode())
-            self.sock.send("\r\n".encode())
-            self.sock.send(self.motorControl.getCurrParams().encode())
-            self.sock.send("\r\n".encode())
-            self.sock.send("\r\n".encode())
-            
-            self.sock.send("               Type option and press [Enter]:".encode())
+            self.sendMenu(self.MENU, self.motorControl.getCurrParams())
         except:
             print("Connection, error refreshing menu")
-        
-
-    def __init__(self,s=None, motorControl = None):
-        self.sock = s
-        self.sock.settimeout(0.2) # timeout for listening
-        self.motorControl = motorControl
-        self.showMenu()   
-        self.loop_active = True
-        threading.Thread.__init__(self)
-        self.start()
 
-    #
-    # closes the current server socket
-    def closeSocket(self):
+    def showLatencies(self):
+        """ sends the latency percentiles of the commands """
         try:
-            self.sock.shutdown(socket.SHUT_RDWR)
-            self.sock.close()
-            print("connection socket closed")
+            self.send("\r\n")
+            for line in self.latency.formatReport():
+                self.send(line + "\r\n")
         except:
-            print("error closing connetion socket")
-    
-    def run(self):
-        while self.loop_active:
-            try:
-                data = self.sock.recv(1024).decode()
-            except socket.timeout:
-                pass
-            except:
-                print ("unhandle exception in connection")
-                self.terminate()
-            else:
-                if (len(data) >= 1):
-                    if (data[0] == "F" or data[0] == "f"):
-                       self.motorControl.setReference()
-                    if (data[0] == "0"):
-                       self.terminate()
-                    if (data[0] == "1"):
-                        self.motorControl.moveTo(0)
-                    if (data[0] == "2"):
-                        self.motorControl.moveTo(45)
-                    if (data[0] == "3"):
-                        self.motorControl.moveTo(90)
-                    if (data[0] == "4"):
-                        self.motorControl.moveTo(135)
-                    if (data[0] == "5"):
-                        self.motorControl.moveTo(180)
-                    if (data[0] == "R" or data[0] == "r"):
-                        self.motorControl.lookForReference()
-                    if (data[0] == "A" or data[0] == "a"):
-                        self.motorControl.advanceOneDegree()
-                    if (data[0] == "S" or data[0] == "s"):
-                        self.motorControl.startMovement()
-                    if (data[0] == "H" or data[0] == "h"):
-                        self.motorControl.stopMovement()
-                    if (data[0] == "D" or data[0] == "d"):
-                        self.motorControl.switchDirection()
-                    if (data[0] == "+"):
-                        #
-                        # maximun of 44-45 RPM
-                        if (self.motorControl.getCurrRPM() < 44):
-                            newRPM = int(round(self.motorControl.getCurrRPM())) + 1
-                            self.motorControl.changeSpeed(newRPM)
-                    if (data[0] == "-"):
-                        #
-                        # minimum of 1-2 RPM
-                        if (self.motorControl.getCurrRPM() > 2):
-                            newRPM = int(round(self.motorControl.getCurrRPM())) - 1
-                            self.motorControl.changeSpeed(newRPM)
-                    
-                        
+            print("Connection, error sending latencies")
+        
 
-                    self.showMenu();
-                    
-            
-    #
-    # collaboative method to terminale
-    def terminate(self):
-        self.loop_active = False
-        try:
-            self.sock.send("\r\n".encode())
-            self.sock.send("Connection Closed\r\n".encode())
-            self.sock.send("\r\n".encode())
-            self.closeSocket()
-        except:
-            print ("Unhandle terminating Connection")
+    def __init__(self, server, s, motorControl = None):
+        terminalConnection.__init__(self, server, s)
+        self.motorControl = motorControl
+        self.latency = commandLatencyRecorder.forMotor(motorControl, self.COMMANDS)
+
+    def opened(self):
+        self.motorControl.stepLossCallbacks.append(self.stepLost)
+        self.showMenu()
+
+    def closed(self):
+        if (self.stepLost in self.motorControl.stepLossCallbacks):
+            self.motorControl.stepLossCallbacks.remove(self.stepLost)
+
+    def stepLost(self, motorControl, reason, commanded, counted):
+        """ step loss callback (detector thread), the operator is told """
+        self.server.callFromThread(self.send, "\r\n" + describeStepLoss(reason, commanded, counted) + "\r\n")
+
+    def commandReceived(self, data):
+        command = self.latency.received(data[0])
+        result = None
+        if (data[0] == "F" or data[0] == "f"):
+           result = self.motorControl.setReference()
+        if (data[0] == "0"):
+           self.terminate()
+        if (data[0] == "1"):
+            result = self.motorControl.moveTo(0)
+        if (data[0] == "2"):
+            result = self.motorControl.moveTo(45)
+        if (data[0] == "3"):
+            result = self.motorControl.moveTo(90)
+        if (data[0] == "4"):
+            result = self.motorControl.moveTo(135)
+        if (data[0] == "5"):
+            result = self.motorControl.moveTo(180)
+        if (data[0] == "M" or data[0] == "m"):
+            angle = parseArgument(data, 0, 360)
+            if (angle != None):
+                result = self.motorControl.moveTo(angle)
+            else:
+                self.send("\r\nInvalid angle: " + data + "\r\n")
+        if (data[0] == "R" or data[0] == "r"):
+            result = self.motorControl.lookForReference()
+        if (data[0] == "A" or data[0] == "a"):
+            result = self.motorControl.advanceOneDegree()
+        if (data[0] == "S" or data[0] == "s"):
+            result = self.motorControl.startMovement()
+        if (data[0] == "H" or data[0] == "h"):
+            result = self.motorControl.stopMovement()
+        if (data[0] == "D" or data[0] == "d"):
+            result = self.motorControl.switchDirection()
+        if (data[0] == "+"):
+            #
+            # maximun of 44-45 RPM
+            result = self.motorControl.changeSpeedBy(1, 2, 44)
+        if (data[0] == "-"):
+            #
+            # minimum of 1-2 RPM
+            result = self.motorControl.changeSpeedBy(-1, 2, 44)
+        if (data[0] == "V" or data[0] == "v"):
+            newRPM = parseArgument(data, 2, 44)
+            if (newRPM != None):
+                result = self.motorControl.changeSpeed(newRPM)
+            else:
+                self.send("\r\nInvalid speed: " + data + "\r\n")
+        if (data[0] == "L" or data[0] == "l"):
+            self.showLatencies()
+        if (data[0] == "T" or data[0] == "t"):
+            self.terse = not self.terse
+
+        self.latency.handled(command, result, data[0].upper() in self.POSITION_COMMANDS)
+        self.showMenu();
+        self.latency.answered(command)
             
 
-class motorControlTerminalServer(threading.Thread):
+class motorControlTerminalServer(terminalServer):
     """ TCP/IP socket server class that admit connections of 12345
           on connection a motorControlTerminalConnection is created to
-          process command to control de step motor """
+          process command to control de step motor, and connections of the
+          binary protocol on 12346, all the clients are served by the thread
+          of the server """
     
-    loop_active = True
-    
-    client = None
+    BINARY_PORT = BINARY_PORT
     motorControl = None
-    TCP_IP = '0.0.0.0'
-    TCP_PORT = 12345
-    BUFFER_SIZE = 1024  # Normally 1024, but we want fast response
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
     def __init__(self, motorControl):
-        self.s.bind((self.TCP_IP, self.TCP_PORT))
-        self.s.listen(1)
         self.motorControl= motorControl
-        self.loop_active = True
-        threading.Thread.__init__(self)
-        self.start()
-
-    #
-    # closes the current server socket
-    def closeSocket(self):
-        try:
-            self.s.close()
-            print("server socket closed")
-        except:
-            print("error closing server socket")
-    
-    def run(self):
-        while self.loop_active:
-            try:
-                self.s.settimeout(0.2) # timeout for listening
-                self.s.listen(1)
-                (conn, (ip, port)) = self.s.accept()
-            except socket.timeout:
-                pass
-            except:
-                print ("Unhandle exception ControlTerminal")
-                self.terminate()
-            else:
-                # work with the connection, create a thread etc.
-                print("connection!")
-                self.client = motorControlTerminalConnection(conn,self.motorControl)
-                   
-    #
-    # collaboative method to terminale
-    def terminate(self):
-        self.loop_active = False
-        try:
-            if (not self.client == None):
-                print ("Finishing client ...")
-                self.client.terminate()
-        except:
-            print ("Unhandle terminating ControlTerminal")
-
-        self.closeSocket()
+        terminalServer.__init__(self, motorControlTerminalConnection, binaryConnection, (motorControl, ))
 
 #
 # if we are not using it as a library
 if (drv8825RunMain):
+    #
+    # the GUI is only loaded by the APP, not by the stations that import the driver
+    from tkinter import *
+    import tkinter.font
+
     #
     # create the plate control thread 
     motor_control = stepMotorDriver8825()
@@ -701,3 +1151,6 @@ if (drv8825RunMain):
     # kill  plate control thread
     motor_control.terminate()
 
+    #
+    # where the time of the commands went
+    commandLatencyRecorder.forMotor(motor_control).dump()
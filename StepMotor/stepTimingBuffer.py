@@ -0,0 +1,149 @@
+""" Ring buffer of the tick of each step edge
+
+Description:
+    The pigpio callback of the step count pin receives the tick (us) of each edge.
+    This module implements a fixed size ring buffer, backed by array('I'), where
+    the ticks are written without allocating: the memory does not grow however
+    long the motor runs. The owner of the buffer can write the tick of its step n in
+    ticks[n & mask] itself and give the steps written with counter, the step callback
+    of the driver does not make a call per edge. The last N steps can be analyzed:
+       * intervals between steps in us
+       * jitter percentiles (deviation of the intervals from the commanded period)
+       * achieved frequency against the commanded one
+
+    When numpy is installed the analysis is vectorized, numpy is imported by
+    the first analysis (loadNumpy), not with the module
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+from array import array
+
+#
+# numpy module, None if it is not installed, False until the first analysis
+numpy = False
+
+
+def loadNumpy():
+    """ imports numpy the first time, returns None if it is not installed """
+    global numpy
+    if (numpy is False):
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
+#
+# default jitter percentiles
+DEFAULT_PERCENTILES = (50, 90, 99, 99.9)
+
+
+def percentile(values, p):
+    """ p percentile of sorted values (nearest rank) """
+    if (len(values) == 0):
+        return None
+    rank = int(round(p / 100.0 * (len(values) - 1)))
+    return values[rank]
+
+
+class stepTimingBuffer:
+    """ fixed size ring buffer of the ticks of the steps """
+
+    #
+    # default number of steps kept
+    DEFAULT_SIZE = 4096
+
+    # counter returns the steps written when the owner writes ticks[n & mask], by default
+    # the steps written with record are counted
+    def __init__(self, size = DEFAULT_SIZE, counter = None):
+        #
+        # the size is rounded up to a power of two to wrap with a mask
+        self.size = 1
+        while (self.size < size):
+            self.size = self.size * 2
+        self.mask = self.size - 1
+        self.ticks = array("I", bytes(4 * self.size))
+        #
+        # ticks written since the creation, the next one goes to count & mask,
+        # the ticks before base are cleared
+        self.count = 0
+        self.counter = counter
+        self.base = 0
+
+    def record(self, tick):
+        """ writes the tick of a step """
+        self.ticks[self.count & self.mask] = tick
+        self.count = self.count + 1
+
+    def written(self):
+        """ ticks written since the creation """
+        if (self.counter != None):
+            return self.counter()
+        return self.count
+
+    def clear(self):
+        self.base = self.written()
+
+    def lastTicks(self, steps = None):
+        """ return the ticks of the last steps (all the kept ones by default), the oldest first """
+        count = self.written()
+        available = min(count - self.base, self.size)
+        if (steps == None or steps > available):
+            steps = available
+        end = count & self.mask
+        start = (count - steps) & self.mask
+        if (steps == 0):
+            return array("I")
+        if (start < end):
+            return self.ticks[start:end]
+        return self.ticks[start:] + self.ticks[:end]
+
+    def intervals(self, steps = None):
+        """ return the us between the last steps, the tick wraps around every 72 minutes """
+        ticks = self.lastTicks(None if steps == None else steps + 1)
+        numpy = loadNumpy()
+        if (numpy != None):
+            values = numpy.frombuffer(ticks, dtype = numpy.uint32)
+            return numpy.diff(values).astype(numpy.uint32)
+        return array("I", [(ticks[i + 1] - ticks[i]) & 0xFFFFFFFF for i in range(len(ticks) - 1)])
+
+    def achievedFrequency(self, steps = None):
+        """ return the average step frequency of the last steps, None if there are not enough steps """
+        intervals = self.intervals(steps)
+        if (len(intervals) == 0):
+            return None
+        numpy = loadNumpy()
+        if (numpy != None):
+            total = int(intervals.sum(dtype = numpy.uint64))
+        else:
+            total = sum(intervals)
+        if (total == 0):
+            return None
+        return len(intervals) * 1000000.0 / total
+
+    def jitterPercentiles(self, commandedFreq = None, steps = None, percentiles = DEFAULT_PERCENTILES):
+        """ return the percentiles (dict) in us of the deviation of the intervals of the last steps
+            from the period of commandedFreq, from the mean interval if it is not given """
+        intervals = self.intervals(steps)
+        if (len(intervals) == 0):
+            return {}
+        numpy = loadNumpy()
+        if (numpy != None):
+            values = intervals.astype(numpy.float64)
+            period = values.mean() if commandedFreq == None else 1000000.0 / commandedFreq
+            deviations = numpy.abs(values - period)
+            return dict(zip(percentiles, [float(value) for value in numpy.percentile(deviations, percentiles)]))
+        period = sum(intervals) / float(len(intervals)) if commandedFreq == None else 1000000.0 / commandedFreq
+        deviations = sorted([abs(interval - period) for interval in intervals])
+        return dict([(p, percentile(deviations, p)) for p in percentiles])
+
+    def report(self, commandedFreq, steps = None):
+        """ return the commanded and achieved frequency and the jitter of the last steps """
+        achieved = self.achievedFrequency(steps)
+        error = None
+        if (achieved != None and commandedFreq):
+            error = (achieved - commandedFreq) * 100.0 / commandedFreq
+        return {"steps": len(self.intervals(steps)), "commanded": commandedFreq, "achieved": achieved,
+                "error %": error, "jitter us": self.jitterPercentiles(commandedFreq, steps)}
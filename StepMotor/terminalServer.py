@@ -0,0 +1,403 @@
+""" Event driven TCP-IP server of the remote terminals
+
+Description:
+    The terminals of the plate, the helicopter and the part sorting APP are served
+    by one thread that waits with selectors on the server socket, the sockets of
+    the clients and a wake up pipe:
+       * the connections are accepted as soon as they arrive, there is no accept timeout
+       * any number of clients are served at once (operator telnet, line PC,
+         monitoring...) without a thread per client
+       * the text received is split in lines (a command per line, the partial line
+         is kept until the rest arrives), the connection runs each one in order
+         (commandReceived), the clients can send several commands at once
+       * the answers are queued and sent together when the event is processed (one
+         send instead of one per line), a slow client does not stop the others
+       * the menus are encoded once by each station (sendMenu), in terse mode the
+         connection only sends the line of the current parameters
+       * the other threads (pigpio callbacks, Futures of the motor, Timers) run code
+         in the server thread with callFromThread, the connections are only used
+         from the server thread
+       * the commands never wait for the motor: the movements are handed to the
+         control thread of the driver (Futures), a command that sleeps (the ramps of
+         the PWM) stops every client
+       * a client that does not read its answers is closed when MAX_OUTPUT bytes
+         are waiting to be sent to it
+
+    With no activity the thread is blocked in select, it uses no CPU. The server
+    can listen on a second port (BINARY_PORT) whose clients are served by the
+    same thread. The connections of each port are instances of the classes given
+    to the server, created with the server, the socket and connectionArgs:
+
+        server = terminalServer(myTerminalConnection, connectionArgs = (motorControl, ))
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import math
+import re
+import selectors
+import socket
+import threading
+from collections import deque
+
+#
+# end of the commands: telnet sends "\r\n" ("\r\0" some clients), other clients "\n"
+LINE_END = re.compile("[\r\n]")
+
+#
+# longest command kept waiting for its end, longer lines are discarded
+MAX_LINE = 256
+
+#
+# most bytes waiting to be sent to a client, a client that does not read is closed
+MAX_OUTPUT = 65536
+
+#
+# end of the menus, after the line of the current parameters
+PROMPT = b"\r\n\r\n               Type option and press [Enter]:"
+
+
+def parseArgument(data, minimum, maximum):
+    """ returns the number after the command letter (i.e: "M90" -> 90.0),
+        None if it is not a number between minimum and maximum """
+    try:
+        value = float(data[1:])
+    except ValueError:
+        return None
+    #
+    # nan is not rejected by the comparisons
+    if (not math.isfinite(value)):
+        return None
+    if (value < minimum or value > maximum):
+        return None
+    return value
+
+
+class terminalConnection:
+    """ client of a terminalServer, the subclasses process the data received """
+
+    def __init__(self, server, sock):
+        self.server = server
+        self.sock = sock
+        #
+        # bytes waiting to be sent
+        self.output = bytearray()
+        #
+        # events the server waits for on the socket
+        self.events = selectors.EVENT_READ
+        #
+        # closed as soon as the output is sent
+        self.closing = False
+        self.active = True
+        #
+        # text received after the last end of line
+        self.partial = ""
+        #
+        # the rest of a line too long is dropped until its end
+        self.discarding = False
+        #
+        # terse mode, the menu is not sent (scripted clients)
+        self.terse = False
+
+    def opened(self):
+        """ called when the connection is accepted """
+        pass
+
+    def received(self, data):
+        """ splits the data received from the client in commands (lines), they are run in order """
+        lines = LINE_END.split(self.partial + data.decode(errors = "replace"))
+        self.partial = lines.pop()
+        if (self.discarding):
+            if (len(lines) > 0):
+                #
+                # the end of the line too long, the next commands are run
+                lines.pop(0)
+                self.discarding = False
+            else:
+                self.partial = ""
+        if (len(self.partial) > MAX_LINE):
+            print("Connection, command too long discarded")
+            self.partial = ""
+            self.discarding = True
+        for line in lines:
+            line = line.strip(" \t\0")
+            if (len(line) > 0 and self.active and not self.closing):
+                self.commandReceived(line)
+
+    def commandReceived(self, data):
+        """ called with each command (a line without its end) received from the client """
+        pass
+
+    def closed(self):
+        """ called when the connection is closed, by any of the sides """
+        pass
+
+    def send(self, data):
+        """ queues data (text or bytes) to the client, the server sends it when the current event is processed """
+        if (not self.active or self.closing):
+            return
+        if (isinstance(data, str)):
+            data = data.encode()
+        if (len(self.output) + len(data) > MAX_OUTPUT):
+            print("Connection, the client does not read its answers, closed")
+            del self.output[:]
+            self.server.drop(self)
+            return
+        self.output.extend(data)
+
+    def sendMenu(self, menu, params):
+        """ sends the menu (bytes encoded once by the station), the line of the current
+            parameters and the prompt in one piece, only the parameters in terse mode """
+        if (self.terse):
+            self.send(params + "\r\n")
+        else:
+            self.send(menu + params.encode() + PROMPT)
+
+    def close(self):
+        """ closes the connection once the queued data is sent """
+        self.closing = True
+
+    #
+    # collaboative method to terminale
+    def terminate(self):
+        self.send("\r\nConnection Closed\r\n\r\n")
+        self.close()
+
+    #
+    # closes the current connection socket
+    def closeSocket(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+            print("connection socket closed")
+        except:
+            print("error closing connetion socket")
+
+
+class terminalServer(threading.Thread):
+    """ TCP/IP socket server that serves all its connections from one thread,
+          the clients of each port are served by an instance of its connection class """
+
+    loop_active = True
+    TCP_IP = '0.0.0.0'
+    TCP_PORT = 12345
+    BUFFER_SIZE = 1024  # Normally 1024, but we want fast response
+    #
+    # connections waiting to be accepted
+    BACKLOG = 16
+    #
+    # port of the binary protocol, None if the server does not accept it
+    BINARY_PORT = None
+    #
+    # the server sockets are opened by __init__, importing the module does not bind the port
+    s = None
+    binary = None
+
+    def __init__(self, connectionClass = terminalConnection, binaryConnectionClass = None, connectionArgs = ()):
+        if (binaryConnectionClass == None):
+            #
+            # the binary protocol module imports this one
+            from binaryTerminal import binaryConnection
+            binaryConnectionClass = binaryConnection
+        #
+        # classes of the connections of TCP_PORT and BINARY_PORT, created with (server, socket, *connectionArgs)
+        self.connectionClass = connectionClass
+        self.binaryConnectionClass = binaryConnectionClass
+        self.connectionArgs = tuple(connectionArgs)
+        self.selector = selectors.DefaultSelector()
+        #
+        # function that creates the connections of each server socket
+        self.listeners = {}
+        self.s = self.addListener(self.TCP_PORT, self.createConnection)
+        if (self.BINARY_PORT != None):
+            self.binary = self.addListener(self.BINARY_PORT, self.createBinaryConnection)
+        #
+        # a byte written in the pipe wakes up the server thread
+        self.wakeRead, self.wakeWrite = socket.socketpair()
+        self.wakeRead.setblocking(False)
+        self.wakeWrite.setblocking(False)
+        self.selector.register(self.wakeRead, selectors.EVENT_READ)
+        #
+        # (function, args) demanded by other threads
+        self.calls = deque()
+        #
+        # connection of each client socket
+        self.connections = {}
+        self.loop_active = True
+        threading.Thread.__init__(self)
+        self.start()
+
+    def isActive(self):
+        return self.loop_active
+
+    def addListener(self, port, createConnection):
+        """ accepts the clients of port, createConnection(sock) returns their terminalConnection """
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.TCP_IP, port))
+        listener.listen(self.BACKLOG)
+        listener.setblocking(False)
+        self.listeners[listener] = createConnection
+        self.selector.register(listener, selectors.EVENT_READ)
+        return listener
+
+    def createConnection(self, sock):
+        """ returns the terminalConnection that serves a new client """
+        return self.connectionClass(self, sock, *self.connectionArgs)
+
+    def createBinaryConnection(self, sock):
+        """ returns the connection that serves a new client of BINARY_PORT """
+        return self.binaryConnectionClass(self, sock, *self.connectionArgs)
+
+    def callFromThread(self, function, *args):
+        """ function(*args) is called by the server thread, it can be called from any thread """
+        self.calls.append((function, args))
+        self.wake()
+
+    def wake(self):
+        try:
+            self.wakeWrite.send(b"\0")
+        except OSError:
+            #
+            # the pipe is full (the thread is already woken up) or the server is closed
+            pass
+
+    def accept(self, listener):
+        try:
+            (conn, (ip, port)) = listener.accept()
+        except OSError:
+            return
+        print("connection!")
+        conn.setblocking(False)
+        #
+        # the answers are already sent in one piece, they are not delayed waiting for the ACK
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = self.listeners[listener](conn)
+        self.connections[conn] = connection
+        self.selector.register(conn, connection.events, connection)
+        connection.opened()
+
+    def read(self, connection):
+        try:
+            data = connection.sock.recv(self.BUFFER_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if (len(data) == 0):
+            #
+            # the client has closed the connection
+            self.drop(connection)
+        else:
+            connection.received(data)
+
+    def flush(self, connection):
+        """ sends the queued data of the connection, waits for the socket if it does not accept all """
+        if (not connection.active):
+            return
+        if (len(connection.output) > 0):
+            try:
+                sent = connection.sock.send(connection.output)
+                del connection.output[:sent]
+            except BlockingIOError:
+                pass
+            except OSError:
+                self.drop(connection)
+                return
+        if (connection.closing and len(connection.output) == 0):
+            self.drop(connection)
+            return
+        events = selectors.EVENT_WRITE if len(connection.output) > 0 else 0
+        if (not connection.closing):
+            events = events | selectors.EVENT_READ
+        if (events != connection.events):
+            connection.events = events
+            self.selector.modify(connection.sock, events, connection)
+
+    def flushAll(self):
+        """ sends the data queued by the connections while the events were processed """
+        for connection in list(self.connections.values()):
+            if (len(connection.output) > 0 or connection.closing):
+                self.flush(connection)
+
+    def drop(self, connection):
+        """ closes the connection at once """
+        if (not connection.active):
+            return
+        connection.active = False
+        self.selector.unregister(connection.sock)
+        del self.connections[connection.sock]
+        try:
+            connection.closed()
+        except:
+            print ("Unhandle terminating Connection")
+        connection.closeSocket()
+
+    def runCalls(self):
+        try:
+            while (len(self.wakeRead.recv(4096)) > 0):
+                pass
+        except BlockingIOError:
+            pass
+        while (len(self.calls) > 0):
+            function, args = self.calls.popleft()
+            try:
+                function(*args)
+            except:
+                print ("Unhandle exception in call from thread")
+
+    def run(self):
+        print("Wating client ...")
+        try:
+            while self.loop_active:
+                for key, events in self.selector.select():
+                    if (key.fileobj in self.listeners):
+                        self.accept(key.fileobj)
+                    elif (key.fileobj is self.wakeRead):
+                        self.runCalls()
+                    else:
+                        connection = key.data
+                        try:
+                            if (events & selectors.EVENT_WRITE):
+                                self.flush(connection)
+                            if (events & selectors.EVENT_READ and connection.active):
+                                self.read(connection)
+                        except:
+                            print ("unhandle exception in connection")
+                            self.drop(connection)
+                self.flushAll()
+        except:
+            print ("Unhandle exception ControlTerminal")
+            self.loop_active = False
+        finally:
+            for connection in list(self.connections.values()):
+                print ("Finishing client ...")
+                connection.terminate()
+                self.flush(connection)
+                self.drop(connection)
+            self.selector.close()
+            self.closeSocket()
+            self.wakeRead.close()
+            self.wakeWrite.close()
+
+    #
+    # closes the current server sockets
+    def closeSocket(self):
+        try:
+            for listener in self.listeners:
+                listener.close()
+            print("server socket closed")
+        except:
+            print("error closing server socket")
+
+    #
+    # collaboative method to terminale, the clients are closed before it returns
+    def terminate(self):
+        self.loop_active = False
+        self.wake()
+        if (threading.current_thread() is not self and self.is_alive()):
+            self.join()
@@ -0,0 +1,237 @@
+""" Virtual clock to run the step motor control faster than real time
+
+Description:
+    The control classes wait with the time and threading primitives of a clock
+    (sleep, Event, Timer). This module implements a clock whose time only advances
+    when every thread taking part in the simulation is blocked waiting on it, then
+    it jumps to the next thing that happens:
+       * the end of a sleep, a wait timeout or a Timer
+       * the next event of a hardware source (i.e. an edge of the simulated step pin)
+
+    The threads take part with:
+
+        with clock.participant():
+            ... loop of the thread ...
+
+    The hardware events and the Timers are processed by the thread that advances the
+    clock, their callbacks are called inline as the pigpio callbacks would be called.
+    While a participant runs the virtual time does not move, so the simulation is
+    deterministic as long as all the threads that drive it are participants: the
+    time is spent as fast as the CPU allows.
+
+    A thread that is not a participant (i.e. waiting on a socket) can use the clock,
+    but the virtual time can go on while it runs
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import contextlib
+import heapq
+import itertools
+import threading
+
+
+class clockWaiter:
+    """ a thread blocked on the clock """
+
+    __slots__ = ("participant", "woken")
+
+    def __init__(self, participant):
+        self.participant = participant
+        self.woken = False
+
+
+class virtualTimer:
+    """ threading.Timer on virtual time, function is called by the thread that advances the clock """
+
+    def __init__(self, clock, interval, function, args = None, kwargs = None):
+        self.clock = clock
+        self.interval = interval
+        self.function = function
+        self.args = args if args != None else []
+        self.kwargs = kwargs if kwargs != None else {}
+        self.cancelled = False
+        self.daemon = True
+
+    def start(self):
+        self.clock.schedule(self.clock.now + self.interval, self)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def fire(self):
+        if (not self.cancelled):
+            self.function(*self.args, **self.kwargs)
+
+
+class virtualEvent:
+    """ threading.Event on virtual time """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.flag = False
+        self.waiters = []
+
+    def is_set(self):
+        return self.flag
+
+    isSet = is_set
+
+    def set(self):
+        with self.clock.condition:
+            self.flag = True
+            for waiter in self.waiters:
+                self.clock.wake(waiter)
+            self.waiters = []
+
+    def clear(self):
+        with self.clock.condition:
+            self.flag = False
+
+    def wait(self, timeout = None):
+        with self.clock.condition:
+            if (self.flag or (timeout != None and timeout <= 0)):
+                return self.flag
+            waiter = self.clock.waiter()
+            self.waiters.append(waiter)
+            if (timeout != None):
+                self.clock.schedule(self.clock.now + timeout, waiter)
+            self.clock.block(waiter)
+            if (waiter in self.waiters):
+                self.waiters.remove(waiter)
+            return self.flag
+
+
+class virtualClock:
+    """ time in seconds that advances when all the participant threads are blocked """
+
+    def __init__(self, start = 0.0):
+        self.now = start
+        #
+        # protects the clock and the simulated hardware, the callbacks can use the clock
+        self.condition = threading.Condition(threading.RLock())
+        #
+        # wake ups pending: (time, sequence, clockWaiter or virtualTimer)
+        self.pending = []
+        self.sequence = itertools.count()
+        #
+        # hardware sources: objects with nextEventTime() (None if nothing is pending)
+        # and process(now), that handles their next event
+        self.sources = []
+        #
+        # participant threads not blocked on the clock
+        self.running = 0
+        self.local = threading.local()
+        #
+        # statistics
+        self.wakeUps = 0
+        self.hardwareEvents = 0
+
+    def time(self):
+        """ virtual seconds """
+        return self.now
+
+    def addSource(self, source):
+        with self.condition:
+            self.sources.append(source)
+
+    @contextlib.contextmanager
+    def participant(self):
+        """ the current thread takes part in the simulation while in the context """
+        with self.condition:
+            depth = getattr(self.local, "depth", 0)
+            self.local.depth = depth + 1
+            if (depth == 0):
+                self.running = self.running + 1
+        try:
+            yield self
+        finally:
+            with self.condition:
+                self.local.depth = self.local.depth - 1
+                if (self.local.depth == 0):
+                    self.running = self.running - 1
+                    #
+                    # the blocked threads have to advance the clock
+                    if (self.running == 0):
+                        self.condition.notify_all()
+
+    def isParticipant(self):
+        return getattr(self.local, "depth", 0) > 0
+
+    def waiter(self):
+        return clockWaiter(self.isParticipant())
+
+    def schedule(self, when, item):
+        """ wakes up a clockWaiter or fires a virtualTimer at when """
+        with self.condition:
+            heapq.heappush(self.pending, (when, next(self.sequence), item))
+
+    def wake(self, waiter):
+        """ the thread of waiter can run, the clock is held while it runs if it is a participant """
+        if (not waiter.woken):
+            waiter.woken = True
+            if (waiter.participant):
+                self.running = self.running + 1
+            self.condition.notify_all()
+
+    def block(self, waiter):
+        """ blocks the current thread until waiter is woken, the condition must be held """
+        if (waiter.participant):
+            self.running = self.running - 1
+        while (not waiter.woken):
+            if (self.running == 0):
+                self.advance(waiter)
+            if (not waiter.woken):
+                self.condition.wait()
+
+    def nextSource(self):
+        """ the hardware source with the earliest event and its time """
+        first = None
+        firstTime = None
+        for source in self.sources:
+            when = source.nextEventTime()
+            if (when != None and (firstTime == None or when < firstTime)):
+                first = source
+                firstTime = when
+        return first, firstTime
+
+    def advance(self, waiter):
+        """ moves the time to the next events until a participant can run or waiter is woken """
+        while (self.running == 0 and not waiter.woken):
+            source, sourceTime = self.nextSource()
+            if (len(self.pending) > 0 and (sourceTime == None or self.pending[0][0] <= sourceTime)):
+                when, sequence, item = heapq.heappop(self.pending)
+                self.now = max(self.now, when)
+                if (isinstance(item, virtualTimer)):
+                    item.fire()
+                else:
+                    self.wakeUps = self.wakeUps + 1
+                    self.wake(item)
+            elif (source != None):
+                self.now = max(self.now, sourceTime)
+                self.hardwareEvents = self.hardwareEvents + 1
+                source.process(self.now)
+            else:
+                #
+                # nothing will happen, only a thread out of the simulation can wake up the others
+                return
+
+    def sleep(self, seconds):
+        with self.condition:
+            waiter = self.waiter()
+            self.schedule(self.now + max(0, seconds), waiter)
+            self.block(waiter)
+
+    def Event(self):
+        return virtualEvent(self)
+
+    def Timer(self, interval, function, args = None, kwargs = None):
+        return virtualTimer(self, interval, function, args, kwargs)
+
+    def result(self, future, timeout = None):
+        """ the result of a concurrent.futures.Future waiting on virtual time """
+        done = self.Event()
+        future.add_done_callback(lambda f: done.set())
+        done.wait(timeout)
+        return future.result(0)
@@ -0,0 +1,463 @@
+""" Step motor movements generated as pigpio waveforms
+
+Description:
+    This module implements a class that builds each movement of the motor (ramp up,
+    cruise and ramp down) as a pigpio pulse train. The DMA of the PI emits exactly the
+    demanded steps with exact timing, python does no work per step.
+
+    The ramps use a constant acceleration, the frequency of the step i of a ramp is
+    sqrt(startFreq^2 + 2 * acceleration * i)
+
+Author:
+    Pablo Rodriguez-2018
+
+'"""
+import math
+from collections import OrderedDict
+
+from hardwareBackend import pigpio, clock
+from stepFrequencyBackend import claimWaveTransmitter
+
+
+class waveCache:
+    """ LRU cache of the waveforms created in pigpio
+
+    The daemon has a limited number of wave ids and pulses, the least recently used
+    waveforms are deleted to keep the cache within maxWaves and maxPulses.
+    The waveforms of the movement in progress of each engine are pinned and never deleted.
+    pigpio has a single waveform memory, the engines on the same connection share a cache,
+    the keys of the engines include their step pin mask """
+
+    #
+    # pigpio allows 250 wave ids, some are left for other users
+    DEFAULT_MAX_WAVES = 200
+
+    #
+    # cache of each pigpio connection
+    connectionCaches = {}
+
+    @classmethod
+    def forConnection(cls, gpioControl):
+        """ returns the cache shared by the engines of gpioControl """
+        if (gpioControl not in cls.connectionCaches):
+            cache = cls(gpioControl)
+            #
+            # the engines own the transmitter, the step frequency backends of the
+            # connection use the PWM of their pins
+            if (not claimWaveTransmitter(gpioControl, cache)):
+                print("Wave cache, the waveform transmitter is in use")
+            cls.connectionCaches[gpioControl] = cache
+        return cls.connectionCaches[gpioControl]
+
+    def __init__(self, gpioControl, maxWaves = DEFAULT_MAX_WAVES, maxPulses = None):
+        self.gpioControl = gpioControl
+        self.gpioControl.wave_clear()
+        self.maxWaves = maxWaves
+        self.maxPulses = maxPulses
+        if (self.maxPulses == None):
+            self.maxPulses = gpioControl.wave_get_max_pulses()
+        #
+        # key: (waveId, duration in s, number of pulses)
+        self.entries = OrderedDict()
+        #
+        # owner: waveform ids pinned by the owner
+        self.pinned = {}
+        self.pulses = 0
+        #
+        # engine that sent the last wave_chain, wave_tx_at can not locate the waveforms of a chain
+        self.chainSender = None
+        #
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """ returns the entry of key and marks it as the most recently used, None if not cached """
+        entry = self.entries.get(key)
+        if (entry == None):
+            self.misses = self.misses + 1
+        else:
+            self.hits = self.hits + 1
+            self.entries.move_to_end(key)
+        return entry
+
+    def contains(self, keys):
+        """ True if all the keys are cached """
+        for key in keys:
+            if (key not in self.entries):
+                return False
+        return True
+
+    def pin(self, owner, waveId):
+        """ the waveform is used by owner, it can not be deleted """
+        self.pinned.setdefault(owner, set()).add(waveId)
+
+    def unpin(self, owner):
+        """ the waveforms of owner can be deleted """
+        self.pinned.pop(owner, None)
+
+    def isPinned(self, waveId):
+        for waveIds in self.pinned.values():
+            if (waveId in waveIds):
+                return True
+        return False
+
+    def makeRoom(self, pulses):
+        """ deletes least recently used waveforms until one of pulses fits, False if not possible """
+        for key in list(self.entries.keys()):
+            if (len(self.entries) < self.maxWaves and self.pulses + pulses <= self.maxPulses):
+                break
+            if (not self.isPinned(self.entries[key][0])):
+                self.evict(key)
+        return len(self.entries) < self.maxWaves and self.pulses + pulses <= self.maxPulses
+
+    def add(self, key, waveId, duration, pulses):
+        """ adds a created waveform, returns its entry """
+        entry = (waveId, duration, pulses)
+        self.entries[key] = entry
+        self.pulses = self.pulses + pulses
+        return entry
+
+    def evict(self, key):
+        """ deletes the waveform of key from pigpio """
+        entry = self.entries.pop(key)
+        self.pulses = self.pulses - entry[2]
+        self.evictions = self.evictions + 1
+        self.gpioControl.wave_delete(entry[0])
+
+    def clear(self):
+        """ deletes all the waveforms """
+        self.evictions = self.evictions + len(self.entries)
+        self.entries = OrderedDict()
+        self.pinned = {}
+        self.pulses = 0
+        self.gpioControl.wave_clear()
+
+    def getStats(self):
+        """ returns the cache statistics """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "waves": len(self.entries), "pulses": self.pulses}
+
+
+class waveMotionEngine:
+    """ Builds and sends the waveforms of the movements of a step pin
+
+    pigpio sends one waveform at a time, the engines of several motors can not move at
+    the same time: multiAxisCoordinator moves them with a combined waveform """
+
+    #
+    # default acceleration in steps/s^2, similar to the availableFreq ramp of the driver
+    DEFAULT_ACCELERATION = 20000
+
+    #
+    # default frequency where the ramps start
+    DEFAULT_START_FREQ = 100
+
+    #
+    # maximum steps of a ramp, each step takes two of the pulses pigpio can hold.
+    # if a ramp needs more steps the acceleration is increased to fit
+    MAX_RAMP_STEPS = 2000
+
+    #
+    # maximum repetitions of a wave_chain loop
+    MAX_LOOP_COUNT = 65535
+
+    #
+    # maximum number of compiled movements kept
+    MAX_CHAINS = 64
+
+    def __init__(self, gpioControl, stepPin, acceleration = DEFAULT_ACCELERATION, startFreq = DEFAULT_START_FREQ, cache = None):
+        self.gpioControl = gpioControl
+        self.stepMask = 1 << stepPin
+        self.acceleration = acceleration
+        self.startFreq = startFreq
+        #
+        # created waveforms, shared by all the movements
+        self.cache = cache
+        if (self.cache == None):
+            self.cache = waveCache.forConnection(gpioControl)
+        #
+        # compiled movements (microstep cfg, start freq, target freq, acceleration, steps, ramp):
+        # (wave_chain, duration in s, ramp down key, waveform keys)
+        self.chains = OrderedDict()
+        #
+        # waveforms of the current movement
+        self.waves = []
+        #
+        # waveform id: step frequency, the lowest one for the ramps
+        self.waveFrequencies = {}
+        #
+        # ramp down of the current movement and its duration in seconds
+        self.decelWave = None
+        self.decelDuration = 0
+        #
+        # ramp down key of the current moveTo, when its chain was sent and its duration
+        self.decelKey = None
+        self.moveStart = 0
+        self.moveDuration = 0
+        #
+        # True when the current movement runs until stop is demanded
+        self.continuous = False
+
+    def stepPulses(self, freq):
+        """ pulses of one step at freq, returns the pulses and its duration in us """
+        period = int(round(1000000.0 / freq))
+        highTime = period // 2
+        return [pigpio.pulse(self.stepMask, 0, highTime), pigpio.pulse(0, self.stepMask, period - highTime)], period
+
+    def rampFrequencies(self, targetFreq, steps = None):
+        """ frequencies of each step of a ramp up to targetFreq, at most steps/2 steps """
+        if (targetFreq <= self.startFreq):
+            return []
+
+        acceleration = self.acceleration
+        rampSteps = int(math.ceil((targetFreq ** 2 - self.startFreq ** 2) / (2.0 * acceleration)))
+        if (rampSteps > self.MAX_RAMP_STEPS):
+            rampSteps = self.MAX_RAMP_STEPS
+            acceleration = (targetFreq ** 2 - self.startFreq ** 2) / (2.0 * rampSteps)
+        #
+        # short movements do not reach the target frequency
+        if (steps != None):
+            rampSteps = min(rampSteps, steps // 2)
+
+        return [math.sqrt(self.startFreq ** 2 + 2 * acceleration * i) for i in range(rampSteps)]
+
+    def createWave(self, frequencies):
+        """ creates a waveform with a step at each frequency, returns its id, duration in s and pulses """
+        pulses = []
+        duration = 0
+        for freq in frequencies:
+            stepPulses, period = self.stepPulses(freq)
+            pulses.extend(stepPulses)
+            duration = duration + period
+
+        if (not self.cache.makeRoom(len(pulses))):
+            raise ValueError("waveform of " + str(len(pulses)) + " pulses does not fit in pigpio")
+        self.gpioControl.wave_add_new()
+        self.gpioControl.wave_add_generic(pulses)
+        waveId = self.gpioControl.wave_create()
+        return waveId, duration / 1000000.0, len(pulses)
+
+    def segmentWave(self, key, frequencies):
+        """ returns the id and duration of the waveform of key, it is created if not cached """
+        entry = self.cache.get(key)
+        if (entry == None):
+            entry = self.cache.add(key, *self.createWave(list(frequencies)))
+        self.cache.pin(self, entry[0])
+        self.waves.append(entry[0])
+        if (key[0] == "cruise"):
+            self.waveFrequencies[entry[0]] = key[-1]
+        else:
+            self.waveFrequencies[entry[0]] = self.startFreq
+        return entry[0], entry[1]
+
+    def compile(self, key, steps, targetFreq, ramp):
+        """ builds the wave_chain of a movement, returns the chain, its duration and ramp down key """
+        rampFreqs = []
+        if (ramp):
+            rampFreqs = self.rampFrequencies(targetFreq, steps)
+        cruiseSteps = steps - 2 * len(rampFreqs)
+        rampKey = (self.stepMask, key[0], self.startFreq, targetFreq, self.acceleration, len(rampFreqs))
+
+        chain = []
+        duration = 0
+        keys = []
+        decelKey = None
+        if (len(rampFreqs) > 0):
+            keys.append(("ramp up",) + rampKey)
+            accelWave, accelDuration = self.segmentWave(keys[-1], rampFreqs)
+            chain.append(accelWave)
+            duration = duration + accelDuration
+        if (cruiseSteps > 0):
+            keys.append(("cruise", self.stepMask, key[0], targetFreq))
+            cruiseWave, cruiseDuration = self.segmentWave(keys[-1], [targetFreq])
+            chain = chain + self.loopChain(cruiseWave, cruiseSteps)
+            duration = duration + cruiseDuration * cruiseSteps
+        if (len(rampFreqs) > 0):
+            decelKey = ("ramp down",) + rampKey
+            keys.append(decelKey)
+            decelWave, decelDuration = self.segmentWave(decelKey, reversed(rampFreqs))
+            chain.append(decelWave)
+            duration = duration + decelDuration
+
+        return chain, duration, decelKey, keys
+
+    def compileContinuous(self, targetFreq, ramp, microstepCfg):
+        """ builds the waveforms of a continuous movement, returns the ramp up (None if no ramp) and cruise waveforms """
+        rampFreqs = []
+        if (ramp):
+            rampFreqs = self.rampFrequencies(targetFreq)
+        rampKey = (self.stepMask, microstepCfg, self.startFreq, targetFreq, self.acceleration, len(rampFreqs))
+        cruiseWave, cruiseDuration = self.segmentWave(("cruise", self.stepMask, microstepCfg, targetFreq), [targetFreq])
+        accelWave = None
+        if (len(rampFreqs) > 0):
+            accelWave, accelDuration = self.segmentWave(("ramp up",) + rampKey, rampFreqs)
+            #
+            # built in advance, the ramp down can not be created while stopping
+            self.decelWave, self.decelDuration = self.segmentWave(("ramp down",) + rampKey, reversed(rampFreqs))
+        return accelWave, cruiseWave
+
+    def flush(self):
+        """ deletes all the waveforms
+
+        deleted waveforms are only reused by pigpio when all the waveforms with higher ids
+        are deleted, the resources can be fragmented. If pigpio can not create a waveform
+        we start again from an empty cache """
+        self.cache.clear()
+        self.chains = OrderedDict()
+        self.waves = []
+        self.waveFrequencies = {}
+        self.decelWave = None
+        self.decelDuration = 0
+        self.decelKey = None
+
+    def loopChain(self, waveId, count):
+        """ wave_chain entries to send waveId count times """
+        chain = []
+        outer, inner = divmod(count, self.MAX_LOOP_COUNT)
+        if (outer > 0):
+            chain = chain + [255, 0, 255, 0, waveId, 255, 1, self.MAX_LOOP_COUNT & 0xFF, self.MAX_LOOP_COUNT >> 8, 255, 1, outer & 0xFF, outer >> 8]
+        if (inner > 0):
+            chain = chain + [255, 0, waveId, 255, 1, inner & 0xFF, inner >> 8]
+        return chain
+
+    def release(self):
+        """ stops sending and unpins the waveforms of the previous movement """
+        if (self.isBusy()):
+            self.gpioControl.wave_tx_stop()
+        self.cache.unpin(self)
+        self.waves = []
+        self.waveFrequencies = {}
+        self.decelWave = None
+        self.decelDuration = 0
+        self.decelKey = None
+
+    def move(self, steps, targetFreq, ramp = True, microstepCfg = None):
+        """ emits exactly steps steps at targetFreq, returns the duration in seconds """
+        self.release()
+        self.continuous = False
+
+        key = (microstepCfg, self.startFreq, targetFreq, self.acceleration, steps, ramp)
+        compiled = self.chains.get(key)
+        if (compiled != None and self.cache.contains(compiled[3])):
+            self.chains.move_to_end(key)
+            chain, duration, decelKey, keys = compiled
+            for waveKey in keys:
+                self.segmentWave(waveKey, [])
+        else:
+            try:
+                chain, duration, decelKey, keys = self.compile(key, steps, targetFreq, ramp)
+            except pigpio.error:
+                self.flush()
+                chain, duration, decelKey, keys = self.compile(key, steps, targetFreq, ramp)
+            self.chains[key] = (chain, duration, decelKey, keys)
+            if (len(self.chains) > self.MAX_CHAINS):
+                self.chains.popitem(last = False)
+        if (decelKey != None):
+            self.decelWave, self.decelDuration = self.cache.entries[decelKey][0:2]
+        self.decelKey = decelKey
+
+        if (len(chain) > 0):
+            self.gpioControl.wave_chain(chain)
+            self.cache.chainSender = self
+        self.moveStart = clock.time()
+        self.moveDuration = duration
+        return duration
+
+    def run(self, targetFreq, ramp = True, microstepCfg = None):
+        """ starts moving at targetFreq until stop is called """
+        self.release()
+        self.continuous = True
+
+        try:
+            accelWave, cruiseWave = self.compileContinuous(targetFreq, ramp, microstepCfg)
+        except pigpio.error:
+            self.flush()
+            accelWave, cruiseWave = self.compileContinuous(targetFreq, ramp, microstepCfg)
+
+        if (accelWave != None):
+            self.gpioControl.wave_send_using_mode(accelWave, pigpio.WAVE_MODE_ONE_SHOT)
+            self.gpioControl.wave_send_using_mode(cruiseWave, pigpio.WAVE_MODE_REPEAT_SYNC)
+        else:
+            self.gpioControl.wave_send_using_mode(cruiseWave, pigpio.WAVE_MODE_REPEAT)
+
+    def stop(self):
+        """ stops the current movement ramping down, returns the ramp down duration in seconds """
+        duration = 0
+        if (self.isBusy()):
+            if (self.decelWave == None):
+                self.gpioControl.wave_tx_stop()
+            elif (self.continuous):
+                #
+                # the ramp down starts when the current cruise step ends
+                self.gpioControl.wave_send_using_mode(self.decelWave, pigpio.WAVE_MODE_ONE_SHOT_SYNC)
+                duration = self.decelDuration
+            else:
+                duration = self.stopChain()
+        self.continuous = False
+        return duration
+
+    def stopChain(self):
+        """ stops the chain of a moveTo ramping down from the frequency it has reached,
+            returns the ramp down duration in seconds """
+        elapsed = clock.time() - self.moveStart
+        if (elapsed >= self.moveDuration - self.decelDuration):
+            #
+            # the chain is already ramping down
+            return max(0, self.moveDuration - elapsed)
+        #
+        # a chain can not be synchronized, the movement is interrupted
+        self.gpioControl.wave_tx_stop()
+        rampSteps = self.rampStepsSent(elapsed)
+        if (rampSteps == None):
+            #
+            # in the cruise, the whole ramp down
+            self.gpioControl.wave_send_using_mode(self.decelWave, pigpio.WAVE_MODE_ONE_SHOT)
+            return self.decelDuration
+        if (rampSteps == 0):
+            return 0
+        #
+        # in the ramp up, the ramp down of the steps already sent (the same waveform
+        # than the ramp down of a movement too short to reach the target frequency)
+        rampFreqs = self.rampFrequencies(self.decelKey[4])[0:rampSteps]
+        try:
+            decelWave, decelDuration = self.segmentWave(self.decelKey[:-1] + (rampSteps,), reversed(rampFreqs))
+        except (pigpio.error, ValueError):
+            #
+            # no room for the waveform, the motor is stopped at a low frequency
+            return 0
+        self.gpioControl.wave_send_using_mode(decelWave, pigpio.WAVE_MODE_ONE_SHOT)
+        return decelDuration
+
+    def rampStepsSent(self, elapsed):
+        """ steps of the ramp up of the current moveTo sent in elapsed seconds, None if the ramp up has ended """
+        rampFreqs = self.rampFrequencies(self.decelKey[4])[0:self.decelKey[-1]]
+        elapsedUs = elapsed * 1000000
+        sent = 0
+        for freq in rampFreqs:
+            elapsedUs = elapsedUs - int(round(1000000.0 / freq))
+            if (elapsedUs < 0):
+                return sent
+            sent = sent + 1
+        return None
+
+    def waitEnd(self, timeout):
+        """ waits until the current waveform is sent """
+        clock.sleep(timeout)
+        while (self.isBusy()):
+            clock.sleep(0.001)
+
+    def commandedFrequency(self):
+        """ step frequency this engine is sending, the lowest one of the ramp while ramping.
+            0 if the engine is not sending """
+        waveId = self.gpioControl.wave_tx_at()
+        if (waveId in self.waveFrequencies):
+            return self.waveFrequencies[waveId]
+        if (waveId == pigpio.WAVE_NOT_FOUND and self.cache.chainSender is self and len(self.waveFrequencies) > 0):
+            return min(self.waveFrequencies.values())
+        return 0
+
+    def isBusy(self):
+        """ True while a waveform is being sent """
+        return self.gpioControl.wave_tx_busy() == 1